@@ -0,0 +1,126 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Tuple, Optional, Dict, Union
+
+BENCHMARK_RUNS = 20
+
+# Comma-separated `name=limit` pairs overriding default regression thresholds of benchmarks
+THRESHOLDS_ENV = 'QEMU_RUNNER_BENCH_THRESHOLDS'
+# Multiplies all thresholds, e.g. for slow CI hosts; 0 disables checking
+THRESHOLD_SCALE_ENV = 'QEMU_RUNNER_BENCH_SCALE'
+
+
+@dataclass(frozen=True)
+class Timing:
+    best_ms: float
+    median_ms: float
+    peak_kib: Optional[float] = None
+
+    @classmethod
+    def from_samples(cls, samples: List[float], peak_bytes: Optional[int] = None) -> 'Timing':
+        return cls(
+            best_ms=min(samples) * 1000,
+            median_ms=statistics.median(samples) * 1000,
+            peak_kib=peak_bytes / 1024 if peak_bytes is not None else None
+        )
+
+
+def measure_peak_memory(func: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def measure_retained_memory(func: Callable[[], object]) -> int:
+    # Memory still held by result of func, unlike peak it excludes temporaries freed before returning
+    tracemalloc.start()
+    try:
+        result = func()
+        retained, _ = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+
+    return retained
+
+
+def measure(func: Callable[[], object], runs: int = BENCHMARK_RUNS, memory: bool = False) -> Timing:
+    func()  # warm up OS caches
+
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    # Tracing slows allocations down, so memory is measured in separate run
+    return Timing.from_samples(samples, measure_peak_memory(func) if memory else None)
+
+
+def load_thresholds(defaults: Dict[str, float]) -> Dict[str, float]:
+    result = dict(defaults)
+
+    for item in os.environ.get(THRESHOLDS_ENV, '').split(','):
+        if item.strip() == '':
+            continue
+
+        name, _, value = item.partition('=')
+        if name.strip() not in result:
+            raise ValueError(f'Unknown benchmark threshold {name.strip()!r}, known: {", ".join(sorted(result))}')
+        result[name.strip()] = float(value)
+
+    scale = float(os.environ.get(THRESHOLD_SCALE_ENV, '1'))
+    return {name: limit * scale for name, limit in result.items()}
+
+
+def run_make_runner(*args: Union[str, os.PathLike], cwd: Optional[os.PathLike] = None) -> None:
+    subprocess.run([sys.executable, '-m', 'qemu_runner.make_runner', *map(str, args)], cwd=cwd, check=True)
+
+
+def measure_imports(args: List[str], cwd: Path) -> Dict[str, int]:
+    # Self time of each module imported by `python -X importtime args...`, in microseconds
+    cp = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        encoding='utf-8',
+        env={**os.environ, 'QEMU_DEV': 'my-qemu'},
+        check=True
+    )
+
+    modules = {}
+    for line in cp.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_us, _, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(self_us)
+
+    return modules
+
+
+def format_report(title: str, rows: List[Tuple[str, Timing]]) -> str:
+    width = max(len(name) for name, _ in rows)
+    with_memory = any(timing.peak_kib is not None for _, timing in rows)
+
+    header = f'{"":{width}}  {"best [ms]":>10}  {"median [ms]":>12}'
+    lines = [title, header + (f'  {"peak [KiB]":>11}' if with_memory else '')]
+    for name, timing in rows:
+        line = f'{name:{width}}  {timing.best_ms:10.1f}  {timing.median_ms:12.1f}'
+        if with_memory:
+            line += f'  {timing.peak_kib:11.0f}' if timing.peak_kib is not None else f'  {"":11}'
+        lines.append(line)
+
+    return '\n'.join(lines)
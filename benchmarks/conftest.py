@@ -0,0 +1,15 @@
+from typing import Callable, List, Tuple
+
+import pytest
+
+from .bench_utilities import Timing, format_report
+
+
+@pytest.fixture()
+def report(capsys) -> Callable[[str, List[Tuple[str, Timing]]], None]:
+    def do_report(title: str, rows: List[Tuple[str, Timing]]) -> None:
+        with capsys.disabled():
+            print()
+            print(format_report(title, rows))
+
+    return do_report
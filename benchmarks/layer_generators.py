@@ -0,0 +1,38 @@
+from typing import Dict, List
+
+DEVICE_KINDS = ['virtio-blk-device', 'virtio-net-device', 'pl011', 'virtio-rng-device']
+
+
+def generate_layer(sections: int, attributes: int = 3, variables: int = 0, engine: str = 'qemu-system-arm') -> str:
+    lines = ['[general]', f'engine = {engine}', 'memory = 128M', '']
+
+    for i in range(sections):
+        lines.append(f'[device:dev{i}]')
+        lines.append(f'@ = {DEVICE_KINDS[i % len(DEVICE_KINDS)]}')
+        for a in range(attributes):
+            if variables:
+                lines.append(f'attr{a} = ${{VAR{(i * attributes + a) % variables}}}/value{a}')
+            else:
+                lines.append(f'attr{a} = value{a}')
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
+def generate_derive_chain(depth: int, sections: int, overrides: int = 10) -> List[str]:
+    # Each derived layer changes few sections of base and adds few of its own, as runners derived in practice do
+    layers = [generate_layer(sections)]
+
+    for level in range(1, depth + 1):
+        lines = ['[general]', f'memory = {128 * (level + 1)}M', '']
+        for i in range(min(overrides, sections)):
+            lines += [f'[device:dev{(i * 7919 + level) % sections}]', f'attr0 = level{level}', '']
+        for i in range(overrides):
+            lines += [f'[device:derived{level}_{i}]', '@ = pl011', '']
+        layers.append('\n'.join(lines))
+
+    return layers
+
+
+def generate_variables(count: int) -> Dict[str, str]:
+    return {f'VAR{i}': f'/path/to/variable/{i}' for i in range(count)}
@@ -0,0 +1,36 @@
+import asyncio
+import sys
+from pathlib import Path
+
+from qemu_runner.console import run_multiplexed
+
+from .bench_utilities import measure
+
+INSTANCES = 16
+LINES = 20000
+
+# Instance writes its lines in many small writes, as guest console does
+CHATTY_INSTANCE = '''
+import sys
+for i in range({lines}):
+    sys.stdout.write(f"boot message {{i}} from instance\\n")
+    sys.stdout.flush()
+'''
+
+
+def test_console_multiplexer(tmp_path: Path, report):
+    script = CHATTY_INSTANCE.format(lines=LINES)
+    commands = {f'vm{i}': [sys.executable, '-c', script] for i in range(INSTANCES)}
+
+    def run(instance_dir):
+        log = tmp_path / 'all.log'
+        if log.exists():
+            log.unlink()
+        asyncio.run(run_multiplexed(commands, log, instance_dir))
+
+    report(f'{INSTANCES} instances writing {LINES} lines each', [
+        ('aggregated log', measure(lambda: run(None), runs=3, memory=True)),
+        ('with instance files', measure(lambda: run(tmp_path / 'instances'), runs=3)),
+    ])
+
+    assert len((tmp_path / 'all.log').read_bytes().splitlines()) == INSTANCES * LINES
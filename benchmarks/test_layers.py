@@ -0,0 +1,166 @@
+import os
+from configparser import ConfigParser
+from dataclasses import replace
+from functools import reduce
+from typing import Dict, List
+
+import pytest
+
+from qemu_runner.argument import Argument, build_command_line_for_argument
+from qemu_runner.layer import Layer, parse_layer, build_command_line
+from qemu_runner.layer_binary import dump_layer_binary, load_layer_binary
+from qemu_runner.layer_parser import parse_layer_text
+from qemu_runner.variable_resolution import make_resolver_from_dict
+
+from .bench_utilities import BENCHMARK_RUNS, Timing, measure, measure_retained_memory, load_thresholds, THRESHOLD_SCALE_ENV
+from .layer_generators import generate_layer, generate_derive_chain, generate_variables
+
+LAYER_SIZES = [10, 1000, 50000]
+DERIVE_DEPTHS = [1, 10, 50]
+VARIABLE_COUNTS = [10, 100, 1000]
+
+VARIABLES_LAYER_SIZE = 1000
+
+ARGUMENT_COUNT = 10000
+
+SHARED_BASE_SIZE = 1000
+SHARED_VARIANTS = 500
+
+# Best time in microseconds and peak memory in bytes per section (per resolved value for `resolve`)
+DEFAULT_THRESHOLDS = {
+    'read.time': 500,
+    'read.memory': 20000,
+    'parse.time': 150,
+    'parse.memory': 4000,
+    'parse_text.time': 50,
+    'parse_text.memory': 4000,
+    'load_binary.time': 20,
+    'load_binary.memory': 4000,
+    'apply.time': 10,
+    'apply.memory': 1000,
+    'render.time': 5,
+    'render.memory': 2000,
+    'resolve.time': 500,
+    'resolve.memory': 2000,
+    'construct.time': 20,
+    'construct.memory': 400,
+    'render_argument.time': 2,
+    'render_argument.memory': 1000,
+}
+
+# Bytes retained by each of many layers derived from single base layer, as held by long-lived zygote or API user
+VARIANT_MEMORY_THRESHOLD = 8000
+
+# Fixed cost of each stage is spread over at least this many items, so small layers are not judged by it
+MINIMAL_ITEMS = 100
+
+
+def runs_for(items: int) -> int:
+    return max(3, min(BENCHMARK_RUNS, 20000 // items))
+
+
+def read_layer(text: str) -> ConfigParser:
+    parser = ConfigParser()
+    parser.read_string(text)
+    return parser
+
+
+def check_thresholds(stage: str, timing: Timing, items: int) -> None:
+    thresholds = load_thresholds(DEFAULT_THRESHOLDS)
+    items = max(items, MINIMAL_ITEMS)
+
+    time_limit = thresholds[f'{stage}.time']
+    if time_limit:
+        assert timing.best_ms * 1000 / items <= time_limit, \
+            f'{stage}: {timing.best_ms * 1000 / items:.1f} us per item exceeds threshold of {time_limit:.1f} us'
+
+    memory_limit = thresholds[f'{stage}.memory']
+    if memory_limit and timing.peak_kib is not None:
+        assert timing.peak_kib * 1024 / items <= memory_limit, \
+            f'{stage}: {timing.peak_kib * 1024 / items:.0f} B per item exceeds threshold of {memory_limit:.0f} B'
+
+
+def run_stages(stages: Dict[str, callable], items: int, report, title: str) -> None:
+    rows = [(stage, measure(func, runs_for(items), memory=True)) for stage, func in stages.items()]
+    report(title, rows)
+
+    for stage, timing in rows:
+        check_thresholds(stage, timing, items)
+
+
+@pytest.mark.parametrize('sections', LAYER_SIZES)
+def test_layer_stages(sections: int, report):
+    text = generate_layer(sections)
+    parser = read_layer(text)
+    layer = parse_layer(parser)
+    binary = dump_layer_binary(layer)
+
+    run_stages({
+        'read': lambda: read_layer(text),
+        'parse': lambda: parse_layer(parser),
+        'parse_text': lambda: parse_layer_text(text),
+        'load_binary': lambda: load_layer_binary(binary),
+        'render': lambda: build_command_line(layer),
+    }, sections, report, f'Layer with {sections} sections')
+
+
+@pytest.mark.parametrize('depth', DERIVE_DEPTHS)
+@pytest.mark.parametrize('sections', LAYER_SIZES)
+def test_derive_chain(depth: int, sections: int, report):
+    layers: List[Layer] = [parse_layer_text(text) for text in generate_derive_chain(depth, sections)]
+    combined = reduce(Layer.apply, layers, Layer())
+
+    run_stages({
+        'apply': lambda: reduce(Layer.apply, layers, Layer()),
+    }, len(combined.arguments) * depth, report, f'Derive chain {depth} deep over {sections} sections')
+
+
+@pytest.mark.parametrize('variables', VARIABLE_COUNTS)
+def test_variable_resolution(variables: int, report):
+    attributes = 3
+    layer = parse_layer_text(generate_layer(VARIABLES_LAYER_SIZE, attributes, variables))
+    variable_values = generate_variables(variables)
+
+    def render():
+        command_line = build_command_line(layer, variable_resolver=make_resolver_from_dict(variable_values))
+        assert '${' not in ' '.join(command_line)
+
+    run_stages({
+        'resolve': render,
+    }, VARIABLES_LAYER_SIZE * attributes, report, f'{VARIABLES_LAYER_SIZE} sections with {variables} variables')
+
+
+def test_arguments(report):
+    arguments = list(parse_layer_text(generate_layer(ARGUMENT_COUNT)).arguments)
+    raw = [(arg.name, dict(arg.attributes.pairs)) for arg in arguments]
+
+    run_stages({
+        'construct': lambda: [Argument(name, None, attributes) for name, attributes in raw],
+        'render_argument': lambda: [build_command_line_for_argument(arg) for arg in arguments],
+    }, ARGUMENT_COUNT, report, f'{ARGUMENT_COUNT} arguments')
+
+
+def test_shared_variants(report):
+    base = parse_layer_text(generate_layer(SHARED_BASE_SIZE))
+    additions = [parse_layer_text(text) for text in generate_derive_chain(SHARED_VARIANTS, SHARED_BASE_SIZE, 5)[1:]]
+    base.apply(additions[0])  # build index of base outside of measurement, it is shared by all variants
+
+    def build_shared():
+        return [base.apply(addition) for addition in additions]
+
+    def build_flat():
+        return [Layer(base.general, list(base.apply(addition).arguments)) for addition in additions]
+
+    shared = measure_retained_memory(build_shared)
+    flat = measure_retained_memory(build_flat)
+
+    # Memory column shows memory retained by all variants, not peak
+    report(f'{SHARED_VARIANTS} variants of layer with {SHARED_BASE_SIZE} sections (retained memory)', [
+        ('shared', replace(measure(build_shared, runs_for(SHARED_VARIANTS)), peak_kib=shared / 1024)),
+        ('flat copies', replace(measure(build_flat, runs_for(SHARED_VARIANTS)), peak_kib=flat / 1024)),
+    ])
+
+    limit = VARIANT_MEMORY_THRESHOLD * float(os.environ.get(THRESHOLD_SCALE_ENV, '1'))
+    if limit:
+        assert shared / SHARED_VARIANTS <= limit, \
+            f'{shared / SHARED_VARIANTS:.0f} B per variant exceeds threshold of {limit:.0f} B'
@@ -0,0 +1,14 @@
+from pathlib import Path
+
+from qemu_runner.make_runner.bench import run_benchmarks, format_results
+
+from .bench_utilities import BENCHMARK_RUNS
+
+
+def test_runner_overhead(tmp_path: Path, capsys):
+    results = run_benchmarks(tmp_path, runs=BENCHMARK_RUNS)
+
+    with capsys.disabled():
+        print()
+        print('Runner overhead')
+        print(format_results(results))
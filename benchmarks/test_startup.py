@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from .bench_utilities import Timing, measure, measure_imports, run_make_runner, THRESHOLD_SCALE_ENV
+
+TEST_LAYER = """
+[general]
+engine = qemu-system-arm
+
+[machine]
+@ = virt
+"""
+
+ISOLATION_FLAGS = '-S -E -I'
+
+# Best time of imports done by runner on --dry-run, modules imported by bare interpreter are not counted
+IMPORT_TIME_THRESHOLD_MS = 150
+IMPORT_TIME_RUNS = 5
+
+
+@pytest.fixture()
+def runner(tmp_path: Path) -> Path:
+    (tmp_path / 'layer.ini').write_text(TEST_LAYER)
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz',
+                    '--interpreter', sys.executable, f'--interpreter-flags={ISOLATION_FLAGS}', cwd=tmp_path)
+    return tmp_path / 'runner.pyz'
+
+
+@pytest.fixture()
+def extract_once_runner(tmp_path: Path) -> Path:
+    (tmp_path / 'layer.ini').write_text(TEST_LAYER)
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'extract_once.pyz', '--extract-once', cwd=tmp_path)
+    return tmp_path / 'extract_once.pyz'
+
+
+def startup_modes(runner: Path, extract_once_runner: Path) -> List[List[str]]:
+    modes = [
+        [sys.executable, str(runner)],
+        [sys.executable, *ISOLATION_FLAGS.split(), str(runner)],
+        [sys.executable, str(extract_once_runner)],
+    ]
+
+    if sys.platform != 'win32':
+        modes.append([str(runner)])
+
+    return modes
+
+
+def test_runner_startup(tmp_path: Path, runner: Path, extract_once_runner: Path, report):
+    env = {**os.environ, 'QEMU_DEV': 'my-qemu', 'QEMU_RUNNER_EXTRACT_DIR': str(tmp_path / 'extracted')}
+
+    def run(command_line: List[str]):
+        return lambda: subprocess.run([*command_line, '--dry-run', 'kernel.elf'], cwd=tmp_path, env=env,
+                                      stdout=subprocess.DEVNULL, check=True)
+
+    rows = []
+    for command_line in startup_modes(runner, extract_once_runner):
+        name = ' '.join(os.path.basename(arg) if os.path.isabs(arg) else arg for arg in command_line)
+        rows.append((name, measure(run(command_line))))
+
+    report('Runner startup (--dry-run)', rows)
+
+
+def test_dry_run_import_time(tmp_path: Path, runner: Path, report):
+    interpreter_modules = measure_imports(['-c', 'pass'], tmp_path)
+
+    def runner_import_time() -> float:
+        modules = measure_imports([str(runner), '--dry-run', 'kernel.elf'], tmp_path)
+        return sum(t for name, t in modules.items() if name not in interpreter_modules) / 1000000
+
+    timing = Timing.from_samples([runner_import_time() for _ in range(IMPORT_TIME_RUNS)])
+    report('Runner imports (--dry-run, -X importtime)', [('imports', timing)])
+
+    limit = IMPORT_TIME_THRESHOLD_MS * float(os.environ.get(THRESHOLD_SCALE_ENV, '1'))
+    if limit:
+        assert timing.best_ms <= limit, f'Imports took {timing.best_ms:.1f} ms, exceeds threshold of {limit:.1f} ms'
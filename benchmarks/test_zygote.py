@@ -0,0 +1,55 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from qemu_runner import Runner, RunFlags
+from qemu_runner.layer import Layer, GeneralSettings
+
+from .bench_utilities import measure, run_make_runner
+
+if sys.platform != 'win32':
+    from qemu_runner.zygote import ZygoteServer, launch_via_zygote
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='Zygote requires Unix sockets')
+
+# Trivial executable stands in for QEMU, so measurement shows launch overhead only
+NOOP_QEMU = shutil.which('true') or '/bin/true'
+
+
+def test_zygote_launch_latency(tmp_path: Path, report):
+    (tmp_path / 'layer.ini').write_text('[general]\nengine = qemu-system-arm\n')
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    env = {**os.environ, 'QEMU_DEV': NOOP_QEMU}
+    runner = Runner(Layer(GeneralSettings(engine='qemu-system-arm')))
+    flags = RunFlags(qemu=NOOP_QEMU)
+    socket_path = str(tmp_path / 'zygote.sock')
+
+    def run_runner():
+        subprocess.run([sys.executable, str(tmp_path / 'runner.pyz'), 'kernel.elf'], env=env, check=True)
+
+    def run_direct():
+        subprocess.run(runner.compile('kernel.elf', flags=flags), check=True)
+
+    def run_zygote():
+        assert launch_via_zygote(socket_path, 'kernel.elf', flags=flags) == 0
+
+    with ZygoteServer(socket_path, runner) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            rows = [
+                ('runner.pyz per launch', measure(run_runner)),
+                ('zygote launch', measure(run_zygote)),
+                ('direct fork+exec', measure(run_direct)),
+            ]
+        finally:
+            server.shutdown()
+            thread.join()
+
+    report('Sequential launches', rows)
@@ -1,5 +1,30 @@
+from typing import Any
+
+# find_qemu is lightweight and must be bound eagerly, as submodule of the same name would shadow it
 from .find_qemu import find_qemu
 
 __all__ = [
     'find_qemu',
+    'Runner',
+    'RunFlags',
 ]
+
+# Remaining public names are imported on first use, so runner startup pays only for what it actually needs
+_LAZY_ATTRIBUTES = {
+    'Runner': 'api',
+    'RunFlags': 'api',
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    from importlib import import_module
+    value = getattr(import_module(f'.{_LAZY_ATTRIBUTES[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
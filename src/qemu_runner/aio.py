@@ -0,0 +1,140 @@
+import asyncio
+import subprocess
+from typing import List, Optional, Sequence, Any
+
+from .api import Runner, RunFlags
+
+__all__ = [
+    'QemuProcess',
+    'Launcher',
+    'launch',
+]
+
+DEFAULT_TERMINATE_GRACE = 5.0
+
+
+class QemuProcess:
+    def __init__(self, process: asyncio.subprocess.Process, command_line: List[str]):
+        self._process = process
+        self._command_line = command_line
+        self._exit = asyncio.ensure_future(process.wait())
+
+    @property
+    def command_line(self) -> List[str]:
+        return self._command_line
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.returncode
+
+    @property
+    def stdin(self) -> Optional[asyncio.StreamWriter]:
+        return self._process.stdin
+
+    @property
+    def stdout(self) -> Optional[asyncio.StreamReader]:
+        return self._process.stdout
+
+    @property
+    def stderr(self) -> Optional[asyncio.StreamReader]:
+        return self._process.stderr
+
+    @property
+    def exited(self) -> 'asyncio.Future[int]':
+        return self._exit
+
+    def terminate(self) -> None:
+        if self._process.returncode is None:
+            self._process.terminate()
+
+    def kill(self) -> None:
+        if self._process.returncode is None:
+            self._process.kill()
+
+    async def cancel(self, grace: float = DEFAULT_TERMINATE_GRACE) -> int:
+        self.terminate()
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._exit), grace)
+        except asyncio.TimeoutError:
+            self.kill()
+            return await self._exit
+
+    async def wait(self, timeout: Optional[float] = None) -> int:
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._exit), timeout)
+        except asyncio.TimeoutError:
+            await self.cancel()
+            raise
+        except asyncio.CancelledError:
+            self.kill()
+            raise
+
+    async def __aenter__(self) -> 'QemuProcess':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._process.returncode is None:
+            await self.cancel()
+
+
+class Launcher:
+    def __init__(self, runner: Runner, max_concurrency: Optional[int] = None):
+        self._runner = runner
+        self._max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def runner(self) -> Runner:
+        return self._runner
+
+    def _get_semaphore(self) -> Optional[asyncio.Semaphore]:
+        # Created lazily so the semaphore belongs to the loop that is actually running launches
+        if self._max_concurrency is not None and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        return self._semaphore
+
+    async def launch(self,
+                     kernel: Optional[str] = None,
+                     args: Sequence[str] = (),
+                     flags: RunFlags = RunFlags(),
+                     *,
+                     stdin: Any = subprocess.DEVNULL,
+                     stdout: Any = subprocess.PIPE,
+                     stderr: Any = subprocess.PIPE,
+                     **kwargs) -> QemuProcess:
+        command_line = self._runner.compile(kernel, args, flags)
+
+        semaphore = self._get_semaphore()
+        if semaphore is None:
+            return await launch(command_line, stdin=stdin, stdout=stdout, stderr=stderr, **kwargs)
+
+        await semaphore.acquire()
+        try:
+            process = await launch(command_line, stdin=stdin, stdout=stdout, stderr=stderr, **kwargs)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        process.exited.add_done_callback(lambda _: semaphore.release())
+        return process
+
+
+async def launch(command_line: Sequence[str],
+                 *,
+                 stdin: Any = subprocess.DEVNULL,
+                 stdout: Any = subprocess.PIPE,
+                 stderr: Any = subprocess.PIPE,
+                 **kwargs) -> QemuProcess:
+    process = await asyncio.create_subprocess_exec(
+        *command_line,
+        stdin=stdin,
+        stdout=stdout,
+        stderr=stderr,
+        **kwargs
+    )
+    return QemuProcess(process, list(command_line))
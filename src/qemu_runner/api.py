@@ -0,0 +1,180 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Dict, Tuple, Iterable, Any, Union, TYPE_CHECKING
+
+from .find_qemu import find_qemu
+from .layer import Layer, GeneralSettings, build_command_line
+from .layer_locator import COMBINED_LAYER_NAME, COMBINED_BINARY_LAYER_NAME
+from .profile import ProfileError
+
+if TYPE_CHECKING:
+    import zipfile
+    from pathlib import Path
+
+__all__ = [
+    'RunFlags',
+    'Runner',
+    'make_invocation_layer',
+]
+
+Invocation = Tuple[Optional[str], Sequence[str]]
+
+
+@dataclass(frozen=True)
+class RunFlags:
+    halted: bool = False
+    debug: bool = False
+    debug_listen: Optional[str] = None
+    qemu: Optional[str] = None
+    qemu_dir: Optional[str] = None
+    qemu_args: Sequence[str] = ()
+
+
+def make_invocation_layer(kernel: Optional[str], arguments: Sequence[str], flags: RunFlags) -> Layer:
+    general = GeneralSettings(
+        kernel=kernel,
+        kernel_cmdline=' '.join(arguments),
+        gdb=flags.debug,
+        gdb_dev=flags.debug_listen,
+        halted=flags.halted,
+    )
+    return Layer(general=general)
+
+
+def _read_runner_settings(main_source: str) -> Dict[str, Any]:
+    import ast
+
+    settings = {}
+    for node in ast.parse(main_source).body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                settings[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                continue
+
+    return settings
+
+
+def _combine_layer_texts(layer_contents: Sequence[str]) -> Layer:
+    from .layer_parser import parse_layer_text
+    combined_layer = Layer()
+
+    for layer_content in layer_contents:
+        combined_layer = combined_layer.apply(parse_layer_text(layer_content))
+
+    return combined_layer
+
+
+def _read_binary_layer(archive: 'zipfile.ZipFile', name: str) -> Optional[Layer]:
+    from .layer_binary import load_layer_binary, LayerFormatError
+
+    try:
+        return load_layer_binary(archive.read(name))
+    except (KeyError, LayerFormatError):
+        return None
+
+
+class Runner:
+    def __init__(self,
+                 layer: Layer,
+                 *,
+                 script_paths: Sequence[str] = (),
+                 search_paths: Sequence[str] = (),
+                 runner_dir: Optional[str] = None):
+        self._layer = layer
+        self._runner_dir = runner_dir
+        self._script_paths = list(script_paths)
+        self._search_paths = list(search_paths)
+        self._qemu_cache: Dict[Tuple[str, Optional[str]], 'Path'] = {}
+
+    @classmethod
+    def from_layers(cls, layer_contents: Sequence[str], **kwargs) -> 'Runner':
+        return cls(_combine_layer_texts(layer_contents), **kwargs)
+
+    @classmethod
+    def open(cls, path: Union[str, os.PathLike], profile: Optional[str] = None) -> 'Runner':
+        import zipfile
+        path = os.path.abspath(path)
+
+        with zipfile.ZipFile(path, 'r') as archive:
+            settings = _read_runner_settings(archive.read('__main__.py').decode('utf-8'))
+            if profile is not None:
+                profiles = settings.get('PROFILES', {})
+                if profile not in profiles:
+                    raise ProfileError(f'Unknown profile {profile}, available profiles: {", ".join(profiles)}')
+                layer_dir = f'embedded_layers/layers/profiles/{profile}'
+            else:
+                layer_dir = 'embedded_layers/layers'
+
+            layer = _read_binary_layer(archive, f'{layer_dir}/{COMBINED_BINARY_LAYER_NAME}')
+            if layer is None:
+                if f'{layer_dir}/{COMBINED_LAYER_NAME}' in archive.namelist():
+                    layer_names = [COMBINED_LAYER_NAME]
+                else:
+                    # Runners made by older versions carry individual layers only
+                    layer_names = settings['EMBEDDED_LAYERS']
+
+                layer = _combine_layer_texts(
+                    [archive.read(f'{layer_dir}/{layer_name}').decode('utf-8') for layer_name in layer_names]
+                )
+
+        # Search QEMU exactly as runner itself would do, relative to location of runner.py in archive
+        runner_script = os.path.join(path, 'qemu_runner', 'make_runner', 'runner.py')
+
+        return cls(
+            layer,
+            script_paths=[runner_script, *settings['ADDITIONAL_SCRIPT_BASES']],
+            search_paths=settings['ADDITIONAL_SEARCH_PATHS'],
+            runner_dir=os.path.dirname(path)
+        )
+
+    @staticmethod
+    def list_profiles(path: Union[str, os.PathLike]) -> List[str]:
+        import zipfile
+
+        with zipfile.ZipFile(path, 'r') as archive:
+            settings = _read_runner_settings(archive.read('__main__.py').decode('utf-8'))
+
+        return list(settings.get('PROFILES', {}))
+
+    @property
+    def layer(self) -> Layer:
+        return self._layer
+
+    def find_qemu(self, engine: str, qemu_dir: Optional[str] = None) -> 'Path':
+        key = (engine, qemu_dir)
+        if key not in self._qemu_cache:
+            self._qemu_cache[key] = find_qemu(
+                engine=engine,
+                script_paths=self._script_paths,
+                search_paths=self._search_paths + ([qemu_dir] if qemu_dir else [])
+            )
+
+        return self._qemu_cache[key]
+
+    def effective_layer(self, kernel: Optional[str] = None, args: Sequence[str] = (),
+                        flags: RunFlags = RunFlags()) -> Layer:
+        if kernel is not None:
+            kernel = os.path.abspath(kernel)
+
+        return self._layer.apply(make_invocation_layer(kernel, args, flags))
+
+    def compile(self, kernel: Optional[str] = None, args: Sequence[str] = (),
+                flags: RunFlags = RunFlags()) -> List[str]:
+        def do_find_qemu(engine: str) -> Union[str, 'Path']:
+            if flags.qemu:
+                from pathlib import Path
+                return Path(flags.qemu)
+
+            return self.find_qemu(engine, flags.qemu_dir)
+
+        result = list(build_command_line(self.effective_layer(kernel, args, flags), find_qemu_func=do_find_qemu,
+                                         runner_dir=self._runner_dir))
+
+        if flags.qemu_args:
+            result = [result[0], *flags.qemu_args, *result[1:]]
+
+        return result
+
+    def compile_many(self, invocations: Iterable[Invocation], flags: RunFlags = RunFlags()) -> List[List[str]]:
+        return [self.compile(kernel, args, flags) for kernel, args in invocations]
@@ -1,18 +1,151 @@
-from dataclasses import dataclass, field, replace
-from typing import Union, Mapping, Optional, List
+import sys
+from dataclasses import dataclass, fields
+from typing import Union, Mapping, Optional, List, Iterator, Iterable, Dict, Tuple, Sequence, overload
 
 from .variable_resolution import VariableResolver, resolve_no_variables
 
 ArgumentValue = Union[int, str, None]
+ArgumentKey = Tuple[str, Optional[str]]
 
+# Only attribute values containing this are passed to variable resolver
+VARIABLE_MARKER = '${'
 
-@dataclass(frozen=True)
-class Argument:
+# Derived sequences deeper than this are flattened, keeping lookups and iteration cheap
+MAX_SEQUENCE_DEPTH = 32
+
+
+def _intern(key: str) -> str:
+    return sys.intern(key) if type(key) is str else key
+
+
+# Few distinct sets of attribute names are repeated across thousands of sections, each set is stored once. Tuples
+# cannot be weakly referenced, table is capped instead, sets seen after it is full are simply not shared.
+_ATTRIBUTE_KEYS: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+MAX_SHARED_ATTRIBUTE_KEYS = 4096
+
+
+class AttributeMap(Mapping[str, ArgumentValue]):
+    # Attributes of single argument are few, pair of tuples is smaller than dict and scanning it is as fast as hashing
+    __slots__ = ('_keys', '_values')
+
+    def __init__(self, values: Union[Mapping[str, ArgumentValue], Iterable[Tuple[str, ArgumentValue]]] = ()):
+        if isinstance(values, AttributeMap):
+            self._keys: Tuple[str, ...] = values._keys
+            self._values: Tuple[ArgumentValue, ...] = values._values
+            return
+
+        items = values.items() if isinstance(values, Mapping) else dict(values).items()
+        keys = tuple(_intern(key) for key, _ in items)
+        shared = _ATTRIBUTE_KEYS.get(keys)
+        if shared is None:
+            if len(_ATTRIBUTE_KEYS) < MAX_SHARED_ATTRIBUTE_KEYS:
+                _ATTRIBUTE_KEYS[keys] = keys
+            shared = keys
+        self._keys = shared
+        self._values = tuple(value for _, value in items)
+
+    def __getitem__(self, key: str) -> ArgumentValue:
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._keys
+
+    def get(self, key: str, default: ArgumentValue = None) -> ArgumentValue:
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            return default
+
+    @property
+    def pairs(self) -> Tuple[Tuple[str, ArgumentValue], ...]:
+        return tuple(zip(self._keys, self._values))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, AttributeMap):
+            if self._keys is other._keys:
+                return self._values == other._values
+            return dict(self.pairs) == dict(other.pairs)
+        if isinstance(other, Mapping):
+            return dict(self.pairs) == dict(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(frozenset(self.pairs))
+
+    def __repr__(self) -> str:
+        return repr(dict(self.pairs))
+
+    def __reduce__(self):
+        return AttributeMap, (self.pairs,)
+
+    def updated(self, new_values: Mapping[str, ArgumentValue]) -> 'AttributeMap':
+        if all(key in self and self[key] == value for key, value in new_values.items()):
+            # Nothing changes, keep sharing this map
+            return self
+
+        values = dict(self.pairs)
+        values.update(new_values)
+        return AttributeMap(values)
+
+
+EMPTY_ATTRIBUTES = AttributeMap()
+
+
+class _TemplateSlot:
+    # Render template cached by Argument is not a dataclass field, its slot comes from this base
+    __slots__ = ('_template',)
+
+
+def _getstate(self) -> List[object]:
+    return [getattr(self, f.name) for f in fields(self)]
+
+
+def _setstate(self, state: List[object]) -> None:
+    for f, value in zip(fields(self), state):
+        # Frozen instance cannot be restored with setattr
+        object.__setattr__(self, f.name, value)
+
+
+def _frozen_slotted_dataclass(cls):
+    if sys.version_info >= (3, 10):
+        return dataclass(frozen=True, slots=True)(cls)
+
+    # Fallback for Python 3.8 and 3.9, class is recreated with __slots__ as dataclass(slots=True) does
+    cls = dataclass(frozen=True)(cls)
+    field_names = tuple(f.name for f in fields(cls))
+    namespace = dict(cls.__dict__)
+    for name in field_names:
+        # Class attributes holding defaults would conflict with slots, defaults are kept by generated __init__
+        namespace.pop(name, None)
+    namespace.pop('__dict__', None)
+    namespace.pop('__weakref__', None)
+    namespace['__slots__'] = field_names
+    namespace['__getstate__'] = _getstate
+    namespace['__setstate__'] = _setstate
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@_frozen_slotted_dataclass
+class Argument(_TemplateSlot):
+    # Slotted and immutable, names and attribute keys are interned as they repeat across thousands of sections
     name: str
     value: ArgumentValue = None
-    attributes: Mapping[str, ArgumentValue] = field(default_factory=dict)
+    attributes: Mapping[str, ArgumentValue] = EMPTY_ATTRIBUTES
 
     def __post_init__(self):
+        object.__setattr__(self, 'name', _intern(self.name))
+        if not isinstance(self.attributes, AttributeMap):
+            object.__setattr__(self, 'attributes', AttributeMap(self.attributes))
+
         if 'id' in self.attributes:
             if self.id_value is None:
                 raise Exception("ID must not be None")  # TODO: more specific exception
@@ -25,51 +158,205 @@ class Argument:
         return self.attributes.get('id', None)
 
     def replace_value(self, new_value: ArgumentValue) -> 'Argument':
-        return replace(self, value=new_value)
+        return Argument(self.name, new_value, self.attributes)
 
     def update_arguments(self, new_values: Mapping[str, ArgumentValue]) -> 'Argument':
         if self.id_value is not None and self.id_value != new_values.get('id', None):
             raise Exception('Cannot change value of ID')  # TODO: more specific exception
 
-        updated_args = dict(self.attributes)
-        updated_args.update(new_values)
-        return replace(self, attributes=updated_args)
+        return Argument(self.name, self.value, self.attributes.updated(new_values))
 
     def remove_arguments(self, names: List[str]):
         if 'id' in names:
             raise Exception('Cannot remove assigned id')
-        updated = dict(self.attributes)
+        updated = dict(self.attributes.pairs)
         for n in names:
             del updated[n]
 
-        return replace(self, attributes=updated)
+        return Argument(self.name, self.value, updated)
+
+    @property
+    def template(self) -> 'RenderTemplate':
+        # Arguments are immutable, so template is compiled on first render and reused by every following one
+        try:
+            return self._template
+        except AttributeError:
+            template = RenderTemplate(self)
+            object.__setattr__(self, '_template', template)
+            return template
+
+    @property
+    def key(self) -> ArgumentKey:
+        return self.name, self.id_value
 
     def id_matches(self, other: 'Argument') -> bool:
-        return (self.name, self.id_value) == (other.name, other.id_value)
+        return self.key == other.key
 
 
-def build_command_line_for_argument(
-        argument: Argument,
-        variable_resolver: VariableResolver = resolve_no_variables) -> List[str]:
-    result = [f'-{argument.name}']
+class ArgumentSequence(Sequence[Argument]):
+    # Immutable sequence of arguments sharing structure with sequence it was derived from. Derived sequence keeps
+    # only arguments replaced (by absolute position) and appended, so many variants of one base cost only their changes.
+    __slots__ = ('_parent', '_replaced', '_appended', '_length', '_depth', '_positions')
+
+    def __init__(self, arguments: Iterable[Argument] = ()):
+        self._parent: Optional[ArgumentSequence] = None
+        self._replaced: Dict[int, Argument] = {}
+        self._appended: Tuple[Argument, ...] = tuple(arguments)
+        self._length = len(self._appended)
+        self._depth = 0
+        self._positions: Optional[Dict[ArgumentKey, int]] = None
+
+    def derive(self, replaced: Mapping[int, Argument], appended: Sequence[Argument]) -> 'ArgumentSequence':
+        if not replaced and not appended:
+            return self
+
+        if self._depth >= MAX_SEQUENCE_DEPTH:
+            flat = ArgumentSequence(self)
+            return flat.derive(replaced, appended)
+
+        result = ArgumentSequence(appended)
+        result._parent = self
+        result._replaced = dict(replaced)
+        result._length = self._length + len(result._appended)
+        result._depth = self._depth + 1
+        return result
+
+    def _chain(self) -> List['ArgumentSequence']:
+        chain = []
+        node = self
+        while node is not None:
+            chain.append(node)
+            node = node._parent
+        chain.reverse()
+        return chain
+
+    def __iter__(self) -> Iterator[Argument]:
+        chain = self._chain()
+        replaced: Dict[int, Argument] = {}
+        for node in chain:
+            replaced.update(node._replaced)
+
+        if not replaced:
+            for node in chain:
+                yield from node._appended
+            return
+
+        position = 0
+        for node in chain:
+            for arg in node._appended:
+                yield replaced.get(position, arg)
+                position += 1
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, index: int) -> Argument: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Argument]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('argument index out of range')
+
+        node = self
+        while True:
+            if index in node._replaced:
+                return node._replaced[index]
+
+            parent = node._parent
+            if parent is None:
+                return node._appended[index]
+            if index >= parent._length:
+                return node._appended[index - parent._length]
+            node = parent
+
+    def position(self, key: ArgumentKey) -> Optional[int]:
+        # First argument with given key, replacing arguments never changes their keys
+        for node in self._chain():
+            if node._positions is None:
+                offset = node._parent._length if node._parent is not None else 0
+                positions: Dict[ArgumentKey, int] = {}
+                for i, arg in enumerate(node._appended):
+                    positions.setdefault(arg.key, offset + i)
+                node._positions = positions
+
+            if key in node._positions:
+                return node._positions[key]
 
-    arg_value = []
-    if argument.value:
-        arg_value.append(argument.value)
+        return None
 
-    if argument.id_value is not None:
-        arg_value.append(f'id={argument.id_value}')
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
 
-    for k, v in argument.attributes.items():
-        if k == 'id':
-            continue
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
 
-        if v is None:
-            arg_value.append(k)
-        else:
-            arg_value.append(f'{k}={variable_resolver(v)}')
+    __hash__ = None
 
-    if arg_value:
-        result.append(','.join(arg_value))
+    def __repr__(self) -> str:
+        return repr(list(self))
 
-    return result
+
+class RenderTemplate:
+    # Command line of argument with constant parts joined ahead of time. Parts at odd positions are values
+    # referencing variables, only they are passed to resolver on render.
+    __slots__ = ('_option', '_parts')
+
+    def __init__(self, argument: Argument):
+        self._option = f'-{argument.name}'
+
+        values: List[Tuple[str, Optional[str]]] = []
+        if argument.value:
+            values.append((str(argument.value), None))
+
+        if argument.id_value is not None:
+            values.append((f'id={argument.id_value}', None))
+
+        for k, v in argument.attributes.pairs:
+            if k == 'id':
+                continue
+
+            if v is None:
+                values.append((k, None))
+            elif isinstance(v, str) and VARIABLE_MARKER in v:
+                values.append((f'{k}=', v))
+            else:
+                values.append((f'{k}={v}', None))
+
+        parts = ['']
+        for i, (constant, variable) in enumerate(values):
+            parts[-1] += (',' if i else '') + constant
+            if variable is not None:
+                parts += [variable, '']
+
+        self._parts: Tuple[str, ...] = tuple(parts) if values else ()
+
+    @property
+    def has_variables(self) -> bool:
+        return len(self._parts) > 1
+
+    def render(self, variable_resolver: VariableResolver = resolve_no_variables) -> List[str]:
+        if not self._parts:
+            return [self._option]
+
+        if len(self._parts) == 1:
+            return [self._option, self._parts[0]]
+
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = variable_resolver(parts[i])
+
+        return [self._option, ''.join(parts)]
+
+
+def build_command_line_for_argument(
+        argument: Argument,
+        variable_resolver: VariableResolver = resolve_no_variables) -> List[str]:
+    return argument.template.render(variable_resolver)
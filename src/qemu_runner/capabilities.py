@@ -0,0 +1,211 @@
+import difflib
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import List, Optional, FrozenSet, Iterable, Dict
+
+from .hashing import file_identity
+from .layer import Layer, Mode
+
+__all__ = [
+    'CapabilityError',
+    'QemuCapabilities',
+    'probe_capabilities',
+    'default_cache_directory',
+    'load_capabilities',
+    'check_layer',
+]
+
+PROBE_TIMEOUT = 30
+
+OPTION_PATTERN = re.compile(r'^-([A-Za-z0-9][\w-]*)', re.MULTILINE)
+DEVICE_PATTERN = re.compile(r'^name "([^"]+)"(?:.*, alias "([^"]+)")?', re.MULTILINE)
+# Some targets prefix each CPU model with architecture name, e.g. `x86 Broadwell`
+CPU_ARCH_PREFIXES = {'x86', 'PowerPC', 's390x', 'Sparc'}
+
+
+class CapabilityError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class QemuCapabilities:
+    version: str
+    options: FrozenSet[str]
+    machines: FrozenSet[str]
+    devices: FrozenSet[str]
+    cpus: FrozenSet[str]
+
+    def to_json(self) -> Dict[str, object]:
+        return {
+            'version': self.version,
+            'options': sorted(self.options),
+            'machines': sorted(self.machines),
+            'devices': sorted(self.devices),
+            'cpus': sorted(self.cpus),
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, List[str]]) -> 'QemuCapabilities':
+        return cls(
+            version=str(data['version']),
+            options=frozenset(data['options']),
+            machines=frozenset(data['machines']),
+            devices=frozenset(data['devices']),
+            cpus=frozenset(data['cpus']),
+        )
+
+
+def _run_probe(qemu_path: str, args: List[str]) -> str:
+    try:
+        cp = subprocess.run(
+            [qemu_path, *args],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding='utf-8',
+            errors='replace',
+            timeout=PROBE_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise CapabilityError(f'Cannot probe {qemu_path}: {e}')
+
+    # Not every engine knows every query (e.g. user-mode QEMU has no machines), treat as nothing reported
+    if cp.returncode != 0:
+        return ''
+
+    return cp.stdout
+
+
+def _parse_list(output: str) -> Iterable[str]:
+    for line in output.splitlines():
+        tokens = line.split()
+        if not tokens or line.rstrip().endswith(':'):
+            continue
+
+        if len(tokens) > 1 and tokens[0] in CPU_ARCH_PREFIXES:
+            yield tokens[1].strip("'")
+        else:
+            yield tokens[0]
+
+
+def _parse_cpus(output: str) -> Iterable[str]:
+    # Model list ends with first empty line, feature flags (x86) follow
+    listing = output.strip().split('\n\n', 1)[0]
+    return _parse_list(listing)
+
+
+def _parse_devices(output: str) -> Iterable[str]:
+    for name, alias in DEVICE_PATTERN.findall(output):
+        yield name
+        if alias:
+            yield alias
+
+
+def probe_capabilities(qemu_path: str) -> QemuCapabilities:
+    version = _run_probe(qemu_path, ['--version'])
+    if version == '':
+        raise CapabilityError(f'{qemu_path} does not report its version, is it QEMU?')
+
+    return QemuCapabilities(
+        version=version.splitlines()[0].strip(),
+        options=frozenset(OPTION_PATTERN.findall(_run_probe(qemu_path, ['-help']))),
+        machines=frozenset(_parse_list(_run_probe(qemu_path, ['-machine', 'help']))),
+        devices=frozenset(_parse_devices(_run_probe(qemu_path, ['-device', 'help']))),
+        cpus=frozenset(_parse_cpus(_run_probe(qemu_path, ['-cpu', 'help']))),
+    )
+
+
+def default_cache_directory() -> str:
+    if sys.platform == 'win32':
+        root = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+
+    return os.path.join(root, 'qemu-runner', 'capabilities')
+
+
+def _resolve_executable(qemu_path: str) -> str:
+    if os.path.isfile(qemu_path):
+        return qemu_path
+
+    found = shutil.which(qemu_path)
+    if found is None:
+        raise CapabilityError(f'Cannot probe {qemu_path}: executable not found')
+
+    return found
+
+
+def load_capabilities(qemu_path: str, cache_directory: Optional[str] = None) -> QemuCapabilities:
+    qemu_path = _resolve_executable(qemu_path)
+    if cache_directory is None:
+        cache_directory = default_cache_directory()
+
+    key = hashlib.sha256(repr(file_identity(qemu_path)).encode('utf-8')).hexdigest()
+    cache_file = os.path.join(cache_directory, f'{key}.json')
+
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return QemuCapabilities.from_json(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    capabilities = probe_capabilities(qemu_path)
+
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        fd, pending = tempfile.mkstemp(dir=cache_directory, prefix='.pending-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(capabilities.to_json(), f)
+        os.replace(pending, cache_file)
+    except OSError:
+        # Cache is an optimization only, probe again next time
+        pass
+
+    return capabilities
+
+
+def _unknown(kind: str, value: str, known: FrozenSet[str]) -> str:
+    message = f'Unknown {kind} \'{value}\''
+    suggestions = difflib.get_close_matches(value, sorted(known), n=3)
+    if suggestions:
+        message += f' (did you mean: {", ".join(suggestions)}?)'
+
+    return message
+
+
+def check_layer(layer: Layer, capabilities: QemuCapabilities) -> List[str]:
+    problems = []
+
+    def check_value(kind: str, value: object, known: FrozenSet[str]) -> None:
+        # Empty list means QEMU did not report anything, so nothing can be checked
+        if not known or not isinstance(value, str) or value == '' or '${' in value:
+            return
+
+        if value not in known and value != 'help':
+            problems.append(_unknown(kind, value, known))
+
+    check_value('CPU', layer.general.cpu, capabilities.cpus)
+
+    if layer.general.mode == Mode.User:
+        return problems
+
+    for argument in layer.arguments:
+        if capabilities.options and argument.name not in capabilities.options:
+            problems.append(_unknown('option', f'-{argument.name}', frozenset(f'-{o}' for o in capabilities.options)))
+            continue
+
+        if argument.name == 'machine':
+            check_value('machine', argument.value, capabilities.machines)
+        elif argument.name == 'device':
+            check_value('device', argument.value, capabilities.devices)
+        elif argument.name == 'cpu':
+            check_value('CPU', argument.value, capabilities.cpus)
+
+    return problems
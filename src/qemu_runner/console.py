@@ -0,0 +1,223 @@
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, BinaryIO, Dict, List, Mapping, Optional, Sequence, Tuple, TypeVar, Union
+
+from .aio import QemuProcess, launch
+
+__all__ = [
+    'ConsoleMultiplexer',
+    'run_multiplexed',
+]
+
+READ_SIZE = 64 * 1024
+# Longer lines are split, so partial line kept by reader never grows without limit
+MAX_LINE = 64 * 1024
+# Chunks (each at most READ_SIZE of output) waiting for writer, readers stop reading pipes when it is full
+DEFAULT_MAX_PENDING = 64
+UNSAFE_NAME_CHARACTERS = re.compile(r'[^A-Za-z0-9_.-]')
+
+_Chunk = Tuple[str, bytes, bytes]
+T = TypeVar('T')
+
+
+class _Timestamps:
+    def __init__(self):
+        self._second = -1
+        self._text = ''
+
+    def now(self) -> bytes:
+        # Formatting time is cached per second, bursts of lines need only milliseconds appended
+        current = time.time()
+        second = int(current)
+        if second != self._second:
+            self._second = second
+            self._text = time.strftime('%H:%M:%S', time.localtime(second))
+
+        return f'{self._text}.{int((current - second) * 1000):03d} '.encode('ascii')
+
+
+class ConsoleMultiplexer:
+    def __init__(self,
+                 output: Union[str, os.PathLike, BinaryIO],
+                 instance_dir: Union[str, os.PathLike, None] = None,
+                 *,
+                 timestamps: bool = True,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self._output_path = None if hasattr(output, 'write') else output
+        self._output: Optional[BinaryIO] = output if self._output_path is None else None
+        self._instance_dir = instance_dir
+        self._instance_files: Dict[str, BinaryIO] = {}
+        self._timestamps = _Timestamps() if timestamps else None
+        self._max_pending = max_pending
+        self._queue: Optional['asyncio.Queue[Optional[_Chunk]]'] = None
+        self._readers: List['asyncio.Task[None]'] = []
+        self._writer: Optional['asyncio.Task[None]'] = None
+
+    async def __aenter__(self) -> 'ConsoleMultiplexer':
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        if self._output_path is not None:
+            self._output = open(self._output_path, 'ab')
+        if self._instance_dir is not None:
+            os.makedirs(self._instance_dir, exist_ok=True)
+
+        self._queue = asyncio.Queue(self._max_pending)
+        self._writer = asyncio.ensure_future(self._write())
+        self._writer.add_done_callback(self._writer_done)
+
+    def attach(self, name: str, stream: asyncio.StreamReader, label: Optional[str] = None) -> 'asyncio.Task[None]':
+        # Output of single instance can come from several streams (stdout, stderr), all go to its instance file
+        reader = asyncio.ensure_future(self._read(name, label or name, stream))
+        self._readers.append(reader)
+        if self._writer is not None and self._writer.done():
+            reader.cancel()
+        return reader
+
+    def attach_process(self, name: str, process: QemuProcess) -> None:
+        if process.stdout is not None:
+            self.attach(name, process.stdout)
+        if process.stderr is not None:
+            self.attach(name, process.stderr, f'{name}:stderr')
+
+    async def wait_for(self, awaitable: Awaitable[T]) -> T:
+        # Readers are stopped when writer fails, processes filling pipes nobody reads would never exit,
+        # so waiting for them ends with writer's exception instead
+        task = asyncio.ensure_future(awaitable)
+        await asyncio.wait({task, self._writer}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            task.cancel()
+            await self._writer
+        return await task
+
+    async def close(self) -> None:
+        try:
+            await asyncio.gather(*self._readers)
+        finally:
+            if self._writer is not None:
+                writer, self._writer = self._writer, None
+                if not writer.done():
+                    await self._queue.put(None)
+                # Failure of writer (e.g. full disk) is raised here, also when readers were cancelled because of it
+                await writer
+
+            for f in self._instance_files.values():
+                f.close()
+            self._instance_files.clear()
+
+            if self._output_path is not None and self._output is not None:
+                self._output.close()
+                self._output = None
+            elif self._output is not None:
+                self._output.flush()
+
+    def _writer_done(self, writer: 'asyncio.Task[None]') -> None:
+        if writer.cancelled() or writer.exception() is None:
+            return
+
+        # Nobody empties queue anymore, readers waiting for space in it would block forever
+        for reader in self._readers:
+            reader.cancel()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def _prefix(self, label: str) -> bytes:
+        prefix = f'[{label}] '.encode('utf-8')
+        if self._timestamps is not None:
+            return self._timestamps.now() + prefix
+        return prefix
+
+    def _format(self, label: str, data: bytes) -> bytes:
+        prefix = self._prefix(label)
+        lines = data.split(b'\n')
+        if lines[-1] == b'':
+            lines.pop()
+        return b''.join(prefix + line + b'\n' for line in lines)
+
+    async def _read(self, name: str, label: str, stream: asyncio.StreamReader) -> None:
+        partial = b''
+
+        while True:
+            data = await stream.read(READ_SIZE)
+            if not data:
+                break
+
+            data = partial + data
+            end = data.rfind(b'\n') + 1
+            if end == 0 and len(data) >= MAX_LINE:
+                end = len(data)
+
+            partial = data[end:]
+            if end:
+                # Whole chunk is one queue item, bursts of short lines do not create item per line
+                await self._queue.put((name, self._format(label, data[:end]), data[:end]))
+
+        if partial:
+            await self._queue.put((name, self._format(label, partial), partial))
+
+    def _instance_file(self, name: str) -> BinaryIO:
+        f = self._instance_files.get(name)
+        if f is None:
+            path = os.path.join(self._instance_dir, f'{UNSAFE_NAME_CHARACTERS.sub("_", name)}.log')
+            f = open(path, 'ab')
+            self._instance_files[name] = f
+
+        return f
+
+    async def _write(self) -> None:
+        done = False
+
+        while not done:
+            chunk = await self._queue.get()
+            batch = [] if chunk is None else [chunk]
+            done = chunk is None
+
+            # Everything already waiting is written at once, bursts end in single write per file
+            while not done and not self._queue.empty():
+                chunk = self._queue.get_nowait()
+                if chunk is None:
+                    done = True
+                else:
+                    batch.append(chunk)
+
+            if not batch:
+                continue
+
+            self._output.write(b''.join(aggregated for _, aggregated, _ in batch))
+            self._output.flush()
+
+            if self._instance_dir is not None:
+                per_instance: Dict[str, List[bytes]] = {}
+                for name, _, raw in batch:
+                    per_instance.setdefault(name, []).append(raw)
+
+                for name, parts in per_instance.items():
+                    f = self._instance_file(name)
+                    f.write(b''.join(parts))
+                    f.flush()
+
+
+async def run_multiplexed(commands: Mapping[str, Sequence[str]],
+                          output: Union[str, os.PathLike, BinaryIO],
+                          instance_dir: Union[str, os.PathLike, None] = None,
+                          **kwargs) -> Dict[str, int]:
+    # Runs commands (e.g. runners) in parallel, with their output aggregated, returns their exit codes
+    async with ConsoleMultiplexer(output, instance_dir, **kwargs) as multiplexer:
+        processes: Dict[str, QemuProcess] = {}
+        try:
+            for name, command_line in commands.items():
+                processes[name] = await launch(command_line)
+                multiplexer.attach_process(name, processes[name])
+
+            returncodes = await multiplexer.wait_for(asyncio.gather(*(p.wait() for p in processes.values())))
+            return dict(zip(processes, returncodes))
+        except BaseException:
+            for process in processes.values():
+                await process.cancel()
+            raise
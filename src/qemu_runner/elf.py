@@ -0,0 +1,142 @@
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from typing import Optional, Union, Tuple, List
+
+__all__ = [
+    'ElfError',
+    'ElfInfo',
+    'ELF_MACHINES',
+    'read_elf_info',
+]
+
+ELF_MAGIC = b'\x7fELF'
+ELF_CLASSES = {1: 32, 2: 64}
+ELF_ENDIANNESS = {1: 'little', 2: 'big'}
+
+SHN_XINDEX = 0xffff
+
+# e_machine values of architectures supported by QEMU
+ELF_MACHINES = {
+    'sparc': 2,
+    '386': 3,
+    'm68k': 4,
+    'mips': 8,
+    'hppa': 15,
+    'ppc': 20,
+    'ppc64': 21,
+    's390': 22,
+    'arm': 40,
+    'sh': 42,
+    'sparc64': 43,
+    'tricore': 44,
+    'x86_64': 62,
+    'avr': 83,
+    'or1k': 92,
+    'xtensa': 94,
+    'nios2': 113,
+    'hexagon': 164,
+    'rx': 173,
+    'aarch64': 183,
+    'microblaze': 189,
+    'riscv': 243,
+    'loongarch': 258,
+}
+
+
+class ElfError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ElfInfo:
+    elf_class: int
+    endian: str
+    machine: int
+    marker: Optional[str] = None
+
+
+def _unpack(m: mmap.mmap, fmt: str, offset: int) -> Tuple[int, ...]:
+    if offset < 0 or offset + struct.calcsize(fmt) > len(m):
+        raise ElfError('File truncated')
+
+    return struct.unpack_from(fmt, m, offset)
+
+
+Section = Tuple[int, ...]
+
+
+def _read_section_headers(m: mmap.mmap, bits: int, prefix: str) -> Optional[Tuple[List[Section], int]]:
+    if bits == 32:
+        e_shoff, = _unpack(m, prefix + 'I', 0x20)
+        e_shentsize, e_shnum, e_shstrndx = _unpack(m, prefix + 'HHH', 0x2E)
+        # sh_name, sh_offset, sh_size, sh_link
+        section_fmt, fields = prefix + 'IIIIIIIIII', (0, 4, 5, 6)
+    else:
+        e_shoff, = _unpack(m, prefix + 'Q', 0x28)
+        e_shentsize, e_shnum, e_shstrndx = _unpack(m, prefix + 'HHH', 0x3A)
+        section_fmt, fields = prefix + 'IIQQQQIIQQ', (0, 4, 5, 6)
+
+    if e_shoff == 0:
+        return None
+
+    def section(index: int) -> Section:
+        values = _unpack(m, section_fmt, e_shoff + index * e_shentsize)
+        return tuple(values[f] for f in fields)
+
+    # Extended numbering, real values are kept in section 0
+    if e_shnum == 0:
+        e_shnum = section(0)[2]
+    if e_shstrndx == SHN_XINDEX:
+        e_shstrndx = section(0)[3]
+
+    return [section(i) for i in range(e_shnum)], e_shstrndx
+
+
+def _read_marker(m: mmap.mmap, bits: int, prefix: str, marker_section: str) -> Optional[str]:
+    headers = _read_section_headers(m, bits, prefix)
+    if headers is None:
+        return None
+
+    sections, shstrndx = headers
+    if shstrndx >= len(sections):
+        raise ElfError('Invalid section name table index')
+
+    _, names_offset, names_size, _ = sections[shstrndx]
+    wanted = marker_section.encode('ascii') + b'\0'
+
+    for name, offset, size, _ in sections:
+        name_start = names_offset + name
+        if name >= names_size or m[name_start:name_start + len(wanted)] != wanted:
+            continue
+
+        if offset + size > len(m):
+            raise ElfError(f'Section {marker_section} truncated')
+
+        return m[offset:offset + size].split(b'\0', 1)[0].decode('utf-8').strip()
+
+    return None
+
+
+def read_elf_info(path: Union[str, os.PathLike], marker_section: Optional[str] = None) -> Optional[ElfInfo]:
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 0x34:
+            return None
+
+        # Only pages with header and sections actually used are read, not whole (possibly huge) file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if m[:4] != ELF_MAGIC:
+                return None
+
+            bits = ELF_CLASSES.get(m[4])
+            endian = ELF_ENDIANNESS.get(m[5])
+            if bits is None or endian is None:
+                raise ElfError('Unknown ELF class or data encoding')
+
+            prefix = '<' if endian == 'little' else '>'
+            machine, = _unpack(m, prefix + 'H', 0x12)
+
+            marker = _read_marker(m, bits, prefix, marker_section) if marker_section else None
+
+    return ElfInfo(elf_class=bits, endian=endian, machine=machine, marker=marker)
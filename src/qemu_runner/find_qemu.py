@@ -1,14 +1,18 @@
 import os
 from os.path import dirname
-from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pathlib import Path
 
 
 def find_qemu(
         engine: str,
         script_paths: Optional[List[str]] = None,
         search_paths: Optional[List[str]] = None
-) -> Optional[Path]:
+) -> Optional['Path']:
+    from pathlib import Path
+
     def find_executable(base_path: Path) -> Optional[Path]:
         exts = os.environ.get('PATHEXT', '').split(os.path.pathsep)
         for e in exts:
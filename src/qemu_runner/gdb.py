@@ -0,0 +1,137 @@
+import asyncio
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+from typing import List, Optional, Tuple
+
+__all__ = [
+    'GdbError',
+    'DEFAULT_GDB_DEVICE',
+    'parse_gdb_endpoint',
+    'wait_for_gdbserver',
+    'run_with_gdbserver',
+]
+
+# Device used by QEMU for `-s`
+DEFAULT_GDB_DEVICE = 'tcp::1234'
+DEFAULT_READY_TIMEOUT = 30.0
+INITIAL_POLL_DELAY = 0.002
+MAX_POLL_DELAY = 0.1
+TERMINATE_GRACE = 5.0
+
+# Listening on all interfaces is reachable through loopback
+ANY_ADDRESS = ('', '0.0.0.0', '::')
+
+
+class GdbError(Exception):
+    pass
+
+
+def parse_gdb_endpoint(device: str) -> Tuple[str, int]:
+    # Only TCP devices (`tcp:[host]:port[,options]`) can be polled and attached to
+    kind, _, address = device.partition(':')
+    if kind != 'tcp':
+        raise GdbError(f'Cannot wait for gdbserver on {device}, only tcp:[host]:port devices are supported')
+
+    address = address.split(',', 1)[0]
+    host, _, port = address.rpartition(':')
+    host = host.strip('[]')
+
+    try:
+        return ('localhost' if host in ANY_ADDRESS else host), int(port)
+    except ValueError:
+        raise GdbError(f'Invalid gdbserver port in {device}')
+
+
+async def wait_for_gdbserver(host: str, port: int, timeout: float = DEFAULT_READY_TIMEOUT,
+                             process: Optional[asyncio.subprocess.Process] = None) -> None:
+    # Connection opened (and closed) by probe is seen by QEMU as any other debugger connecting
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = INITIAL_POLL_DELAY
+
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            pass
+        else:
+            writer.close()
+            await writer.wait_closed()
+            return
+
+        if process is not None and process.returncode is not None:
+            raise GdbError(f'QEMU exited with code {process.returncode} before gdbserver at {host}:{port} was ready')
+
+        if loop.time() >= deadline:
+            raise GdbError(f'gdbserver at {host}:{port} not ready after {timeout:g} seconds')
+
+        await asyncio.sleep(min(delay, max(0.0, deadline - loop.time())))
+        delay = min(delay * 2, MAX_POLL_DELAY)
+
+
+async def _stop(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is not None:
+        return
+
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), TERMINATE_GRACE)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+def _gdb_command_line(gdb_command: str, kernel: Optional[str], host: str, port: int) -> List[str]:
+    return [
+        *shlex.split(gdb_command, posix=sys.platform != 'win32'),
+        *([kernel] if kernel else []),
+        '-ex', f'target remote {host}:{port}',
+    ]
+
+
+async def _run_with_gdbserver(command_line: List[str], device: str, kernel: Optional[str],
+                              gdb_command: Optional[str], timeout: float) -> int:
+    host, port = parse_gdb_endpoint(device)
+
+    # Attached debugger owns the terminal, QEMU must not read from it nor get Ctrl-C meant for debugger
+    attach = gdb_command is not None
+    qemu = await asyncio.create_subprocess_exec(
+        *command_line,
+        stdin=subprocess.DEVNULL if attach else None,
+        start_new_session=attach and sys.platform != 'win32'
+    )
+
+    try:
+        await wait_for_gdbserver(host, port, timeout, qemu)
+
+        if gdb_command is None:
+            print(f'qemu-runner: gdbserver ready at {host}:{port}', file=sys.stderr, flush=True)
+            return await qemu.wait()
+
+        try:
+            gdb = await asyncio.create_subprocess_exec(*_gdb_command_line(gdb_command, kernel, host, port))
+        except OSError as e:
+            raise GdbError(f'Cannot start debugger {gdb_command}: {e}')
+
+        # Debugging session ends with debugger, machine left behind is stopped
+        return await gdb.wait()
+    finally:
+        await _stop(qemu)
+
+
+def run_with_gdbserver(command_line: List[str], device: Optional[str] = None, kernel: Optional[str] = None,
+                       gdb_command: Optional[str] = None, timeout: float = DEFAULT_READY_TIMEOUT) -> int:
+    run = _run_with_gdbserver(command_line, device or DEFAULT_GDB_DEVICE, kernel, gdb_command, timeout)
+    if gdb_command is None or threading.current_thread() is not threading.main_thread():
+        return asyncio.run(run)
+
+    # Ctrl-C in debugger breaks into target, it must not stop runner. Handler (unlike SIG_IGN) is not inherited by
+    # debugger, so it still gets the interrupt.
+    previous = signal.signal(signal.SIGINT, lambda *_: None)
+    try:
+        return asyncio.run(run)
+    finally:
+        signal.signal(signal.SIGINT, previous)
@@ -0,0 +1,30 @@
+import hashlib
+import mmap
+import os
+from typing import Tuple, Union
+
+__all__ = [
+    'hash_file',
+    'file_identity',
+]
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: Union[str, os.PathLike], algorithm: str = 'sha256') -> str:
+    h = hashlib.new(algorithm)
+
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return h.hexdigest()
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+            for offset in range(0, len(view), HASH_CHUNK_SIZE):
+                h.update(view[offset:offset + HASH_CHUNK_SIZE])
+
+    return h.hexdigest()
+
+
+def file_identity(path: Union[str, os.PathLike]) -> Tuple[str, int, int]:
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
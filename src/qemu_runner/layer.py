@@ -1,13 +1,14 @@
-import os.path 
-import re
-from configparser import ConfigParser
-from dataclasses import dataclass, replace
-from pathlib import Path
-from typing import List, Sequence, Dict, Protocol, Optional, Iterable
+import os.path
+from dataclasses import dataclass, replace, fields
+from typing import List, Sequence, Dict, Protocol, Optional, Iterable, Union, TYPE_CHECKING
 from enum import IntEnum
 
-from .argument import Argument, ArgumentValue, build_command_line_for_argument
-from .variable_resolution import VariableResolver, resolve_no_variables, append_resolver, make_resolver_from_dict
+from .argument import Argument, ArgumentValue, ArgumentSequence, build_command_line_for_argument
+from .variable_resolution import VariableResolver, VariableFactory, resolve_no_variables, append_resolver, \
+    make_lazy_resolver
+
+if TYPE_CHECKING:
+    from configparser import ConfigParser
 
 
 class Mode(IntEnum):
@@ -30,7 +31,8 @@ class GeneralSettings:
 class Layer:
     def __init__(self, general: GeneralSettings = GeneralSettings(), arguments: Sequence[Argument] = ()):
         self._general = general
-        self._arguments: List[Argument] = list(arguments)
+        # Layers derived with apply share unchanged arguments with their base
+        self._arguments = arguments if isinstance(arguments, ArgumentSequence) else ArgumentSequence(arguments)
 
     @property
     def general(self) -> GeneralSettings:
@@ -62,29 +64,30 @@ class Layer:
                 memory=other.memory if other.memory is not None else self._general.memory,
             )
 
-        def apply_arguments() -> Iterable[Argument]:
-            remaining_other = list(addition._arguments)
+        def apply_arguments() -> ArgumentSequence:
+            # Cost depends on size of addition only, unchanged arguments of base are shared
+            replaced: Dict[int, Argument] = {}
+            appended: List[Argument] = []
 
-            for arg in self._arguments:
-                arg_addition = [other_arg for other_arg in remaining_other if other_arg.id_matches(arg)]
+            for arg_addition in addition._arguments:
+                key = arg_addition.key
+                position = self._arguments.position(key)
 
-                assert len(arg_addition) <= 1
+                if position is None:
+                    appended.append(arg_addition)
+                    continue
 
-                if len(arg_addition) == 0:
-                    yield arg
-                else:
-                    updated_arg = arg.update_arguments(arg_addition[0].attributes)
-                    if arg_addition[0].value is not None:
-                        updated_arg = updated_arg.replace_value(arg_addition[0].value)
-                    yield updated_arg
-                    remaining_other.remove(arg_addition[0])
+                assert position not in replaced
+                updated_arg = self._arguments[position].update_arguments(arg_addition.attributes)
+                if arg_addition.value is not None:
+                    updated_arg = updated_arg.replace_value(arg_addition.value)
+                replaced[position] = updated_arg
 
-            for arg in remaining_other:
-                yield arg
+            return self._arguments.derive(replaced, appended)
 
         return Layer(
             general=apply_general(),
-            arguments=list(apply_arguments())
+            arguments=apply_arguments()
         )
 
     def __eq__(self, other) -> bool:
@@ -107,11 +110,23 @@ class Layer:
         return f'Layer(general={self._general!r}, arguments={self._arguments!r})'
 
 
+def fingerprint_layer(layer: Layer) -> str:
+    import hashlib
+
+    general = tuple(
+        int(v) if isinstance(v, Mode) else v
+        for v in (getattr(layer.general, f.name) for f in fields(GeneralSettings))
+    )
+    arguments = tuple((arg.name, arg.value, tuple(arg.attributes.items())) for arg in layer.arguments)
+
+    return hashlib.sha256(repr((general, arguments)).encode('utf-8')).hexdigest()
+
+
 WELL_KNOWN_SECTIONS = ['general']
 WELL_KNOWN_ARGUMENT_ATTRIBUTES = ['@']
 
 
-def parse_layer(config_parser: ConfigParser) -> Layer:
+def parse_layer(config_parser: 'ConfigParser') -> Layer:
     def read_argument_attributes(section: str) -> Dict[str, ArgumentValue]:
         result = {k: v for k, v in config_parser.items(section) if k not in WELL_KNOWN_ARGUMENT_ATTRIBUTES}
 
@@ -180,27 +195,88 @@ def parse_layer(config_parser: ConfigParser) -> Layer:
     )
 
 
+def _format_ini_value(value: ArgumentValue) -> str:
+    # Escape interpolation of ConfigParser and keep multiline values as continuation lines
+    return str(value).replace('%', '%%').replace('\n', '\n\t')
+
+
+def format_layer(layer: Layer) -> str:
+    lines = []
+
+    general = layer.general
+    general_values = [
+        ('engine', general.engine if general.engine != '' else None),
+        ('mode', general.mode.name.lower() if general.mode is not None else None),
+        ('kernel', general.kernel),
+        ('cmdline', general.kernel_cmdline),
+        ('gdb', general.gdb),
+        ('gdb_dev', general.gdb_dev),
+        ('halted', general.halted),
+        ('memory', general.memory),
+    ]
+    general_lines = [
+        f'{key} = {str(value).lower() if isinstance(value, bool) else _format_ini_value(value)}'
+        for key, value in general_values if value is not None
+    ]
+    if general_lines:
+        lines += ['[general]', *general_lines, '']
+
+    for arg in layer.arguments:
+        lines.append(f'[{arg.name}:{arg.id_value}]' if arg.id_value is not None else f'[{arg.name}]')
+
+        if arg.value is not None:
+            lines.append(f'@ = {_format_ini_value(arg.value)}')
+
+        for key, value in arg.attributes.items():
+            if key == 'id':
+                continue
+            lines.append(f'{key} = {_format_ini_value(value)}' if value is not None else key)
+
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
 class FindQemuFunc(Protocol):
-    def __call__(self, engine: str) -> Path:
+    def __call__(self, engine: str) -> Union[str, os.PathLike]:
         pass
 
 
-def _make_variable_resolver_for_layer(layer: Layer) -> VariableResolver:
-    variables = {}
-    if layer.general.kernel:
-        variables['KERNEL_DIR'] = os.path.dirname(layer.general.kernel)
+def _hash_kernel(kernel: str) -> str:
+    from .hashing import hash_file
+    return hash_file(kernel)
+
+
+def _temporary_directory() -> str:
+    import tempfile
+    return tempfile.gettempdir()
+
+
+def make_variable_resolver_for_layer(layer: Layer, runner_dir: Optional[str] = None) -> VariableResolver:
+    # Built-in variables of layer (KERNEL_DIR, RUNNER_DIR, ...), also used to resolve paths outside command line
+    kernel = layer.general.kernel
+    variables: Dict[str, VariableFactory] = {'TMPDIR': _temporary_directory}
+
+    if kernel:
+        variables['KERNEL_DIR'] = lambda: os.path.dirname(kernel)
+        variables['KERNEL_NAME'] = lambda: os.path.basename(kernel)
+        variables['KERNEL_SHA256'] = lambda: _hash_kernel(kernel)
+
+    if runner_dir is not None:
+        variables['RUNNER_DIR'] = lambda: runner_dir
 
-    return make_resolver_from_dict(variables)
+    return make_lazy_resolver(variables)
 
 
 def build_command_line(
         layer: Layer,
         find_qemu_func: Optional[FindQemuFunc] = None,
-        variable_resolver: VariableResolver = resolve_no_variables) -> Sequence[str]:
+        variable_resolver: VariableResolver = resolve_no_variables,
+        runner_dir: Optional[str] = None) -> Sequence[str]:
     if layer.general.engine == '':
         raise Exception('Must specify engine')
 
-    variable_resolver = append_resolver(variable_resolver, _make_variable_resolver_for_layer(layer))
+    variable_resolver = append_resolver(variable_resolver, make_variable_resolver_for_layer(layer, runner_dir))
 
     def _yield_args():
         if find_qemu_func:
@@ -239,6 +315,7 @@ def build_command_line(
                 yield '-append'
                 yield layer.general.kernel_cmdline
             else:
+                import re
                 pattern = re.compile(r"\"[^\"]*\"|\'[^\']*\'|\S+")
                 args = pattern.findall(layer.general.kernel_cmdline)
                 for arg in args:
@@ -0,0 +1,66 @@
+import marshal
+from dataclasses import fields
+from typing import Tuple
+
+from .argument import Argument
+from .layer import Layer, GeneralSettings, Mode
+
+__all__ = [
+    'LayerFormatError',
+    'BINARY_LAYER_VERSION',
+    'dump_layer_binary',
+    'load_layer_binary',
+]
+
+BINARY_LAYER_MAGIC = b'QRL'
+# Bump whenever layout of serialized tuples changes, readers reject other versions
+BINARY_LAYER_VERSION = 1
+# Fixed marshal version keeps file readable by every supported Python
+MARSHAL_VERSION = 4
+
+GENERAL_FIELDS = tuple(f.name for f in fields(GeneralSettings))
+
+
+class LayerFormatError(Exception):
+    pass
+
+
+def _header(version: int) -> bytes:
+    return BINARY_LAYER_MAGIC + bytes([version])
+
+
+def dump_layer_binary(layer: Layer) -> bytes:
+    general = tuple(getattr(layer.general, name) for name in GENERAL_FIELDS)
+    general = tuple(int(v) if isinstance(v, Mode) else v for v in general)
+    arguments = tuple((arg.name, arg.value, arg.attributes.pairs) for arg in layer.arguments)
+
+    return _header(BINARY_LAYER_VERSION) + marshal.dumps((GENERAL_FIELDS, general, arguments), MARSHAL_VERSION)
+
+
+def _load_general(names: Tuple[str, ...], values: Tuple[object, ...]) -> GeneralSettings:
+    if names != GENERAL_FIELDS or len(values) != len(names):
+        raise LayerFormatError('Binary layer describes different general settings')
+
+    general = dict(zip(names, values))
+    if general['mode'] is not None:
+        general['mode'] = Mode(general['mode'])
+
+    return GeneralSettings(**general)
+
+
+def load_layer_binary(data: bytes) -> Layer:
+    header = _header(BINARY_LAYER_VERSION)
+    if data[:len(header)] != header:
+        raise LayerFormatError('Not a binary layer or unsupported version')
+
+    try:
+        names, general, arguments = marshal.loads(data[len(header):])
+
+        return Layer(
+            general=_load_general(names, general),
+            arguments=[Argument(name, value, attributes) for name, value, attributes in arguments]
+        )
+    except LayerFormatError:
+        raise
+    except (ValueError, EOFError, TypeError, KeyError) as e:
+        raise LayerFormatError(f'Malformed binary layer: {e}')
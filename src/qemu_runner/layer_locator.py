@@ -1,7 +1,11 @@
 import os
-import pkgutil
 from typing import Optional, Iterable, List
 
+# Layer stored in runner next to embedded layers, result of applying all of them validated when runner is made
+COMBINED_LAYER_NAME = 'combined.ini'
+# The same combined layer serialized with qemu_runner.layer_binary, loaded by runner without parsing
+COMBINED_BINARY_LAYER_NAME = 'combined.layer'
+
 
 class LayerNotFoundError(Exception):
     pass
@@ -19,6 +23,8 @@ def find_layer_file(layer: str, dirs: List[str]) -> Optional[str]:
 
 
 def find_layer_package(layer: str, packages: List[str]) -> Optional[str]:
+    import pkgutil
+
     for pkg in packages:
         try:
             data = pkgutil.get_data(pkg, f'layers/{layer}')
@@ -0,0 +1,226 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from .argument import Argument, ArgumentValue
+from .layer import Layer, GeneralSettings, Mode, WELL_KNOWN_SECTIONS, WELL_KNOWN_ARGUMENT_ATTRIBUTES
+
+__all__ = [
+    'LayerSyntaxError',
+    'parse_layer_text',
+]
+
+# Syntax accepted by ConfigParser with default settings, see configparser.RawConfigParser._read
+SECTION_PATTERN = re.compile(r'\[(?P<header>.+)\]')
+OPTION_PATTERN = re.compile(r'(?P<option>.*?)\s*(?P<vi>=|:)\s*(?P<value>.*)$')
+NON_SPACE_PATTERN = re.compile(r'\S')
+INTERPOLATION_PATTERN = re.compile(r'%\(([^)]+)\)s')
+COMMENT_PREFIXES = ('#', ';')
+DEFAULT_SECTION = 'DEFAULT'
+MAX_INTERPOLATION_DEPTH = 10
+
+BOOLEAN_STATES = {
+    '1': True, 'yes': True, 'true': True, 'on': True,
+    '0': False, 'no': False, 'false': False, 'off': False,
+}
+
+
+class LayerSyntaxError(Exception):
+    def __init__(self, message: str, line: int, source: Optional[str] = None):
+        super().__init__(message, line, source)
+        self.message = message
+        self.line = line
+        self.source = source
+
+    def __str__(self) -> str:
+        return f'{self.source or "<layer>"}, line {self.line}: {self.message}'
+
+
+class _Section:
+    __slots__ = ('name', 'line', 'values', 'lines')
+
+    def __init__(self, name: str, line: int):
+        self.name = name
+        self.line = line
+        # Raw values are kept as plain strings, thousands of small objects per layer would keep GC busy
+        self.values: Dict[str, str] = {}
+        self.lines: Dict[str, int] = {}
+
+
+def _read_sections(text: str, source: Optional[str]) -> Tuple[List[_Section], _Section]:
+    sections: Dict[str, _Section] = {}
+    defaults = _Section(DEFAULT_SECTION, 0)
+    section: Optional[_Section] = None
+    key: Optional[str] = None
+    indent_level = 0
+    # Empty lines inside multiline value are kept, trailing ones are dropped as ConfigParser does
+    pending_empty_lines = 0
+
+    for line_number, line in enumerate(text.split('\n'), start=1):
+        value = line.strip()
+
+        if value.startswith(COMMENT_PREFIXES):
+            continue
+
+        if not value:
+            pending_empty_lines += 1
+            continue
+
+        first_non_space = NON_SPACE_PATTERN.search(line)
+        indent = first_non_space.start() if first_non_space else 0
+        if key is not None and indent > indent_level:
+            section.values[key] += '\n' * (pending_empty_lines + 1) + value
+            pending_empty_lines = 0
+            continue
+
+        pending_empty_lines = 0
+        indent_level = indent
+        match = SECTION_PATTERN.match(value)
+        if match:
+            name = match.group('header')
+            if name == DEFAULT_SECTION:
+                section = defaults
+            elif name in sections:
+                raise LayerSyntaxError(f'Duplicate section [{name}]', line_number, source)
+            else:
+                section = _Section(name, line_number)
+                sections[name] = section
+            key = None
+            continue
+
+        if section is None:
+            raise LayerSyntaxError('Expected section header before first option', line_number, source)
+
+        match = OPTION_PATTERN.match(value)
+        if not match or not match.group('option'):
+            raise LayerSyntaxError(f'Expected key = value, got {value!r}', line_number, source)
+
+        key = match.group('option').rstrip().lower()
+        if key in section.values:
+            raise LayerSyntaxError(f'Duplicate key {key!r} in section [{section.name}]', line_number, source)
+
+        section.values[key] = match.group('value').strip()
+        section.lines[key] = line_number
+
+    return list(sections.values()), defaults
+
+
+class _SectionValues:
+    def __init__(self, section: _Section, defaults: _Section, source: Optional[str]):
+        # Values from [DEFAULT] apply to every section, as in ConfigParser
+        if defaults.values:
+            self.raw = {**defaults.values, **section.values}
+            self._lines = {**defaults.lines, **section.lines}
+        else:
+            self.raw = section.values
+            self._lines = section.lines
+        self._source = source
+
+    def error(self, key: str, message: str) -> LayerSyntaxError:
+        return LayerSyntaxError(message, self._lines[key], self._source)
+
+    def get(self, key: str) -> Optional[str]:
+        raw = self.raw.get(key)
+        if raw is None or '%' not in raw:
+            return raw
+
+        accumulator: List[str] = []
+        self._interpolate(key, raw, accumulator, 1)
+        return ''.join(accumulator)
+
+    def get_boolean(self, key: str) -> bool:
+        value = self.get(key)
+        if value.lower() not in BOOLEAN_STATES:
+            raise self.error(key, f'Not a boolean: {value}')
+
+        return BOOLEAN_STATES[value.lower()]
+
+    def _interpolate(self, key: str, rest: str, accumulator: List[str], depth: int) -> None:
+        # Same substitutions as configparser.BasicInterpolation
+        if depth > MAX_INTERPOLATION_DEPTH:
+            raise self.error(key, f'Recursion limit exceeded in value substitution of {key!r}')
+
+        while rest:
+            position = rest.find('%')
+            if position < 0:
+                accumulator.append(rest)
+                return
+
+            accumulator.append(rest[:position])
+            rest = rest[position:]
+            following = rest[1:2]
+
+            if following == '%':
+                accumulator.append('%')
+                rest = rest[2:]
+            elif following == '(':
+                match = INTERPOLATION_PATTERN.match(rest)
+                if match is None:
+                    raise self.error(key, f'Bad interpolation variable reference {rest!r}')
+
+                name = match.group(1).lower()
+                rest = rest[match.end():]
+                if name not in self.raw:
+                    raise self.error(key, f'Bad interpolation of {key!r}, no option {name!r}')
+
+                value = self.raw[name]
+                if '%' in value:
+                    self._interpolate(key, value, accumulator, depth + 1)
+                else:
+                    accumulator.append(value)
+            else:
+                raise self.error(key, f"'%' must be followed by '%' or '(', found: {rest!r}")
+
+
+def _read_general_settings(values: _SectionValues) -> GeneralSettings:
+    # Every value is substituted, including unknown ones, so malformed ones are reported as ConfigParser does
+    section = {key: values.get(key) for key in values.raw}
+
+    mode = section.get('mode')
+    if mode is not None and mode not in ('system', 'user'):
+        raise values.error('mode', 'Possible mode values: system, user')
+
+    return GeneralSettings(
+        engine=section.get('engine', ''),
+        mode=Mode[mode.capitalize()] if mode is not None else None,
+        kernel=section.get('kernel'),
+        kernel_cmdline=section.get('cmdline'),
+        halted=values.get_boolean('halted') if 'halted' in section else None,
+        gdb=values.get_boolean('gdb') if 'gdb' in section else None,
+        gdb_dev=section.get('gdb_dev'),
+        memory=section.get('memory'),
+    )
+
+
+def _read_argument(name: str, values: _SectionValues) -> Argument:
+    arg_name, has_id, arg_id = name.partition(':')
+
+    attributes: Dict[str, ArgumentValue] = {
+        key: values.get(key) for key in values.raw if key not in WELL_KNOWN_ARGUMENT_ATTRIBUTES
+    }
+    if has_id:
+        attributes['id'] = arg_id
+
+    return Argument(name=arg_name, value=values.get('@'), attributes=attributes)
+
+
+def parse_layer_text(text: str, source: Optional[str] = None) -> Layer:
+    sections, defaults = _read_sections(text, source)
+
+    general = GeneralSettings()
+    arguments = []
+
+    for section in sections:
+        values = _SectionValues(section, defaults, source)
+
+        if section.name in WELL_KNOWN_SECTIONS:
+            general = _read_general_settings(values)
+            continue
+
+        try:
+            arguments.append(_read_argument(section.name, values))
+        except LayerSyntaxError:
+            raise
+        except Exception as e:
+            raise LayerSyntaxError(str(e), section.line, source)
+
+    return Layer(general=general, arguments=arguments)
@@ -1,26 +1,93 @@
 import argparse
+import os
 import sys
 from typing import List
 
-from .make import make_runner, load_layers_from_all_search_paths
+from qemu_runner.profile import ProfileError, parse_profile_match
+
+from .make import make_runner, load_layers_from_all_search_paths, make_shebang, LayerValidationError, Profile, \
+    ShebangError
 
 
 def parse_args(argv: List[str]):
     parser = argparse.ArgumentParser()
-    parser.add_argument('-l', '--layers', nargs='+', required=True, help='Layer files')
+    parser.add_argument('-l', '--layers', nargs='+', default=[], help='Layer files')
+    parser.add_argument('-p', '--profile', nargs='+', action='append', default=[], metavar=('NAME', 'LAYER'),
+                        help='Profile with layers applied on top of --layers, can be repeated')
+    parser.add_argument('--profile-match', nargs=2, action='append', default=[], metavar=('NAME', 'CRITERIA'),
+                        help='Select profile for kernels with matching ELF header, '
+                             'e.g. --profile-match arm machine=arm,class=32')
     parser.add_argument('-o', '--output', required=True, help='Output .pyz file', type=argparse.FileType('wb'))
-    return parser.parse_args(argv)
+    parser.add_argument('--interpreter',
+                        help='Prepend shebang with given interpreter and make runner executable')
+    parser.add_argument('--interpreter-flags', default='',
+                        help='Single-letter interpreter flags put in shebang, e.g. --interpreter-flags="-S -I"')
+    parser.add_argument('--extract-once', action='store_true',
+                        help='Extract runner to per-user cache on first use and import from there')
+    args = parser.parse_args(argv)
+
+    if args.interpreter_flags and not args.interpreter:
+        parser.error('--interpreter-flags requires --interpreter')
+
+    try:
+        args.shebang = make_shebang(args.interpreter, args.interpreter_flags.split()) if args.interpreter else None
+    except ShebangError as e:
+        parser.error(str(e))
+
+    if not args.layers and not args.profile:
+        parser.error('Specify at least one of --layers or --profile')
+
+    if any(len(profile) < 2 for profile in args.profile):
+        parser.error('--profile requires name and at least one layer')
+
+    profile_names = [profile[0] for profile in args.profile]
+    for name, _ in args.profile_match:
+        if name not in profile_names:
+            parser.error(f'--profile-match refers to unknown profile {name}')
+
+    try:
+        args.profile_match = {name: parse_profile_match(criteria) for name, criteria in args.profile_match}
+    except ProfileError as e:
+        parser.error(str(e))
+
+    return args
 
 
 def main(argv: List[str]):
+    if argv[:1] == ['bench']:
+        from .bench import main as bench_main
+        bench_main(argv[1:])
+        return
+
     args = parse_args(argv)
     layer_contents = load_layers_from_all_search_paths(args.layers)
-    make_runner(
-        args.output,
-        layer_contents=layer_contents,
-        additional_script_bases=[],
-        additional_search_paths=[]
-    )
+    profiles = [
+        Profile(
+            name=name,
+            layer_contents=load_layers_from_all_search_paths(layers),
+            layer_names=layers,
+            match=args.profile_match.get(name, {})
+        )
+        for name, *layers in args.profile
+    ]
+
+    try:
+        make_runner(
+            args.output,
+            layer_contents=layer_contents,
+            additional_script_bases=[],
+            additional_search_paths=[],
+            shebang=args.shebang,
+            extract_once=args.extract_once,
+            layer_names=args.layers,
+            profiles=profiles
+        )
+    except (LayerValidationError, ProfileError) as e:
+        args.output.close()
+        if os.path.isfile(args.output.name):
+            os.unlink(args.output.name)
+        print(f'qemu_make_runner: error: {e}', file=sys.stderr)
+        sys.exit(1)
 
 
 def run():
@@ -0,0 +1,198 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+__all__ = [
+    'BenchmarkResult',
+    'percentile',
+    'run_benchmarks',
+    'format_results',
+    'main',
+]
+
+DEFAULT_RUNS = 20
+DEFAULT_MAX_DEPTH = 10
+REPORTED_PERCENTILES = (50, 90, 99)
+
+BASE_LAYER = """
+[general]
+engine = qemu-system-arm
+memory = 128M
+
+[machine]
+@ = virt
+"""
+
+DERIVED_LAYER = """
+[general]
+memory = {size}M
+
+[device:uart{level}]
+@ = pl011
+"""
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    name: str
+    cold_ms: float
+    warm_ms: List[float]
+
+    def percentile(self, p: float) -> float:
+        return percentile(self.warm_ms, p)
+
+    def to_json(self) -> Dict[str, object]:
+        return {
+            'name': self.name,
+            'cold_ms': self.cold_ms,
+            'warm_ms': self.warm_ms,
+            **{f'p{p}_ms': self.percentile(p) for p in REPORTED_PERCENTILES},
+        }
+
+
+def percentile(samples: Sequence[float], p: float) -> float:
+    # Nearest-rank, reports value actually observed instead of interpolated one
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _place_stub_qemu(directory: Path) -> str:
+    directory.mkdir(parents=True, exist_ok=True)
+
+    if sys.platform == 'win32':
+        path = directory / 'qemu-system-arm.cmd'
+        path.write_text('@exit /b 0\n')
+    else:
+        path = directory / 'qemu-system-arm'
+        path.write_text('#!/bin/sh\nexit 0\n')
+        path.chmod(0o755)
+
+    return str(path)
+
+
+class _Bench:
+    def __init__(self, work_dir: Path, qemu: str, runs: int):
+        self._work_dir = work_dir
+        self._runs = runs
+        self._env = {
+            **os.environ,
+            'QEMU_DEV': qemu,
+            'QEMU_RUNNER_EXTRACT_DIR': str(work_dir / 'extracted'),
+        }
+        # Measure runner itself, not launches delegated to zygote
+        self._env.pop('QEMU_RUNNER_ZYGOTE', None)
+
+    def run(self, command_line: List[str]) -> float:
+        start = time.perf_counter()
+        subprocess.run(command_line, cwd=self._work_dir, env=self._env, check=True,
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        return (time.perf_counter() - start) * 1000
+
+    def measure(self, name: str, make_command_line) -> BenchmarkResult:
+        # First invocation runs with cold OS caches (and cold extract-once cache), remaining ones are warm
+        cold = self.run(make_command_line(0))
+        warm = [self.run(make_command_line(i + 1)) for i in range(self._runs)]
+        return BenchmarkResult(name=name, cold_ms=cold, warm_ms=warm)
+
+    def make_runner(self, output: str) -> List[str]:
+        return [sys.executable, '-m', 'qemu_runner.make_runner', '-l', 'base.ini', '-o', output]
+
+    def runner(self, runner: str, *args: str) -> List[str]:
+        return [sys.executable, runner, *args]
+
+
+def run_benchmarks(work_dir: Path, runs: int = DEFAULT_RUNS, max_depth: int = DEFAULT_MAX_DEPTH,
+                   qemu: Optional[str] = None) -> List[BenchmarkResult]:
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    (work_dir / 'base.ini').write_text(BASE_LAYER)
+    bench = _Bench(work_dir, qemu or _place_stub_qemu(work_dir / 'qemu'), runs)
+
+    results = [bench.measure('make runner', lambda i: bench.make_runner(f'made{i}.pyz'))]
+
+    bench.run(bench.make_runner('depth0.pyz'))
+    for level in range(1, max_depth + 1):
+        (work_dir / f'derived{level}.ini').write_text(DERIVED_LAYER.format(size=128 * (level + 1), level=level))
+        bench.run(bench.runner(f'depth{level - 1}.pyz', '--layers', f'derived{level}.ini',
+                               '--derive', f'depth{level}.pyz'))
+
+    results.append(bench.measure(
+        f'derive (depth {max_depth})',
+        lambda i: bench.runner(f'depth{max_depth}.pyz', '--layers', 'base.ini', '--derive', f'derive{i}.pyz')
+    ))
+
+    for depth in range(0, max_depth + 1):
+        results.append(bench.measure(
+            f'dry-run (depth {depth})',
+            lambda i: bench.runner(f'depth{depth}.pyz', '--dry-run', 'kernel.elf')
+        ))
+
+    for depth in sorted({0, max_depth}):
+        results.append(bench.measure(
+            f'launch (depth {depth})',
+            lambda i: bench.runner(f'depth{depth}.pyz', 'kernel.elf')
+        ))
+
+    return results
+
+
+def format_results(results: Sequence[BenchmarkResult]) -> str:
+    width = max(len(result.name) for result in results)
+    columns = ['cold', *(f'p{p}' for p in REPORTED_PERCENTILES), 'max']
+
+    lines = [f'{"[ms]":{width}}' + ''.join(f'  {column:>8}' for column in columns)]
+    for result in results:
+        values = [result.cold_ms, *(result.percentile(p) for p in REPORTED_PERCENTILES), max(result.warm_ms)]
+        lines.append(f'{result.name:{width}}' + ''.join(f'  {value:8.1f}' for value in values))
+
+    return '\n'.join(lines)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='qemu_make_runner bench',
+                                     description='Measure fixed cost runner adds to each QEMU invocation')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Warm invocations measured for each case')
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH, help='Length of derived runner chain')
+    parser.add_argument('--qemu', help='Executable launched instead of stub QEMU (exiting immediately)')
+    parser.add_argument('--work-dir', help='Directory for runners made by benchmark, temporary one by default')
+    parser.add_argument('--json', dest='json_output', metavar='FILE', help='Write results to JSON file')
+    args = parser.parse_args(argv)
+
+    if args.runs < 1:
+        parser.error('--runs must be at least 1')
+
+    if args.max_depth < 1:
+        parser.error('--max-depth must be at least 1')
+
+    return args
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+
+    if args.work_dir:
+        results = run_benchmarks(Path(args.work_dir), args.runs, args.max_depth, args.qemu)
+    else:
+        with tempfile.TemporaryDirectory(prefix='qemu-runner-bench-') as work_dir:
+            results = run_benchmarks(Path(work_dir), args.runs, args.max_depth, args.qemu)
+
+    print(f'Python {platform.python_version()} on {platform.platform()}, {args.runs} warm runs')
+    print(format_results(results))
+
+    if args.json_output:
+        with open(args.json_output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': [result.to_json() for result in results],
+            }, f, indent=2)
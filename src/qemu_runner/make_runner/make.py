@@ -1,21 +1,84 @@
+import hashlib
 import importlib.resources
 import os
 import pkgutil
 import shutil
+import stat
 import zipfile
 import zipimport
 from pathlib import Path
-from typing import IO, List, Any
+from dataclasses import dataclass, field
+from typing import IO, List, Any, Optional, Sequence, Dict, Union
 
-from qemu_runner.layer_locator import load_layer
+from qemu_runner.layer import Layer, format_layer
+from qemu_runner.layer_parser import LayerSyntaxError, parse_layer_text
+from qemu_runner.layer_binary import dump_layer_binary
+from qemu_runner.layer_locator import load_layer, COMBINED_LAYER_NAME, COMBINED_BINARY_LAYER_NAME
+from qemu_runner.profile import ProfileError, validate_profile_name
 import qemu_runner
 
 __all__ = [
+    'LayerValidationError',
+    'Profile',
+    'ShebangError',
+    'combine_layers',
     'make_runner',
     'load_layers_from_all_search_paths',
+    'make_shebang',
+    'read_shebang',
 ]
 
 
+# Interpreter flags taking value, value would need separate argument which shebang cannot pass
+VALUE_FLAGS = 'cmWXQ'
+
+
+class LayerValidationError(Exception):
+    pass
+
+
+class ShebangError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Profile:
+    name: str
+    layer_contents: Sequence[str]
+    layer_names: Optional[Sequence[str]] = None
+    match: Dict[str, Union[int, str]] = field(default_factory=dict)
+
+
+def combine_layers(layer_contents: Sequence[str], layer_names: Optional[Sequence[str]] = None) -> Layer:
+    if layer_names is None:
+        layer_names = [f'layer #{i}' for i in range(len(layer_contents))]
+
+    combined_layer = Layer()
+
+    for name, content in zip(layer_names, layer_contents):
+        try:
+            layer = parse_layer_text(content, source=name)
+        except LayerSyntaxError as e:
+            raise LayerValidationError(str(e))
+        except Exception as e:
+            raise LayerValidationError(f'{name}: {e}')
+
+        try:
+            combined_layer = combined_layer.apply(layer)
+        except Exception as e:
+            raise LayerValidationError(f'{name}: cannot be applied on top of previous layers: {e}')
+
+    try:
+        stored_layer = parse_layer_text(format_layer(combined_layer))
+    except Exception as e:
+        stored_layer = e
+
+    if stored_layer != combined_layer:
+        raise LayerValidationError(f'Combined layer cannot be stored in runner: {stored_layer}')
+
+    return combined_layer
+
+
 def load_layers_from_all_search_paths(layer_names: List[str]) -> List[str]:
     packages = ['qemu_runner']
     try:
@@ -103,12 +166,94 @@ def copy_package(package: Any, archive: zipfile.ZipFile) -> None:
             copy_directory_path(p, archive, package.__name__)
 
 
+def make_shebang(interpreter: str, flags: Sequence[str] = ()) -> str:
+    # Kernel passes everything after interpreter as single argument,
+    # so only single-letter flags are accepted and combined into one (-S -E -I -> -SEI)
+    letters = []
+    for flag in flags:
+        if len(flag) < 2 or flag[0] != '-' or not flag[1:].isalpha():
+            raise ShebangError(f'Interpreter flag {flag!r} cannot be put in shebang, only single-letter flags are '
+                               f'allowed')
+
+        with_value = [letter for letter in flag[1:] if letter in VALUE_FLAGS]
+        if with_value:
+            raise ShebangError(f'Interpreter flag -{with_value[0]} takes value and cannot be put in shebang')
+
+        letters.extend(flag[1:])
+
+    return f'{interpreter} -{"".join(letters)}' if letters else interpreter
+
+
+def read_shebang(path: str) -> Optional[str]:
+    with open(path, 'rb') as f:
+        first_line = f.readline()
+
+    if not first_line.startswith(b'#!'):
+        return None
+
+    return first_line[2:].rstrip(b'\r\n').decode('utf-8')
+
+
+def _make_executable(output: IO[bytes]) -> None:
+    path = getattr(output, 'name', None)
+    if not isinstance(path, (str, bytes, os.PathLike)) or not os.path.isfile(path):
+        return
+
+    mode = os.stat(path).st_mode
+    # Grant execute wherever read is granted
+    os.chmod(path, mode | ((mode & (stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)) >> 2))
+
+
+def write_combined_layer(archive: zipfile.ZipFile, directory: str, layer: Layer) -> None:
+    # INI text is kept for --inspect and older tools, runner itself loads binary form
+    with archive.open(f'{directory}/{COMBINED_LAYER_NAME}', 'w') as f:
+        f.write(format_layer(layer).encode('utf-8'))
+
+    with archive.open(f'{directory}/{COMBINED_BINARY_LAYER_NAME}', 'w') as f:
+        f.write(dump_layer_binary(layer))
+
+
+def compute_extract_key(archive: zipfile.ZipFile) -> str:
+    # CRC and size of every entry identify content of runner without reading it back
+    digest = hashlib.sha256()
+    for info in sorted(archive.infolist(), key=lambda i: i.filename):
+        digest.update(f'{info.filename}\0{info.CRC:08x}\0{info.file_size}\n'.encode('utf-8'))
+
+    return digest.hexdigest()[:32]
+
+
 def make_runner(output: IO[bytes],
                 *,
                 layer_contents: List[str],
                 additional_script_bases: List[str],
-                additional_search_paths: List[str]
+                additional_search_paths: List[str],
+                shebang: Optional[str] = None,
+                extract_once: bool = False,
+                layer_names: Optional[Sequence[str]] = None,
+                profiles: Sequence[Profile] = ()
                 ) -> None:
+    if layer_names is None:
+        layer_names = [f'layer #{i}' for i in range(len(layer_contents))]
+
+    combined_layer = combine_layers(layer_contents, layer_names)
+
+    profile_names = [validate_profile_name(profile.name) for profile in profiles]
+    if len(set(profile_names)) != len(profile_names):
+        raise ProfileError('Profile names must be unique')
+
+    profile_layers: Dict[str, List[str]] = {}
+    combined_profile_layers: Dict[str, Layer] = {}
+    for profile in profiles:
+        names = profile.layer_names or [f'{profile.name} layer #{i}' for i in range(len(profile.layer_contents))]
+        combined_profile_layers[profile.name] = combine_layers(
+            [*layer_contents, *profile.layer_contents],
+            [*layer_names, *names]
+        )
+        profile_layers[profile.name] = [f'profiles/{profile.name}/{i}.ini' for i in range(len(profile.layer_contents))]
+
+    if shebang is not None:
+        output.write(b'#!' + shebang.encode('utf-8') + b'\n')
+
     with zipfile.ZipFile(output, mode='w', compression=zipfile.ZIP_STORED) as archive:
         copy_package(qemu_runner, archive)
 
@@ -119,10 +264,29 @@ def make_runner(output: IO[bytes],
             with archive.open(f'embedded_layers/layers/{i}.ini', 'w') as f1:
                 f1.write(layer_content.encode('utf-8'))
 
+        write_combined_layer(archive, 'embedded_layers/layers', combined_layer)
+
+        for profile in profiles:
+            for layer_file, layer_content in zip(profile_layers[profile.name], profile.layer_contents):
+                with archive.open(f'embedded_layers/layers/{layer_file}', 'w') as f:
+                    f.write(layer_content.encode('utf-8'))
+
+            write_combined_layer(archive, f'embedded_layers/layers/profiles/{profile.name}',
+                                 combined_profile_layers[profile.name])
+
+        extract_key = compute_extract_key(archive) if extract_once else None
+
         with archive.open('__main__.py', 'w') as f:
             main_template = pkgutil.get_data('qemu_runner.make_runner', 'main.py.in').decode('utf-8')
             f.write(main_template.format(
                 embedded_layers=[f'{i}.ini' for i in range(0, len(layer_contents))],
                 additional_script_bases=additional_script_bases,
-                additional_search_paths=additional_search_paths
+                additional_search_paths=additional_search_paths,
+                extract_key=extract_key,
+                profiles=profile_layers,
+                profile_matches={profile.name: dict(profile.match) for profile in profiles if profile.match}
             ).encode('utf-8'))
+
+    if shebang is not None:
+        output.flush()
+        _make_executable(output)
@@ -0,0 +1,113 @@
+import marshal
+import sys
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+__all__ = [
+    'PROFILE_ENV',
+    'SamplingProfiler',
+    'profile_runner',
+]
+
+PROFILE_ENV = 'QEMU_RUNNER_PROFILE'
+SAMPLE_INTERVAL = 0.001
+
+# Function identity used by pstats: (file name, first line, function name)
+_FunctionKey = Tuple[str, int, str]
+
+
+class SamplingProfiler:
+    # Fallback when cProfile is not available or another profiler is active. Stack of profiled thread is sampled
+    # periodically and stored in pstats format, sample counts stand for call counts.
+    def __init__(self, interval: float = SAMPLE_INTERVAL, thread_id: Optional[int] = None):
+        self._interval = interval
+        self._thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._self_samples: Dict[_FunctionKey, int] = {}
+        self._total_samples: Dict[_FunctionKey, int] = {}
+        self._callers: Dict[_FunctionKey, Dict[_FunctionKey, int]] = {}
+
+    def enable(self) -> None:
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name='qemu-runner-profiler', daemon=True)
+        self._sampler.start()
+
+    def disable(self) -> None:
+        if self._sampler is not None:
+            self._stopped.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample_loop(self) -> None:
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _record(self, frame) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+
+        self._self_samples[stack[0]] = self._self_samples.get(stack[0], 0) + 1
+        # Recursive functions are counted once per sample
+        for key in set(stack):
+            self._total_samples[key] = self._total_samples.get(key, 0) + 1
+        for callee, caller in zip(stack, stack[1:]):
+            callers = self._callers.setdefault(callee, {})
+            callers[caller] = callers.get(caller, 0) + 1
+
+    def create_stats(self) -> Dict[_FunctionKey, tuple]:
+        interval = self._interval
+        stats = {}
+        for key, total in self._total_samples.items():
+            callers = {
+                caller: (count, count, 0.0, count * interval) for caller, count in self._callers.get(key, {}).items()
+            }
+            stats[key] = (total, total, self._self_samples.get(key, 0) * interval, total * interval, callers)
+
+        return stats
+
+    def dump_stats(self, path: str) -> None:
+        # Same layout as written by cProfile.Profile.dump_stats, readable with pstats
+        with open(path, 'wb') as f:
+            marshal.dump(self.create_stats(), f)
+
+
+def _start_profiler():
+    try:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    except (ImportError, ValueError):
+        # cProfile is missing or profiling hook is already taken (e.g. by debugger or coverage tool)
+        profiler = SamplingProfiler()
+        profiler.enable()
+        return profiler
+
+
+def profile_runner(run: Callable[[Callable[[], None]], None], path: str) -> None:
+    # Profile covers runner only, it is stopped and written right before QEMU is started
+    profiler = _start_profiler()
+    stopped = False
+
+    def stop() -> None:
+        nonlocal stopped
+        if stopped:
+            return
+
+        stopped = True
+        profiler.disable()
+        try:
+            profiler.dump_stats(path)
+        except OSError as e:
+            print(f'qemu-runner: Cannot write profile to {path}: {e}', file=sys.stderr)
+
+    try:
+        run(stop)
+    finally:
+        stop()
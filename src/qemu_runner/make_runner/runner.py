@@ -1,17 +1,30 @@
-import argparse
+# Modules imported here are loaded on every runner start, everything else is imported where it is needed
 import os
-import shlex
-import subprocess
 import sys
-from configparser import ConfigParser
-from pathlib import Path
-from typing import List, Optional
+from types import SimpleNamespace
+from typing import List, Optional, NoReturn, Union, Dict, Mapping, Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import argparse
+    from contextlib import ExitStack
+    from pathlib import Path
+    from qemu_runner.layer import Layer
 
 
 def make_path_absolute(v: str) -> str:
     return os.path.abspath(v)
 
-def make_arg_parser():
+
+def make_size(v: str) -> int:
+    import argparse
+    from qemu_runner.result_cache import parse_size
+    try:
+        return parse_size(v)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid size {v!r}, expected number of bytes with optional K, M or G suffix')
+
+def make_arg_parser() -> 'argparse.ArgumentParser':
+    import argparse
     parser = argparse.ArgumentParser()
     parser.formatter_class = argparse.RawDescriptionHelpFormatter
 
@@ -45,6 +58,13 @@ Runtime QEMU flags
     runner_args.add_argument('--qemu', help='Explicit path to QEMU executable')
     runner_args.add_argument('--inspect', help='Inspect content of runner archive', action='store_true')
     runner_args.add_argument('--derive', help='Create new runner based on current one', type=argparse.FileType('wb'))
+    runner_args.add_argument('--profile', metavar='name',
+                             help='Use given profile instead of one selected from kernel ELF header')
+    runner_args.add_argument('--check-capabilities', action='store_true',
+                             help='Check options, machine, devices and CPU against ones supported by QEMU '
+                                  'before launching it (QEMU is probed once, results are cached)')
+    runner_args.add_argument('--capability-cache', metavar='dir',
+                             help='Directory with cached QEMU capabilities (default: per-user cache directory)')
 
     derive_args = parser.add_argument_group('Deriving runner with --derive')
     derive_args.add_argument('--layers', nargs='+', default=[])
@@ -61,6 +81,41 @@ still use QEMU search rules from base QEMU runner.
     qemu_args.add_argument('--halted', action='store_true', help='Halt machine on startup')
     qemu_args.add_argument('--debug', action='store_true', help='Enable QEMU gdbserver')
     qemu_args.add_argument('--debug-listen', help='QEMU gdbserver listen address', metavar='device')
+    qemu_args.add_argument('--debug-wait', action='store_true',
+                           help='Wait until gdbserver accepts connections and report it on stderr; implies --halted '
+                                'as probing gdbserver pauses machine (requires --debug)')
+    qemu_args.add_argument('--debug-attach', metavar='command',
+                           help='Wait until gdbserver accepts connections, then start given debugger with kernel '
+                                'connected to it; QEMU is stopped when debugger exits, implies --halted '
+                                '(requires --debug)')
+    qemu_args.add_argument('--debug-timeout', metavar='seconds', type=float,
+                           help='Time limit for gdbserver to become ready (default: 30)')
+
+    qemu_args.add_argument('--drive-overlays', action='store_true',
+                           help='Run on temporary copy-on-write overlays of images used by [drive] sections')
+
+    snapshot_args = parser.add_argument_group('Booting from snapshot')
+    snapshot_args.add_argument('--snapshot-dir', metavar='dir',
+                               help='Directory with VM snapshots, restore machine state from snapshot matching '
+                                    'effective configuration instead of booting')
+    snapshot_args.add_argument('--snapshot-marker', metavar='text',
+                               help='Console output marking checkpoint at which snapshot is saved '
+                                    '(used when no snapshot exists yet)')
+
+    cache_args = parser.add_argument_group('Caching results')
+    cache_args.add_argument('--result-cache', metavar='dir',
+                            help='Replay output of previous successful run (exit code 0) with identical layers, '
+                                 'QEMU, kernel and arguments from cache in specified directory')
+    cache_args.add_argument('--result-cache-max-age', metavar='seconds', type=float,
+                            help='Ignore and evict cached results older than specified age')
+    cache_args.add_argument('--result-cache-max-size', metavar='size', type=make_size,
+                            help='Evict least recently used results when cache grows over specified size '
+                                 '(K, M, G suffixes allowed)')
+
+    zygote_args = parser.add_argument_group('Zygote')
+    zygote_args.add_argument('--zygote', metavar='socket',
+                             help='Preload layers and QEMU location, then serve launch requests on Unix socket. '
+                                  'Runner started with QEMU_RUNNER_ZYGOTE=socket launches QEMU through it')
 
     program_args = parser.add_argument_group('Program arguments')
     program_args.add_argument('--dry-run', action='store_true', help='Do not execute QEMU, just output command line')
@@ -70,69 +125,218 @@ still use QEMU search rules from base QEMU runner.
     return parser
 
 
-def make_layer_from_args(args: argparse.Namespace) -> 'Layer':
-    from qemu_runner.layer import GeneralSettings, Layer
-    general = GeneralSettings(
-        kernel=args.kernel,
-        kernel_cmdline=' '.join(args.arguments),
-        gdb=args.debug,
-        gdb_dev=args.debug_listen,
+FAST_PATH_FLAGS = {
+    '--halted': 'halted',
+    '--debug': 'debug',
+    '--dry-run': 'dry_run',
+}
+
+FAST_PATH_OPTIONS = {
+    '--qemu': 'qemu',
+    '--qemu-dir': 'qemu_dir',
+    '--profile': 'profile',
+}
+
+# Must match defaults of parser created by make_arg_parser
+FAST_PATH_DEFAULTS = {
+    'qemu_dir': None,
+    'qemu': None,
+    'inspect': False,
+    'derive': None,
+    'profile': None,
+    'check_capabilities': False,
+    'capability_cache': None,
+    'track_qemu': False,
+    'halted': False,
+    'debug': False,
+    'debug_listen': None,
+    'debug_wait': False,
+    'debug_attach': None,
+    'debug_timeout': None,
+    'drive_overlays': False,
+    'snapshot_dir': None,
+    'snapshot_marker': None,
+    'result_cache': None,
+    'result_cache_max_age': None,
+    'result_cache_max_size': None,
+    'zygote': None,
+    'dry_run': False,
+    'kernel': None,
+}
+
+
+# Parses the most common invocation (`[flags] kernel args...`) without building argparse parser.
+# Returns None for anything else, caller should fall back to parser created by make_arg_parser.
+def parse_args_fast(args: List[str]) -> Optional[SimpleNamespace]:
+    if '--' in args:
+        return None
+
+    values = dict(FAST_PATH_DEFAULTS, layers=[], arguments=[])
+
+    i = 0
+    while i < len(args):
+        arg = args[i]
+
+        if arg in FAST_PATH_FLAGS:
+            values[FAST_PATH_FLAGS[arg]] = True
+            i += 1
+            continue
+
+        name, has_value, value = arg.partition('=')
+        if name in FAST_PATH_OPTIONS:
+            if not has_value:
+                i += 1
+                if i >= len(args) or args[i].startswith('-'):
+                    return None
+                value = args[i]
+
+            values[FAST_PATH_OPTIONS[name]] = value
+            i += 1
+            continue
+
+        if arg == '' or arg.startswith('-'):
+            return None
+
+        values['kernel'] = make_path_absolute(arg)
+        values['arguments'] = args[i + 1:]
+        break
+
+    return SimpleNamespace(**values)
+
+
+def parse_runner_args(args: List[str]) -> Union['argparse.Namespace', SimpleNamespace]:
+    parsed_args = parse_args_fast(args)
+    if parsed_args is not None:
+        return parsed_args
+
+    return make_arg_parser().parse_args(args)
+
+
+def make_layer_from_args(args: 'argparse.Namespace') -> 'Layer':
+    from qemu_runner.api import RunFlags, make_invocation_layer
+    flags = RunFlags(
         halted=args.halted,
+        debug=args.debug,
+        debug_listen=args.debug_listen,
     )
-    return Layer(general=general)
+    return make_invocation_layer(args.kernel, args.arguments, flags)
 
 
-def build_qemu_command_line(
-        *,
-        embedded_layers: List[str],
-        additional_script_bases: List[str],
-        additional_search_paths: List[str],
-        args: argparse.Namespace,
-        additional_qemu_args: str) -> List[str]:
-    from qemu_runner.layer_locator import load_layer
-    layer_contents = [load_layer(
-        layer,
-        packages=['embedded_layers']
-    ) for layer in embedded_layers]
+def load_embedded_layer(profile: Optional[str] = None) -> 'Layer':
+    # Embedded layers were validated and combined when runner was made
+    import pkgutil
+    from qemu_runner.layer_binary import load_layer_binary, LayerFormatError
+    from qemu_runner.layer_locator import COMBINED_LAYER_NAME, COMBINED_BINARY_LAYER_NAME
 
-    from qemu_runner.layer import Layer
-    combined_layer = Layer()
+    layer_dir = f'layers/profiles/{profile}' if profile is not None else 'layers'
+
+    try:
+        return load_layer_binary(pkgutil.get_data('embedded_layers', f'{layer_dir}/{COMBINED_BINARY_LAYER_NAME}'))
+    except (OSError, LayerFormatError):
+        # Binary form is missing or was written by incompatible version, INI text is always there
+        pass
+
+    from qemu_runner.layer_parser import parse_layer_text
+    layer_name = f'{layer_dir}/{COMBINED_LAYER_NAME}'
+    return parse_layer_text(pkgutil.get_data('embedded_layers', layer_name).decode('utf-8'), source=layer_name)
+
+
+def build_effective_layer(args: 'argparse.Namespace', profile: Optional[str] = None) -> 'Layer':
+    return load_embedded_layer(profile).apply(make_layer_from_args(args))
+
+
+def select_runner_profile(profiles: Mapping[str, List[str]], profile_matches: Mapping[str, Dict[str, Union[int, str]]],
+                          args: 'argparse.Namespace') -> str:
+    from qemu_runner.profile import select_profile, ProfileError
+
+    if args.profile is not None:
+        if args.profile not in profiles:
+            print(f'qemu-runner: Unknown profile {args.profile}, available profiles: {", ".join(profiles)}',
+                  file=sys.stderr)
+            sys.exit(1)
+
+        return args.profile
+
+    try:
+        profile = select_profile(args.kernel, list(profiles), profile_matches)
+    except ProfileError as e:
+        print(f'qemu-runner: {e}', file=sys.stderr)
+        sys.exit(1)
 
-    for layer_content in layer_contents:
-        parser = ConfigParser()
-        parser.read_string(layer_content)
-        from qemu_runner.layer import parse_layer
-        layer = parse_layer(parser)
-        combined_layer = combined_layer.apply(layer)
+    if profile is None:
+        print(f'qemu-runner: No profile matches kernel {args.kernel}, available profiles: {", ".join(profiles)}',
+              file=sys.stderr)
+        sys.exit(1)
 
-    args_layer = make_layer_from_args(args)
+    return profile
 
-    combined_layer = combined_layer.apply(args_layer)
 
-    def do_find_qemu(engine: str) -> Optional[Path]:
+def runner_script_path(runner_archive: Optional[str]) -> str:
+    # Runner extracted to cache still looks for QEMU relative to location of archive
+    if runner_archive is None:
+        return __file__
+
+    return os.path.join(runner_archive, 'qemu_runner', 'make_runner', 'runner.py')
+
+
+def runner_directory(runner_archive: Optional[str]) -> Optional[str]:
+    if runner_archive is None:
+        return None
+
+    return os.path.dirname(os.path.abspath(runner_archive))
+
+
+def build_command_line_for_layer(
+        layer: 'Layer',
+        *,
+        additional_script_bases: List[str],
+        additional_search_paths: List[str],
+        args: 'argparse.Namespace',
+        additional_qemu_args: str,
+        runner_script: str = __file__,
+        runner_dir: Optional[str] = None) -> List[str]:
+    def do_find_qemu(engine: str) -> Optional['Path']:
         if args.qemu:
+            from pathlib import Path
             return Path(args.qemu)
 
         from qemu_runner import find_qemu
         return find_qemu(
             engine=engine,
-            script_paths=[__file__] + additional_script_bases,
+            script_paths=[runner_script] + additional_script_bases,
             search_paths=additional_search_paths + ([args.qemu_dir] if args.qemu_dir else [])
         )
 
     from qemu_runner.layer import build_command_line
-    full_cmdline = build_command_line(combined_layer, find_qemu_func=do_find_qemu)
+    full_cmdline = build_command_line(layer, find_qemu_func=do_find_qemu, runner_dir=runner_dir)
 
     result = list(full_cmdline)
 
     if additional_qemu_args != '':
+        import shlex
         user_qemu_args = shlex.split(additional_qemu_args, posix=sys.platform != 'win32')
         result = [result[0], *user_qemu_args, *result[1:]]
 
     return result
 
 
+def check_capabilities(layer: 'Layer', qemu_path: str, args: 'argparse.Namespace') -> None:
+    from qemu_runner.capabilities import load_capabilities, check_layer, CapabilityError
+    try:
+        problems = check_layer(layer, load_capabilities(qemu_path, args.capability_cache))
+    except CapabilityError as e:
+        print(f'qemu-runner: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    for problem in problems:
+        print(f'qemu-runner: {problem}', file=sys.stderr)
+
+    if problems:
+        sys.exit(1)
+
+
 def execute_process(command_line: List[str]) -> None:
+    import subprocess
     try:
         cp = subprocess.run(command_line)
         sys.exit(cp.returncode)
@@ -140,30 +344,181 @@ def execute_process(command_line: List[str]) -> None:
         raise
 
 
-def make_derived_runner(embedded_layers: List[str], additional_search_paths: List[str], args: argparse.Namespace) -> None:
-    from qemu_runner.make_runner.make import make_runner, load_layers_from_all_search_paths
+def enter_drive_overlays(stack: 'ExitStack', layer: 'Layer', qemu_path: str,
+                         runner_dir: Optional[str] = None) -> 'Layer':
+    from qemu_runner.overlay import drive_overlays, find_qemu_img, QemuImgError
+    try:
+        return stack.enter_context(drive_overlays(layer, find_qemu_img(qemu_path), runner_dir=runner_dir))
+    except QemuImgError as e:
+        print(f'qemu-runner: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+def execute_with_gdbserver(command_line: List[str], layer: 'Layer', args: 'argparse.Namespace') -> None:
+    from qemu_runner.gdb import run_with_gdbserver, GdbError, DEFAULT_READY_TIMEOUT
+    try:
+        returncode = run_with_gdbserver(
+            command_line,
+            layer.general.gdb_dev,
+            kernel=layer.general.kernel,
+            gdb_command=args.debug_attach,
+            timeout=args.debug_timeout if args.debug_timeout is not None else DEFAULT_READY_TIMEOUT
+        )
+    except GdbError as e:
+        print(f'qemu-runner: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    sys.exit(returncode)
+
+
+def execute_from_snapshot(command_line: List[str], layer: 'Layer', args: 'argparse.Namespace') -> None:
+    from qemu_runner.snapshot import run_with_snapshot, SnapshotError
+    from qemu_runner.overlay import QemuImgError
+    try:
+        returncode = run_with_snapshot(command_line, layer, args.snapshot_dir, args.snapshot_marker)
+    except (SnapshotError, QemuImgError) as e:
+        print(f'qemu-runner: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    sys.exit(returncode)
+
+
+def execute_with_result_cache(command_line: List[str], layer: 'Layer', args: 'argparse.Namespace') -> None:
+    from qemu_runner.result_cache import ResultCache, make_result_key, run_and_capture
+    cache = ResultCache(args.result_cache, max_age=args.result_cache_max_age, max_size=args.result_cache_max_size)
+    key = make_result_key(layer, command_line)
+
+    result = cache.get(key)
+    if result is not None:
+        sys.stdout.buffer.write(result.stdout)
+        sys.stderr.buffer.write(result.stderr)
+        sys.exit(result.returncode)
+
+    result = run_and_capture(command_line)
+    if result.returncode == 0:
+        # Failure can be flaky (or process killed by signal), replaying it would hide every following success
+        cache.put(key, result)
+
+    sys.exit(result.returncode)
+
+
+def serve_zygote(additional_script_bases: List[str], additional_search_paths: List[str],
+                 args: 'argparse.Namespace', runner_archive: Optional[str], profiles: Mapping[str, List[str]]) -> None:
+    import signal
+    from qemu_runner.api import Runner, RunFlags
+    from qemu_runner.zygote import serve, ZygoteError
+
+    def make_runner(profile: Optional[str]) -> Runner:
+        return Runner(
+            load_embedded_layer(profile),
+            script_paths=[runner_script_path(runner_archive)] + additional_script_bases,
+            search_paths=additional_search_paths,
+            runner_dir=runner_directory(runner_archive)
+        )
+
+    runner = make_runner(None)
+    profile_runners = {profile: make_runner(profile) for profile in profiles}
+
+    # Leave through finally blocks so socket file is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    try:
+        serve(args.zygote, runner, RunFlags(qemu=args.qemu, qemu_dir=args.qemu_dir), profiles=profile_runners)
+    except ZygoteError as e:
+        print(f'qemu-runner: {e}', file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+def execute_via_zygote(socket_path: str, args: 'argparse.Namespace', profile: Optional[str],
+                       before_launch: Optional[Callable[[], None]] = None) -> None:
+    import shlex
+    from qemu_runner.api import RunFlags
+    from qemu_runner.zygote import launch_via_zygote, ZygoteError
+
+    flags = RunFlags(
+        halted=args.halted,
+        debug=args.debug,
+        debug_listen=args.debug_listen,
+        qemu=args.qemu,
+        qemu_dir=args.qemu_dir,
+        qemu_args=shlex.split(os.environ.get('QEMU_FLAGS', ''))
+    )
+
+    try:
+        # before_launch is called only once request reached zygote, otherwise QEMU is launched directly and calls it
+        returncode = launch_via_zygote(socket_path, args.kernel, args.arguments, flags, profile=profile,
+                                       before_wait=before_launch)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # Zygote is not running, launch QEMU directly
+        return
+    except ZygoteError as e:
+        print(f'qemu-runner: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    sys.exit(returncode)
+
+
+def make_derived_runner(embedded_layers: List[str], additional_search_paths: List[str], args: 'argparse.Namespace',
+                        runner_archive: Optional[str] = None, extract_once: bool = False,
+                        profiles: Optional[Mapping[str, List[str]]] = None,
+                        profile_matches: Optional[Mapping[str, Dict[str, Union[int, str]]]] = None) -> None:
+    from qemu_runner.make_runner.make import make_runner, load_layers_from_all_search_paths, read_shebang, \
+        LayerValidationError, Profile
     from qemu_runner.layer_locator import load_layer
     base_layers = [load_layer(
         layer,
         packages=['embedded_layers']
     ) for layer in embedded_layers]
+    base_layer_names = [f'embedded_layers/{layer}' for layer in embedded_layers]
 
     additional_layers = load_layers_from_all_search_paths(args.layers)
 
+    if profiles:
+        # Derived layers go on top of each profile, base layers are shared
+        derived_profiles = [
+            Profile(
+                name=name,
+                layer_contents=[load_layer(layer, packages=['embedded_layers']) for layer in layers] + additional_layers,
+                layer_names=[f'embedded_layers/{layer}' for layer in layers] + args.layers,
+                match=dict((profile_matches or {}).get(name, {}))
+            )
+            for name, layers in profiles.items()
+        ]
+    else:
+        base_layers += additional_layers
+        base_layer_names += args.layers
+        derived_profiles = []
+
     if args.track_qemu:
-        base_script_paths: List[str] = [__file__]
+        base_script_paths: List[str] = [runner_script_path(runner_archive)]
     else:
         base_script_paths = []
 
     if args.qemu_dir:
         additional_search_paths.append(args.qemu_dir)
 
-    make_runner(
-        args.derive,
-        layer_contents=base_layers + additional_layers,
-        additional_script_bases=base_script_paths,
-        additional_search_paths=additional_search_paths
-    )
+    # Derived runner starts the same way as its base
+    base_archive = runner_archive or getattr(__loader__, 'archive', None)
+
+    try:
+        make_runner(
+            args.derive,
+            layer_contents=base_layers,
+            additional_script_bases=base_script_paths,
+            additional_search_paths=additional_search_paths,
+            shebang=read_shebang(base_archive) if base_archive else None,
+            extract_once=extract_once,
+            layer_names=base_layer_names,
+            profiles=derived_profiles
+        )
+    except LayerValidationError as e:
+        args.derive.close()
+        if os.path.isfile(args.derive.name):
+            os.unlink(args.derive.name)
+        print(f'qemu-runner: {e}', file=sys.stderr)
+        sys.exit(1)
 
 
 def make_layer_printer():
@@ -178,7 +533,7 @@ def make_layer_printer():
         return lambda s: print(s)
 
 
-def inspect_runner(embedded_layers: List[str]) -> None:
+def inspect_runner(embedded_layers: List[str], profiles: Optional[Mapping[str, List[str]]] = None) -> None:
     from qemu_runner.layer_locator import load_layer
     layers = [(layer, load_layer(
         layer,
@@ -192,50 +547,148 @@ def inspect_runner(embedded_layers: List[str]) -> None:
         print_ini(layer.strip())
         print()
 
+    from qemu_runner.layer import format_layer
+    print('# Combined layer:')
+    print_ini(format_layer(load_embedded_layer()).strip())
+    print()
+
+    for profile, profile_layers in (profiles or {}).items():
+        for layer_name in profile_layers:
+            print(f'# Profile {profile}, layer embedded_layers/{layer_name}:')
+            print_ini(load_layer(layer_name, packages=['embedded_layers']).strip())
+            print()
+
+        print(f'# Profile {profile}, combined layer:')
+        print_ini(format_layer(load_embedded_layer(profile)).strip())
+        print()
 
-def execute_runner(embedded_layers: List[str], additional_script_bases: List[str], additional_search_paths: List[str], args: List[str]) -> None:
-    arg_parser = make_arg_parser()
 
+def execute_runner(embedded_layers: List[str], additional_script_bases: List[str], additional_search_paths: List[str], args: List[str],
+                   runner_archive: Optional[str] = None, extract_once: bool = False,
+                   profiles: Optional[Dict[str, List[str]]] = None,
+                   profile_matches: Optional[Dict[str, Dict[str, Union[int, str]]]] = None,
+                   before_launch: Optional[Callable[[], None]] = None) -> None:
+    # before_launch is called when runner is done and QEMU is about to be started (used by QEMU_RUNNER_PROFILE)
     env_runner_args = os.environ.get('QEMU_RUNNER_FLAGS', '')
     if env_runner_args != '':
+        import shlex
         splitted_args = shlex.split(env_runner_args, posix=sys.platform != 'win32')
         args = [*splitted_args, *args]
 
-    parsed_args = arg_parser.parse_args(args)
+    parsed_args = parse_runner_args(args)
+
+    def error(message: str) -> NoReturn:
+        make_arg_parser().error(message)
 
     if parsed_args.derive and parsed_args.inspect:
-        arg_parser.error('--derive and --inspect cannot be used together')
+        error('--derive and --inspect cannot be used together')
 
     if parsed_args.derive and parsed_args.kernel:
-        arg_parser.error('--derive and kernel cannot be used together')
+        error('--derive and kernel cannot be used together')
 
     if parsed_args.inspect and parsed_args.kernel:
-        arg_parser.error('--inspect and kernel cannot be used together')
+        error('--inspect and kernel cannot be used together')
 
     if parsed_args.derive and parsed_args.dry_run:
-        arg_parser.error('--derive and QEMU arguments cannot be used together')
+        error('--derive and QEMU arguments cannot be used together')
 
     if parsed_args.inspect and parsed_args.dry_run:
-        arg_parser.error('--derive and --dry-run cannot be used together')
+        error('--derive and --dry-run cannot be used together')
+
+    if parsed_args.zygote and (parsed_args.derive or parsed_args.inspect or parsed_args.kernel or parsed_args.dry_run):
+        error('--zygote cannot be used with kernel, --derive, --inspect or --dry-run')
+
+    if parsed_args.zygote and sys.platform == 'win32':
+        error('--zygote requires Unix sockets which are not available on Windows')
+
+    if not parsed_args.inspect and not parsed_args.derive and not parsed_args.zygote and (not parsed_args.kernel and not parsed_args.dry_run):
+        error('Specify action to perform: kernel, --derive or --inspect')
+
+    if parsed_args.snapshot_dir and parsed_args.dry_run:
+        error('--snapshot-dir and --dry-run cannot be used together')
 
-    if not parsed_args.inspect and not parsed_args.derive and (not parsed_args.kernel and not parsed_args.dry_run):
-        arg_parser.error('Specify action to perform: kernel, --derive or --inspect')
+    if parsed_args.result_cache and (parsed_args.halted or parsed_args.debug):
+        error('--result-cache cannot be used with --halted or --debug')
+
+    if parsed_args.result_cache and parsed_args.snapshot_dir:
+        error('--result-cache and --snapshot-dir cannot be used together')
+
+    if parsed_args.result_cache and parsed_args.drive_overlays:
+        # Overlay paths are random, command line (part of cache key) would never repeat
+        error('--result-cache and --drive-overlays cannot be used together')
+
+    wait_for_debugger = parsed_args.debug_wait or parsed_args.debug_attach is not None
+
+    if (wait_for_debugger or parsed_args.debug_timeout is not None) and not parsed_args.debug:
+        error('--debug-wait, --debug-attach and --debug-timeout require --debug')
+
+    if parsed_args.debug_wait and parsed_args.debug_attach is not None:
+        error('--debug-wait and --debug-attach cannot be used together')
+
+    if wait_for_debugger and (parsed_args.snapshot_dir or parsed_args.zygote):
+        error('--debug-wait and --debug-attach cannot be used with --snapshot-dir or --zygote')
+
+    if wait_for_debugger:
+        # Readiness probe connects to gdbserver, which pauses machine anyway. Starting it halted makes sure no code
+        # runs before debugger is attached, instead of stopping it at random point.
+        parsed_args.halted = True
+
+    if parsed_args.profile is not None and not profiles:
+        error('--profile cannot be used, runner has no profiles')
 
     if parsed_args.derive:
-        make_derived_runner(embedded_layers, additional_search_paths, parsed_args)
+        make_derived_runner(embedded_layers, additional_search_paths, parsed_args,
+                            runner_archive=runner_archive, extract_once=extract_once,
+                            profiles=profiles, profile_matches=profile_matches)
     elif parsed_args.inspect:
-        inspect_runner(embedded_layers)
+        inspect_runner(embedded_layers, profiles)
+    elif parsed_args.zygote:
+        serve_zygote(additional_script_bases, additional_search_paths, parsed_args, runner_archive, profiles or {})
     else:
-        cmdline = build_qemu_command_line(
-            embedded_layers=embedded_layers,
-            additional_script_bases=additional_script_bases,
-            additional_search_paths=additional_search_paths,
-            args=parsed_args,
-            additional_qemu_args=os.environ.get('QEMU_FLAGS', '')
-        )
+        zygote_socket = os.environ.get('QEMU_RUNNER_ZYGOTE', '')
+        plain_run = not (parsed_args.dry_run or parsed_args.drive_overlays or parsed_args.snapshot_dir
+                         or parsed_args.result_cache or parsed_args.check_capabilities or wait_for_debugger)
+        profile = select_runner_profile(profiles, profile_matches or {}, parsed_args) if profiles else None
+
+        if zygote_socket and plain_run and sys.platform != 'win32':
+            execute_via_zygote(zygote_socket, parsed_args, profile, before_launch)
+        effective_layer = build_effective_layer(parsed_args, profile)
+
+        def make_command_line(layer: 'Layer') -> List[str]:
+            return build_command_line_for_layer(
+                layer,
+                additional_script_bases=additional_script_bases,
+                additional_search_paths=additional_search_paths,
+                args=parsed_args,
+                additional_qemu_args=os.environ.get('QEMU_FLAGS', ''),
+                runner_script=runner_script_path(runner_archive),
+                runner_dir=runner_directory(runner_archive)
+            )
+
+        cmdline = make_command_line(effective_layer)
+
+        if parsed_args.check_capabilities:
+            check_capabilities(effective_layer, cmdline[0], parsed_args)
 
         if parsed_args.dry_run:
+            import shlex
             print(shlex.join(cmdline))
             sys.exit(0)
-        else:
-            execute_process(cmdline)
+
+        from contextlib import ExitStack
+        with ExitStack() as stack:
+            if parsed_args.drive_overlays:
+                cmdline = make_command_line(enter_drive_overlays(stack, effective_layer, cmdline[0],
+                                                                 runner_directory(runner_archive)))
+
+            if before_launch is not None:
+                before_launch()
+
+            if parsed_args.snapshot_dir:
+                execute_from_snapshot(cmdline, effective_layer, parsed_args)
+            elif parsed_args.result_cache:
+                execute_with_result_cache(cmdline, effective_layer, parsed_args)
+            elif wait_for_debugger:
+                execute_with_gdbserver(cmdline, effective_layer, parsed_args)
+            else:
+                execute_process(cmdline)
@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional, Iterator, Mapping
+
+from .argument import ArgumentValue
+from .layer import Layer, make_variable_resolver_for_layer
+
+__all__ = [
+    'QemuImgError',
+    'find_qemu_img',
+    'create_image',
+    'create_overlay',
+    'image_format',
+    'overlay_directory',
+    'drive_overlays',
+]
+
+
+class QemuImgError(Exception):
+    pass
+
+
+def find_qemu_img(qemu_path: Optional[str] = None) -> str:
+    if qemu_path is not None:
+        exts = os.environ.get('PATHEXT', '').split(os.path.pathsep)
+        for e in exts:
+            candidate = Path(qemu_path).parent / f'qemu-img{e}'
+            if candidate.exists():
+                return str(candidate)
+
+    return shutil.which('qemu-img') or 'qemu-img'
+
+
+def _run_qemu_img(qemu_img: str, args: List[str]) -> str:
+    cp = subprocess.run(
+        [qemu_img, *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding='utf-8'
+    )
+
+    if cp.returncode != 0:
+        raise QemuImgError(f'{qemu_img} {args[0]} failed: {cp.stderr.strip()}')
+
+    return cp.stdout
+
+
+def create_image(qemu_img: str, path: str, size: str) -> None:
+    _run_qemu_img(qemu_img, ['create', '-q', '-f', 'qcow2', path, size])
+
+
+def create_overlay(qemu_img: str, backing_file: str, overlay: str, backing_format: str = 'qcow2') -> None:
+    _run_qemu_img(qemu_img, [
+        'create', '-q',
+        '-f', 'qcow2',
+        '-F', backing_format,
+        '-b', os.path.abspath(backing_file),
+        overlay
+    ])
+
+
+def image_format(qemu_img: str, path: str) -> str:
+    info = json.loads(_run_qemu_img(qemu_img, ['info', '--output=json', path]))
+    return info['format']
+
+
+def overlay_directory() -> str:
+    candidates = [os.environ.get('XDG_RUNTIME_DIR', ''), '/dev/shm']
+
+    for d in candidates:
+        if d != '' and os.path.isdir(d) and os.access(d, os.W_OK):
+            return d
+
+    return tempfile.gettempdir()
+
+
+def _is_enabled(attributes: Mapping[str, ArgumentValue], name: str) -> bool:
+    if name not in attributes:
+        return False
+
+    # Bare boolean option (`readonly` without value) is rendered as `readonly` which QEMU takes as on
+    value = attributes[name]
+    return value is None or str(value).lower() in ('on', 'yes', 'true')
+
+
+def _needs_overlay(attributes: Mapping[str, ArgumentValue]) -> bool:
+    if 'file' not in attributes:
+        return False
+
+    return not _is_enabled(attributes, 'readonly') and not _is_enabled(attributes, 'snapshot')
+
+
+@contextmanager
+def drive_overlays(layer: Layer, qemu_img: str, directory: Optional[str] = None,
+                   runner_dir: Optional[str] = None) -> Iterator[Layer]:
+    resolver = make_variable_resolver_for_layer(layer, runner_dir)
+    run_dir = tempfile.mkdtemp(prefix='qemu-runner-', dir=directory or overlay_directory())
+
+    try:
+        arguments = []
+
+        for i, arg in enumerate(layer.arguments):
+            if arg.name != 'drive' or not _needs_overlay(arg.attributes):
+                arguments.append(arg)
+                continue
+
+            base_image = os.path.abspath(resolver(arg.attributes['file']))
+            base_format = arg.attributes.get('format', None) or image_format(qemu_img, base_image)
+            overlay = os.path.join(run_dir, f'{i}-{os.path.basename(base_image)}.qcow2')
+            create_overlay(qemu_img, base_image, overlay, base_format)
+
+            new_values = {'file': overlay, 'format': 'qcow2'}
+            if arg.id_value is not None:
+                new_values['id'] = arg.id_value
+
+            arguments.append(arg.update_arguments(new_values))
+
+        yield Layer(general=layer.general, arguments=arguments)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
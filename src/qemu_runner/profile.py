@@ -0,0 +1,108 @@
+import re
+from typing import Dict, Mapping, Optional, Sequence, Union
+
+from .elf import ELF_MACHINES, ElfError, ElfInfo, read_elf_info
+
+__all__ = [
+    'ProfileError',
+    'PROFILE_MARKER_SECTION',
+    'validate_profile_name',
+    'parse_profile_match',
+    'profile_matches',
+    'select_profile',
+]
+
+# Kernel can name its profile explicitly with string placed in this section
+PROFILE_MARKER_SECTION = '.qemu_runner_profile'
+
+PROFILE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+ELF_CLASS_VALUES = (32, 64)
+ELF_ENDIAN_VALUES = ('little', 'big')
+
+ProfileMatch = Dict[str, Union[int, str]]
+
+
+class ProfileError(Exception):
+    pass
+
+
+def validate_profile_name(name: str) -> str:
+    if not PROFILE_NAME_PATTERN.match(name):
+        raise ProfileError(f'Invalid profile name {name!r}, use letters, digits, "_", "." and "-" only')
+
+    return name
+
+
+def _parse_machine(value: str) -> int:
+    if value.isdigit():
+        return int(value)
+
+    if value.lower() not in ELF_MACHINES:
+        raise ProfileError(f'Unknown ELF machine {value!r}, use number or one of: {", ".join(sorted(ELF_MACHINES))}')
+
+    return ELF_MACHINES[value.lower()]
+
+
+def parse_profile_match(text: str) -> ProfileMatch:
+    result: ProfileMatch = {}
+
+    for item in text.split(','):
+        key, has_value, value = item.partition('=')
+        key = key.strip().lower()
+        value = value.strip()
+
+        if not has_value or value == '':
+            raise ProfileError(f'Expected key=value in profile match, got {item!r}')
+
+        if key == 'machine':
+            result[key] = _parse_machine(value)
+        elif key == 'class':
+            if not value.isdigit() or int(value) not in ELF_CLASS_VALUES:
+                raise ProfileError(f'ELF class must be one of {ELF_CLASS_VALUES}, got {value!r}')
+            result[key] = int(value)
+        elif key == 'endian':
+            if value.lower() not in ELF_ENDIAN_VALUES:
+                raise ProfileError(f'ELF endianness must be one of {ELF_ENDIAN_VALUES}, got {value!r}')
+            result[key] = value.lower()
+        else:
+            raise ProfileError(f'Unknown profile match key {key!r}, use machine, class or endian')
+
+    return result
+
+
+def profile_matches(info: ElfInfo, match: Mapping[str, Union[int, str]]) -> bool:
+    actual = {
+        'machine': info.machine,
+        'class': info.elf_class,
+        'endian': info.endian,
+    }
+    return all(actual.get(key) == value for key, value in match.items())
+
+
+def select_profile(kernel: Optional[str],
+                   profile_names: Sequence[str],
+                   matches: Mapping[str, Mapping[str, Union[int, str]]]) -> Optional[str]:
+    if kernel is None:
+        return None
+
+    try:
+        info = read_elf_info(kernel, PROFILE_MARKER_SECTION)
+    except FileNotFoundError:
+        return None
+    except (OSError, ElfError, UnicodeDecodeError) as e:
+        raise ProfileError(f'Cannot read ELF header of {kernel}: {e}')
+
+    if info is None:
+        return None
+
+    if info.marker:
+        if info.marker not in profile_names:
+            raise ProfileError(f'Kernel {kernel} requests unknown profile {info.marker!r}')
+        return info.marker
+
+    for name in profile_names:
+        match = matches.get(name)
+        if match and profile_matches(info, match):
+            return name
+
+    return None
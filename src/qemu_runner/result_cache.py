@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, IO, Tuple
+
+from .hashing import hash_file, file_identity
+from .layer import Layer, fingerprint_layer
+
+__all__ = [
+    'CachedResult',
+    'ResultCache',
+    'parse_size',
+    'make_result_key',
+    'run_and_capture',
+]
+
+RESULT_SUFFIX = '.result'
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+@dataclass(frozen=True)
+class CachedResult:
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+
+
+def parse_size(value: str) -> int:
+    value = value.strip()
+    multiplier = SIZE_SUFFIXES.get(value[-1:].upper(), None)
+    size = int(value[:-1]) * multiplier if multiplier is not None else int(value)
+    if size < 0:
+        raise ValueError(f'Size must not be negative: {value}')
+
+    return size
+
+
+def make_result_key(layer: Layer, command_line: List[str]) -> str:
+    if os.path.exists(command_line[0]):
+        qemu_identity: Optional[Tuple[str, int, int]] = file_identity(command_line[0])
+    else:
+        qemu_identity = None
+
+    if layer.general.kernel and os.path.exists(layer.general.kernel):
+        kernel_hash: Optional[str] = hash_file(layer.general.kernel)
+    else:
+        kernel_hash = None
+
+    key = (fingerprint_layer(layer), qemu_identity, kernel_hash, command_line)
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: str, max_age: Optional[float] = None, max_size: Optional[int] = None):
+        self._directory = directory
+        self._max_age = max_age
+        self._max_size = max_size
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._directory, key + RESULT_SUFFIX)
+
+    def _is_expired(self, mtime: float, now: float) -> bool:
+        return self._max_age is not None and now - mtime > self._max_age
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        path = self._entry_path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                if self._is_expired(mtime, time.time()):
+                    return None
+
+                header = json.loads(f.readline())
+                stdout = f.read(header['stdout'])
+                stderr = f.read(header['stderr'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if len(stdout) != header['stdout'] or len(stderr) != header['stderr']:
+            return None
+
+        # Modification time marks when result was stored (for max age), access time is set explicitly on every hit
+        # (mounts with noatime do not update it) so eviction by size removes least recently used entries first
+        try:
+            os.utime(path, (time.time(), mtime))
+        except OSError:
+            pass
+
+        return CachedResult(returncode=header['returncode'], stdout=stdout, stderr=stderr)
+
+    def put(self, key: str, result: CachedResult) -> None:
+        os.makedirs(self._directory, exist_ok=True)
+
+        header = {
+            'returncode': result.returncode,
+            'stdout': len(result.stdout),
+            'stderr': len(result.stderr),
+        }
+
+        fd, pending = tempfile.mkstemp(dir=self._directory, prefix='.pending-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+                f.write(result.stdout)
+                f.write(result.stderr)
+
+            os.replace(pending, self._entry_path(key))
+        except BaseException:
+            os.unlink(pending)
+            raise
+
+        self.evict()
+
+    def evict(self) -> None:
+        now = time.time()
+        entries = []
+
+        for name in os.listdir(self._directory):
+            if not name.endswith(RESULT_SUFFIX):
+                continue
+
+            path = os.path.join(self._directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            if self._is_expired(st.st_mtime, now):
+                self._remove(path)
+            else:
+                entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+
+        if self._max_size is None:
+            return
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def _tee(source: IO[bytes], target: IO[bytes], captured: List[bytes]) -> None:
+    for chunk in iter(lambda: source.read1(65536), b''):
+        captured.append(chunk)
+        target.write(chunk)
+        target.flush()
+
+
+def run_and_capture(command_line: List[str]) -> CachedResult:
+    proc = subprocess.Popen(command_line, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    stdout: List[bytes] = []
+    stderr: List[bytes] = []
+    threads = [
+        threading.Thread(target=_tee, args=(proc.stdout, sys.stdout.buffer, stdout)),
+        threading.Thread(target=_tee, args=(proc.stderr, sys.stderr.buffer, stderr)),
+    ]
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    return CachedResult(returncode=proc.wait(), stdout=b''.join(stdout), stderr=b''.join(stderr))
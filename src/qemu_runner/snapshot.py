@@ -0,0 +1,176 @@
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+from typing import List, Optional, Tuple, Union
+
+from .layer import Layer, fingerprint_layer
+from .overlay import create_image, create_overlay, find_qemu_img
+
+__all__ = [
+    'SnapshotError',
+    'SNAPSHOT_TAG',
+    'snapshot_key',
+    'snapshot_drive_args',
+    'run_with_snapshot',
+]
+
+SNAPSHOT_TAG = 'qemu-runner'
+SNAPSHOT_DRIVE_ID = 'qemu-runner-snapshot'
+SNAPSHOT_IMAGE_SIZE = '1M'
+MONITOR_PROMPT = b'(qemu) '
+MONITOR_TIMEOUT = 120
+SNAPSHOT_READ_SIZE = 64 * 1024
+
+MonitorAddress = Union[str, Tuple[str, int]]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_key(layer: Layer) -> str:
+    key = hashlib.sha256(fingerprint_layer(layer).encode('utf-8'))
+
+    if layer.general.kernel and os.path.exists(layer.general.kernel):
+        st = os.stat(layer.general.kernel)
+        key.update(f'{st.st_size}:{st.st_mtime_ns}'.encode('utf-8'))
+
+    return key.hexdigest()
+
+
+def snapshot_drive_args(image: str) -> List[str]:
+    return ['-drive', f'if=none,id={SNAPSHOT_DRIVE_ID},format=qcow2,file={image}']
+
+
+def _free_tcp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _monitor_address(run_dir: str) -> Tuple[str, MonitorAddress]:
+    # Unix socket in private directory can't be taken by anyone else, unlike free TCP port probed before QEMU binds it
+    if hasattr(socket, 'AF_UNIX') and sys.platform != 'win32':
+        path = os.path.join(run_dir, 'monitor')
+        return f'unix:{path},server=on,wait=off', path
+
+    port = _free_tcp_port()
+    return f'tcp:127.0.0.1:{port},server=on,wait=off', ('127.0.0.1', port)
+
+
+def _connect_monitor(address: MonitorAddress) -> socket.socket:
+    if isinstance(address, tuple):
+        return socket.create_connection(address, timeout=MONITOR_TIMEOUT)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(MONITOR_TIMEOUT)
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+
+    return sock
+
+
+def _read_until_prompt(sock: socket.socket) -> bytes:
+    data = b''
+    while not data.endswith(MONITOR_PROMPT):
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+
+    return data
+
+
+def _save_vm(address: MonitorAddress) -> None:
+    with _connect_monitor(address) as sock:
+        _read_until_prompt(sock)
+        sock.sendall(f'savevm {SNAPSHOT_TAG}\n'.encode('utf-8'))
+        response = _read_until_prompt(sock)
+
+    if b'Error' in response:
+        raise SnapshotError(f'savevm failed: {response.decode("utf-8", errors="replace").strip()}')
+
+
+def _load_snapshot(command_line: List[str], image: str, qemu_img: str) -> int:
+    with tempfile.TemporaryDirectory(prefix='qemu-runner-') as run_dir:
+        overlay = os.path.join(run_dir, 'snapshot.qcow2')
+        create_overlay(qemu_img, image, overlay)
+        cp = subprocess.run([*command_line, *snapshot_drive_args(overlay), '-loadvm', SNAPSHOT_TAG])
+        return cp.returncode
+
+
+def _watch_marker(proc: subprocess.Popen, address: MonitorAddress, marker: str) -> bool:
+    marker_bytes = marker.encode('utf-8')
+    saved = False
+    watch_marker = True
+    # Marker can be split between chunks, tail of previous chunk is searched together with next one
+    tail = b''
+    out = sys.stdout.buffer
+
+    # Output is read in chunks, not lines, markers like `login: ` prompt are not followed by newline
+    for chunk in iter(lambda: proc.stdout.read1(SNAPSHOT_READ_SIZE), b''):
+        out.write(chunk)
+        out.flush()
+
+        if not watch_marker:
+            continue
+
+        window = tail + chunk
+        if marker_bytes in window:
+            watch_marker = False
+            try:
+                _save_vm(address)
+                saved = True
+            except (OSError, SnapshotError) as e:
+                print(f'qemu-runner: failed to save snapshot: {e}', file=sys.stderr)
+        else:
+            tail = window[len(window) - len(marker_bytes) + 1:] if len(marker_bytes) > 1 else b''
+
+    return saved
+
+
+def _create_snapshot(command_line: List[str], image: str, qemu_img: str, marker: str) -> int:
+    store_dir = os.path.dirname(image)
+    os.makedirs(store_dir, exist_ok=True)
+
+    fd, pending = tempfile.mkstemp(dir=store_dir, prefix='.pending-', suffix='.qcow2')
+    os.close(fd)
+
+    try:
+        create_image(qemu_img, pending, SNAPSHOT_IMAGE_SIZE)
+
+        with tempfile.TemporaryDirectory(prefix='qemu-runner-') as run_dir:
+            monitor, address = _monitor_address(run_dir)
+            proc = subprocess.Popen(
+                [*command_line, *snapshot_drive_args(pending), '-monitor', monitor],
+                stdout=subprocess.PIPE
+            )
+            saved = _watch_marker(proc, address, marker)
+            returncode = proc.wait()
+
+        if saved:
+            os.replace(pending, image)
+
+        return returncode
+    finally:
+        if os.path.exists(pending):
+            os.unlink(pending)
+
+
+def run_with_snapshot(command_line: List[str], layer: Layer, snapshot_dir: str, marker: Optional[str]) -> int:
+    image = os.path.join(snapshot_dir, f'{snapshot_key(layer)}.qcow2')
+    qemu_img = find_qemu_img(command_line[0])
+
+    if os.path.exists(image):
+        return _load_snapshot(command_line, image, qemu_img)
+
+    if marker is None:
+        raise SnapshotError(f'No snapshot for this configuration in {snapshot_dir}, specify marker to create one')
+
+    return _create_snapshot(command_line, image, qemu_img, marker)
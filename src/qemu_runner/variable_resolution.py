@@ -1,12 +1,24 @@
-from typing import Protocol, Mapping
+import os
+import re
+from typing import Protocol, Mapping, Callable, Optional, Dict
 
 __all__ = [
     'VariableResolver',
+    'VariableFactory',
+    'LazyVariables',
     'resolve_no_variables',
     'append_resolver',
     'make_resolver_from_dict',
+    'make_lazy_resolver',
 ]
 
+VARIABLE_PATTERN = re.compile(r'\$\{([^}]+)\}')
+# `${ENV:NAME}` is value of environment variable NAME
+ENVIRONMENT_PREFIX = 'ENV:'
+
+# Returns value of variable or None when it is not available, such variable is left unresolved
+VariableFactory = Callable[[], Optional[str]]
+
 
 class VariableResolver(Protocol):
     def __call__(self, value: str) -> str:
@@ -35,3 +47,35 @@ def make_resolver_from_dict(variables: Mapping[str, str]) -> VariableResolver:
         return result
 
     return resolver
+
+
+class LazyVariables:
+    # Each variable is computed when value referencing it is resolved for the first time and then remembered,
+    # so expensive ones cost nothing unless some layer uses them
+    def __init__(self, factories: Mapping[str, VariableFactory]):
+        self._factories = dict(factories)
+        self._values: Dict[str, Optional[str]] = {}
+
+    def get(self, name: str) -> Optional[str]:
+        if name not in self._values:
+            if name.startswith(ENVIRONMENT_PREFIX):
+                self._values[name] = os.environ.get(name[len(ENVIRONMENT_PREFIX):])
+            else:
+                factory = self._factories.get(name)
+                self._values[name] = factory() if factory is not None else None
+
+        return self._values[name]
+
+    def resolve(self, value: str) -> str:
+        if '${' not in value:
+            return value
+
+        def substitute(match: 're.Match') -> str:
+            variable = self.get(match.group(1))
+            return match.group(0) if variable is None else variable
+
+        return VARIABLE_PATTERN.sub(substitute, value)
+
+
+def make_lazy_resolver(factories: Mapping[str, VariableFactory]) -> VariableResolver:
+    return LazyVariables(factories).resolve
@@ -0,0 +1,298 @@
+import array
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, replace
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union, IO
+
+from .api import Runner, RunFlags
+
+__all__ = [
+    'ZygoteError',
+    'ZygoteServer',
+    'serve',
+    'launch_via_zygote',
+]
+
+STDIO_FD_COUNT = 3
+RECEIVE_CHUNK_SIZE = 65536
+TERMINATE_GRACE = 5.0
+SOCKET_MODE = 0o600
+# Signals received by client are passed to QEMU started on its behalf
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+FileDescriptor = Union[int, IO[Any]]
+
+
+class ZygoteError(Exception):
+    pass
+
+
+def _send_message(sock: socket.socket, message: Dict[str, Any], fds: Sequence[int] = ()) -> None:
+    data = json.dumps(message).encode('utf-8') + b'\n'
+    # socket.send_fds is not available before Python 3.9
+    ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))] if fds else []
+    sent = sock.sendmsg([data], ancillary)
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def _receive_message(sock: socket.socket) -> Tuple[Dict[str, Any], List[int]]:
+    fd_size = array.array('i').itemsize
+    chunks: List[bytes] = []
+    fds: List[int] = []
+
+    try:
+        while True:
+            try:
+                data, ancillary, _, _ = sock.recvmsg(RECEIVE_CHUNK_SIZE, socket.CMSG_SPACE(STDIO_FD_COUNT * fd_size))
+            except ConnectionResetError:
+                # Request rejected by zygote before it was read
+                data, ancillary = b'', []
+
+            for level, kind, cmsg_data in ancillary:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    received = array.array('i')
+                    received.frombytes(cmsg_data[:len(cmsg_data) - len(cmsg_data) % fd_size])
+                    fds.extend(received)
+
+            if not data:
+                raise ZygoteError('Connection closed before complete message was received')
+
+            chunks.append(data)
+            if data.endswith(b'\n'):
+                break
+
+        return json.loads(b''.join(chunks)), fds
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+class _LaunchHandler(socketserver.BaseRequestHandler):
+    server: 'ZygoteServer'
+
+    def handle(self) -> None:
+        try:
+            request, fds = _receive_message(self.request)
+            response: Dict[str, Any] = {'returncode': self.server.launch(request, fds, self.request)}
+        except (ZygoteError, OSError, ValueError, KeyError, TypeError) as e:
+            response = {'error': str(e)}
+
+        try:
+            _send_message(self.request, response)
+        except OSError:
+            # Client went away, nobody to report to
+            pass
+
+
+def _terminate(process: subprocess.Popen) -> None:
+    if process.poll() is not None:
+        return
+
+    process.terminate()
+    try:
+        process.wait(TERMINATE_GRACE)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _watch_client(connection: socket.socket, process: subprocess.Popen) -> None:
+    # Client stays connected until QEMU exits, it sends forwarded signals meanwhile. Connection closed early means
+    # client is gone (killed, interrupted) and QEMU started for it is stopped.
+    pending = b''
+    while True:
+        try:
+            data = connection.recv(RECEIVE_CHUNK_SIZE)
+        except OSError:
+            data = b''
+
+        if not data:
+            _terminate(process)
+            return
+
+        *messages, pending = (pending + data).split(b'\n')
+        for message in messages:
+            try:
+                signum = json.loads(message)['signal']
+            except (ValueError, KeyError, TypeError):
+                continue
+
+            if signum in FORWARDED_SIGNALS and process.poll() is None:
+                process.send_signal(signum)
+
+
+class ZygoteServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, runner: Runner, flags: RunFlags = RunFlags(),
+                 profiles: Optional[Mapping[str, Runner]] = None):
+        self._runner = runner
+        self._flags = flags
+        self._profiles = dict(profiles or {})
+
+        # Resolve QEMU upfront so launches pay only for fork and exec
+        for r in [runner, *self._profiles.values()]:
+            if not flags.qemu and r.layer.general.engine:
+                r.find_qemu(r.layer.general.engine, flags.qemu_dir)
+
+        super().__init__(socket_path, _LaunchHandler)
+
+    def server_bind(self) -> None:
+        super().server_bind()
+        # Socket does not accept connections before listen(), access is restricted before anyone can connect
+        os.chmod(self.server_address, SOCKET_MODE)
+
+    def verify_request(self, request: socket.socket, client_address) -> bool:
+        # Clients get environment and QEMU of zygote, only its own user may launch
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+
+        credentials = request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+        return uid == os.getuid()
+
+    def launch(self, request: Dict[str, Any], fds: List[int], connection: Optional[socket.socket] = None) -> int:
+        try:
+            if len(fds) != STDIO_FD_COUNT:
+                raise ZygoteError('Launch request must carry stdin, stdout and stderr descriptors')
+
+            flags = RunFlags(**request['flags'])
+            flags = replace(
+                flags,
+                qemu=flags.qemu or self._flags.qemu,
+                qemu_dir=flags.qemu_dir or self._flags.qemu_dir
+            )
+            profile = request.get('profile')
+            if profile is None:
+                runner = self._runner
+            elif profile in self._profiles:
+                runner = self._profiles[profile]
+            else:
+                raise ZygoteError(f'Unknown profile {profile}')
+
+            command_line = runner.compile(request['kernel'], request['arguments'], flags)
+
+            process = subprocess.Popen(
+                command_line,
+                stdin=fds[0],
+                stdout=fds[1],
+                stderr=fds[2],
+                cwd=request['cwd'],
+                env=request['env'],
+            )
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        if connection is None:
+            return process.wait()
+
+        watcher = threading.Thread(target=_watch_client, args=(connection, process), daemon=True)
+        watcher.start()
+        try:
+            return process.wait()
+        finally:
+            # Wakes watcher blocked on receive, response can still be sent
+            try:
+                connection.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+            watcher.join()
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    if not os.path.exists(socket_path):
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+            return
+
+    raise ZygoteError(f'Zygote is already listening on {socket_path}')
+
+
+def serve(socket_path: str, runner: Runner, flags: RunFlags = RunFlags(),
+          profiles: Optional[Mapping[str, Runner]] = None) -> None:
+    _remove_stale_socket(socket_path)
+
+    with ZygoteServer(socket_path, runner, flags, profiles) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+
+def _fileno(f: FileDescriptor) -> int:
+    return f if isinstance(f, int) else f.fileno()
+
+
+@contextmanager
+def _forward_signals(sock: socket.socket) -> Iterator[None]:
+    # Handlers can be installed only by main thread, launches from other threads do not forward signals
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def forward(signum, frame) -> None:
+        try:
+            _send_message(sock, {'signal': signum})
+        except OSError:
+            pass
+
+    previous = {signum: signal.signal(signum, forward) for signum in FORWARDED_SIGNALS}
+    try:
+        yield
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+def launch_via_zygote(socket_path: str,
+                      kernel: Optional[str] = None,
+                      args: Sequence[str] = (),
+                      flags: RunFlags = RunFlags(),
+                      *,
+                      cwd: Optional[str] = None,
+                      env: Optional[Mapping[str, str]] = None,
+                      stdin: FileDescriptor = 0,
+                      stdout: FileDescriptor = 1,
+                      stderr: FileDescriptor = 2,
+                      profile: Optional[str] = None,
+                      before_wait: Optional[Callable[[], None]] = None) -> int:
+    request = {
+        'kernel': os.path.abspath(kernel) if kernel is not None else None,
+        'arguments': list(args),
+        'flags': {**asdict(flags), 'qemu_args': list(flags.qemu_args)},
+        'cwd': cwd or os.getcwd(),
+        'env': dict(os.environ if env is None else env),
+        'profile': profile,
+    }
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        _send_message(sock, request, [_fileno(stdin), _fileno(stdout), _fileno(stderr)])
+        # Request is handed off to zygote, only waiting for QEMU exit code is left
+        if before_wait is not None:
+            before_wait()
+
+        with _forward_signals(sock):
+            response, fds = _receive_message(sock)
+
+    for fd in fds:
+        os.close(fd)
+
+    if 'error' in response:
+        raise ZygoteError(response['error'])
+
+    return response['returncode']
@@ -0,0 +1,85 @@
+import asyncio
+import sys
+
+import pytest
+
+from qemu_runner import Runner, RunFlags
+from qemu_runner.aio import Launcher
+from qemu_runner.layer import Layer, GeneralSettings
+
+PRINT_ARGS = 'import sys; print(" ".join(sys.argv[1:]))'
+SLEEP = 'import time; time.sleep(30)'
+
+
+def python_flags(script: str) -> RunFlags:
+    # Python interpreter stands in for QEMU, runner arguments become script arguments
+    return RunFlags(qemu=sys.executable, qemu_args=['-c', script])
+
+
+@pytest.fixture()
+def runner() -> Runner:
+    return Runner(Layer(GeneralSettings(engine='my-engine', memory='128M')))
+
+
+def test_launch_and_read_output(runner: Runner):
+    async def scenario():
+        process = await Launcher(runner).launch(flags=python_flags(PRINT_ARGS))
+        output = await process.stdout.read()
+        returncode = await process.wait()
+        return output, returncode
+
+    output, returncode = asyncio.run(scenario())
+
+    assert returncode == 0
+    assert output.decode().split() == ['-m', '128M']
+
+
+def test_wait_timeout_stops_process(runner: Runner):
+    async def scenario():
+        process = await Launcher(runner).launch(flags=python_flags(SLEEP))
+        with pytest.raises(asyncio.TimeoutError):
+            await process.wait(timeout=0.2)
+        return process.returncode
+
+    assert asyncio.run(scenario()) is not None
+
+
+def test_cancel_waiting_task_stops_process(runner: Runner):
+    async def scenario():
+        process = await Launcher(runner).launch(flags=python_flags(SLEEP))
+        waiter = asyncio.ensure_future(process.wait())
+        await asyncio.sleep(0.1)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await process.exited
+
+    assert asyncio.run(scenario()) != 0
+
+
+def test_concurrency_limit(runner: Runner):
+    async def scenario():
+        launcher = Launcher(runner, max_concurrency=2)
+        p1 = await launcher.launch(flags=python_flags(SLEEP))
+        p2 = await launcher.launch(flags=python_flags(SLEEP))
+
+        third = asyncio.ensure_future(launcher.launch(flags=python_flags(PRINT_ARGS)))
+        await asyncio.sleep(0.3)
+        blocked = not third.done()
+
+        await p1.cancel()
+        p3 = await asyncio.wait_for(third, 10)
+        await p3.wait()
+        await p2.cancel()
+        return blocked
+
+    assert asyncio.run(scenario())
+
+
+def test_context_manager_stops_process(runner: Runner):
+    async def scenario():
+        async with await Launcher(runner).launch(flags=python_flags(SLEEP)) as process:
+            pass
+        return process.returncode
+
+    assert asyncio.run(scenario()) is not None
@@ -0,0 +1,96 @@
+import os
+import shlex
+from pathlib import Path
+from typing import List
+from unittest.mock import patch
+
+import pytest
+
+from qemu_runner import Runner, RunFlags
+from qemu_runner.argument import Argument
+from qemu_runner.layer import Layer, GeneralSettings
+
+from .test_runner_flow import run_make_runner, execute_runner
+from .test_utllities import place_echo_args, with_cwd
+
+
+@pytest.fixture()
+def runner_path(tmp_path: Path) -> Path:
+    place_echo_args(tmp_path / 'qemu' / 'qemu-system-arm')
+
+    with open(tmp_path / 'layer1.ini', 'w') as f:
+        f.write("""
+        [general]
+        engine = qemu-system-arm
+        memory = 128M
+
+        [machine]
+        @ = virt_cortex_m
+        flash_kb = 1024
+        """)
+
+    with open(tmp_path / 'layer2.ini', 'w') as f:
+        f.write("""
+        [device:d1]
+        @ = test
+        path = ${KERNEL_DIR}/file.bin
+        image = ${RUNNER_DIR}/image.bin
+        """)
+
+    run_make_runner('-l', './layer1.ini', './layer2.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+    return tmp_path / 'runner.pyz'
+
+
+@pytest.mark.parametrize(('runner_args', 'flags', 'kernel', 'args'), [
+    ([], RunFlags(), 'abc.elf', []),
+    ([], RunFlags(), 'abc.elf', ['a', 'b']),
+    (['--halted'], RunFlags(halted=True), 'abc.elf', ['a']),
+    (['--debug'], RunFlags(debug=True), 'dir/abc.elf', []),
+    (['--debug', '--debug-listen', 'tcp::5555'], RunFlags(debug=True, debug_listen='tcp::5555'), 'abc.elf', []),
+    ([], RunFlags(), None, []),
+])
+def test_compile_matches_dry_run(tmp_path: Path, runner_path: Path,
+                                 runner_args: List[str], flags: RunFlags, kernel: str, args: List[str]):
+    kernel_args = [kernel, *args] if kernel is not None else []
+    cp = execute_runner(runner_path, ['--dry-run', *runner_args, *kernel_args], cwd=tmp_path)
+    expected = shlex.split(cp.stdout)
+
+    runner = Runner.open(runner_path)
+    with with_cwd(tmp_path):
+        actual = runner.compile(kernel, args, flags)
+
+    assert actual == expected
+
+
+def test_compile_explicit_qemu_and_args(runner_path: Path):
+    runner = Runner.open(runner_path)
+
+    cmdline = runner.compile('/abc.elf', flags=RunFlags(qemu='/my/qemu', qemu_args=['-d', 'int']))
+
+    assert cmdline[:3] == ['/my/qemu', '-d', 'int']
+    assert cmdline[-2:] == ['-kernel', os.path.abspath('/abc.elf')]
+
+
+def test_compile_many_resolves_qemu_once():
+    runner = Runner(Layer(GeneralSettings(engine='my-engine'), [Argument('machine', 'virt')]))
+
+    with patch('qemu_runner.api.find_qemu', return_value=Path('/bin/my-engine')) as find_qemu:
+        cmdlines = runner.compile_many([
+            ('/k1.elf', []),
+            ('/k2.elf', ['a']),
+            ('/k3.elf', ['b', 'c']),
+        ])
+
+    assert find_qemu.call_count == 1
+    assert cmdlines == [
+        [str(Path('/bin/my-engine')), '-machine', 'virt', '-kernel', os.path.abspath('/k1.elf')],
+        [str(Path('/bin/my-engine')), '-machine', 'virt', '-kernel', os.path.abspath('/k2.elf'), '-append', 'a'],
+        [str(Path('/bin/my-engine')), '-machine', 'virt', '-kernel', os.path.abspath('/k3.elf'), '-append', 'b c'],
+    ]
+
+
+def test_open_keeps_layer_order(runner_path: Path):
+    runner = Runner.open(runner_path)
+
+    assert [arg.name for arg in runner.layer.arguments] == ['machine', 'device']
+    assert runner.layer.general.memory == '128M'
@@ -0,0 +1,90 @@
+import pytest
+
+from qemu_runner.argument import Argument, ArgumentSequence, AttributeMap, MAX_SEQUENCE_DEPTH
+from qemu_runner.layer import Layer, GeneralSettings
+
+BASE_ARGUMENTS = [Argument('device', f'dev{i}', {'id': f'd{i}', 'bus': 'pci.0'}) for i in range(5)]
+
+
+def test_flat_sequence():
+    sequence = ArgumentSequence(BASE_ARGUMENTS)
+
+    assert len(sequence) == 5
+    assert sequence == BASE_ARGUMENTS
+    assert BASE_ARGUMENTS == sequence
+    assert sequence[1] is BASE_ARGUMENTS[1]
+    assert sequence[-1] is BASE_ARGUMENTS[4]
+    assert sequence[1:3] == BASE_ARGUMENTS[1:3]
+    assert BASE_ARGUMENTS[2] in sequence
+
+    with pytest.raises(IndexError):
+        sequence[5]
+
+
+def test_derived_sequence():
+    base = ArgumentSequence(BASE_ARGUMENTS)
+    replacement = Argument('device', 'other', {'id': 'd1'})
+    appended = Argument('chardev', 'c', {'id': 'c0'})
+
+    derived = base.derive({1: replacement}, [appended])
+
+    assert list(derived) == [BASE_ARGUMENTS[0], replacement, *BASE_ARGUMENTS[2:], appended]
+    assert [derived[i] for i in range(len(derived))] == list(derived)
+    assert derived[0] is BASE_ARGUMENTS[0]
+    assert list(base) == BASE_ARGUMENTS
+    assert derived.position(('device', 'd3')) == 3
+    assert derived.position(('chardev', 'c0')) == 5
+    assert derived.position(('chardev', 'c1')) is None
+    assert base.derive({}, []) is base
+
+
+def test_replacing_appended_argument():
+    base = ArgumentSequence(BASE_ARGUMENTS[:1]).derive({}, BASE_ARGUMENTS[1:2])
+    replacement = Argument('device', 'other', {'id': 'd1'})
+
+    derived = base.derive({1: replacement}, [])
+
+    assert list(derived) == [BASE_ARGUMENTS[0], replacement]
+    assert derived[1] is replacement
+
+
+def test_deep_sequence_is_flattened():
+    sequence = ArgumentSequence()
+    expected = []
+
+    for i in range(MAX_SEQUENCE_DEPTH * 3):
+        arg = Argument('device', attributes={'id': f'd{i}'})
+        replacement = Argument('device', 'x', {'id': f'd{i // 2}'})
+        sequence = sequence.derive({i // 2: replacement} if i else {}, [arg])
+        expected.append(arg)
+        if i:
+            expected[i // 2] = replacement
+
+        assert sequence._depth <= MAX_SEQUENCE_DEPTH
+
+    assert list(sequence) == expected
+    assert [sequence[i] for i in range(len(sequence))] == expected
+
+
+def test_apply_shares_unchanged_arguments():
+    base = Layer(GeneralSettings(engine='e'), BASE_ARGUMENTS)
+    addition = Layer(arguments=[Argument('device', attributes={'id': 'd2', 'bus': 'usb'}), Argument('nographic')])
+
+    derived = base.apply(addition)
+
+    assert derived.arguments[0] is base.arguments[0]
+    assert derived.arguments[2].attributes == {'id': 'd2', 'bus': 'usb'}
+    assert derived.arguments[5] == Argument('nographic')
+    assert base.arguments == BASE_ARGUMENTS
+
+
+def test_attribute_map_is_immutable():
+    attributes = AttributeMap({'id': 'd1', 'bus': 'pci.0'})
+
+    with pytest.raises(TypeError):
+        attributes['bus'] = 'usb'
+
+    assert attributes.updated({'bus': 'pci.0'}) is attributes
+    assert attributes.updated({'bus': 'usb'}) == {'id': 'd1', 'bus': 'usb'}
+    assert attributes == {'bus': 'pci.0', 'id': 'd1'}
+    assert hash(attributes) == hash(AttributeMap({'bus': 'pci.0', 'id': 'd1'}))
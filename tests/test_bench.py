@@ -0,0 +1,40 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from qemu_runner.make_runner.bench import percentile
+
+
+@pytest.mark.parametrize(('p', 'expected'), [
+    (0, 1.0),
+    (50, 5.0),
+    (90, 9.0),
+    (99, 10.0),
+    (100, 10.0),
+])
+def test_percentile(p: float, expected: float):
+    assert percentile([10.0, 9.0, 8.0, 7.0, 6.0, 5.0, 4.0, 3.0, 2.0, 1.0], p) == expected
+
+
+def test_bench_command(tmp_path: Path):
+    cp = subprocess.run(
+        [sys.executable, '-m', 'qemu_runner.make_runner', 'bench', '--runs', '2', '--max-depth', '2',
+         '--work-dir', str(tmp_path / 'work'), '--json', str(tmp_path / 'results.json')],
+        stdout=subprocess.PIPE,
+        encoding='utf-8'
+    )
+
+    assert cp.returncode == 0
+
+    names = [result['name'] for result in json.loads((tmp_path / 'results.json').read_text())['results']]
+    assert names == [
+        'make runner',
+        'derive (depth 2)',
+        'dry-run (depth 0)', 'dry-run (depth 1)', 'dry-run (depth 2)',
+        'launch (depth 0)', 'launch (depth 2)',
+    ]
+    assert all(name in cp.stdout for name in names)
+    assert (tmp_path / 'work' / 'depth2.pyz').is_file()
@@ -0,0 +1,192 @@
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from qemu_runner import Runner
+from qemu_runner.argument import Argument
+from qemu_runner.capabilities import QemuCapabilities, check_layer, load_capabilities, probe_capabilities
+from qemu_runner.layer import Layer, GeneralSettings, Mode
+
+from .test_runner_flow import run_make_runner, execute_runner
+from .test_utllities import place_python_script
+
+if sys.platform != 'win32':
+    from qemu_runner.zygote import ZygoteServer
+
+STUB_QEMU = '''
+import os, sys
+
+OUTPUTS = {
+    '--version': """QEMU emulator version 8.2.0
+Copyright (c) 2003-2023 Fabrice Bellard and the QEMU Project developers
+""",
+    '-help': """QEMU emulator version 8.2.0
+usage: qemu-system-arm [options] [disk_image]
+
+Standard options:
+-h or -help     display this help and exit
+-machine [type=]name[,prop[=value][,...]]
+                selects emulated machine ('-machine help' for list)
+-cpu cpu        select CPU ('-cpu help' for list)
+-m [size=]megs[,slots=n,maxmem=size]
+-device driver[,prop[=value][,...]]
+-semihosting-config [enable=on|off][,target=native|gdb|auto]
+-kernel bzImage use 'bzImage' as kernel image
+-append cmdline use 'cmdline' as kernel command line
+""",
+    '-machine': """Supported machines are:
+mps2-an385           ARM MPS2 with AN385 FPGA image for Cortex-M3
+virt                 QEMU 8.2 ARM Virtual Machine (alias of virt-8.2)
+virt-8.2             QEMU 8.2 ARM Virtual Machine
+none                 empty machine
+""",
+    '-device': """Controller/Bridge/Hub devices:
+name "pci-bridge", bus PCI, desc "Standard PCI Bridge"
+
+Network devices:
+name "virtio-net-device", bus virtio-bus
+name "virtio-net-pci", bus PCI, alias "virtio-net"
+""",
+    '-cpu': """Available CPUs:
+  cortex-a15
+  cortex-m3
+  max
+""",
+}
+
+with open(os.environ['STUB_LOG'], 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+
+print(OUTPUTS.get(sys.argv[1], ''), end='')
+'''
+
+CAPABILITIES = QemuCapabilities(
+    version='QEMU emulator version 8.2.0',
+    options=frozenset(['machine', 'cpu', 'm', 'device', 'semihosting-config', 'kernel', 'append']),
+    machines=frozenset(['virt', 'mps2-an385']),
+    devices=frozenset(['virtio-net-pci', 'virtio-net', 'pci-bridge']),
+    cpus=frozenset(['cortex-m3', 'cortex-a15']),
+)
+
+
+def test_check_valid_layer():
+    layer = Layer(GeneralSettings(cpu='cortex-m3'), [
+        Argument('machine', 'virt', {'highmem': 'off'}),
+        Argument('device', 'virtio-net', {'id': 'net0'}),
+        Argument('semihosting-config', None, {'enable': 'on'}),
+    ])
+
+    assert check_layer(layer, CAPABILITIES) == []
+
+
+def test_check_reports_typos():
+    layer = Layer(GeneralSettings(cpu='cortex-m33'), [
+        Argument('machine', 'vrit'),
+        Argument('device', 'virtio-net-pcii', {'id': 'net0'}),
+        Argument('semihosting-confg', None, {'enable': 'on'}),
+    ])
+
+    assert check_layer(layer, CAPABILITIES) == [
+        "Unknown CPU 'cortex-m33' (did you mean: cortex-m3, cortex-a15?)",
+        "Unknown machine 'vrit' (did you mean: virt?)",
+        "Unknown device 'virtio-net-pcii' (did you mean: virtio-net-pci, virtio-net?)",
+        "Unknown option '-semihosting-confg' (did you mean: -semihosting-config?)",
+    ]
+
+
+def test_check_skips_unreported_lists():
+    capabilities = QemuCapabilities(version='QEMU', options=frozenset(), machines=frozenset(),
+                                    devices=frozenset(), cpus=frozenset())
+    layer = Layer(GeneralSettings(cpu='anything'), [Argument('whatever', 'value')])
+
+    assert check_layer(layer, capabilities) == []
+
+
+def test_user_mode_checks_only_cpu():
+    layer = Layer(GeneralSettings(mode=Mode.User, cpu='cortex-m3'), [Argument('strace')])
+
+    assert check_layer(layer, CAPABILITIES) == []
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Stub executables are POSIX scripts')
+def test_probe_stub_qemu(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv('STUB_LOG', str(tmp_path / 'probe.log'))
+    qemu = place_python_script(tmp_path / 'qemu-system-arm', STUB_QEMU)
+
+    capabilities = probe_capabilities(qemu)
+
+    assert capabilities.version == 'QEMU emulator version 8.2.0'
+    assert capabilities.options >= {'h', 'machine', 'cpu', 'm', 'device', 'semihosting-config', 'kernel'}
+    assert capabilities.machines == {'mps2-an385', 'virt', 'virt-8.2', 'none'}
+    assert capabilities.devices == {'pci-bridge', 'virtio-net-device', 'virtio-net-pci', 'virtio-net'}
+    assert capabilities.cpus == {'cortex-a15', 'cortex-m3', 'max'}
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Stub executables are POSIX scripts')
+def test_capabilities_cached_per_binary(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv('STUB_LOG', str(tmp_path / 'probe.log'))
+    qemu = place_python_script(tmp_path / 'qemu-system-arm', STUB_QEMU)
+
+    def probe_count() -> int:
+        return len((tmp_path / 'probe.log').read_text().splitlines())
+
+    first = load_capabilities(qemu, str(tmp_path / 'cache'))
+    probes = probe_count()
+    assert load_capabilities(qemu, str(tmp_path / 'cache')) == first
+    assert probe_count() == probes
+
+    # Different binary (e.g. QEMU upgraded in place) is probed again
+    stat = os.stat(qemu)
+    os.utime(qemu, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    load_capabilities(qemu, str(tmp_path / 'cache'))
+    assert probe_count() == probes * 2
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Stub executables are POSIX scripts')
+def test_runner_rejects_unknown_device(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv('STUB_LOG', str(tmp_path / 'probe.log'))
+    place_python_script(tmp_path / 'qemu' / 'qemu-system-arm', STUB_QEMU)
+
+    (tmp_path / 'good.ini').write_text('[general]\nengine = qemu-system-arm\n[machine]\n@ = virt\n')
+    (tmp_path / 'bad.ini').write_text('[device:net]\n@ = virtio-net-pcii\n')
+    run_make_runner('-l', './good.ini', '-o', tmp_path / 'good.pyz', cwd=tmp_path)
+    run_make_runner('-l', './good.ini', './bad.ini', '-o', tmp_path / 'bad.pyz', cwd=tmp_path)
+
+    check_args = ['--check-capabilities', '--capability-cache', tmp_path / 'cache', '--dry-run', 'kernel.elf']
+
+    cp = execute_runner(tmp_path / 'good.pyz', check_args, cwd=tmp_path)
+    assert cp.stdout.split()[1:] == ['-machine', 'virt', '-kernel', str(tmp_path / 'kernel.elf')]
+
+    cp = execute_runner(tmp_path / 'bad.pyz', check_args, cwd=tmp_path, check=False)
+    assert cp.returncode == 1
+    assert cp.stdout == ''
+    assert "Unknown device 'virtio-net-pcii'" in cp.stderr
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Zygote requires Unix sockets')
+def test_runner_checks_capabilities_with_zygote(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv('STUB_LOG', str(tmp_path / 'probe.log'))
+    qemu = place_python_script(tmp_path / 'qemu' / 'qemu-system-arm', STUB_QEMU)
+
+    (tmp_path / 'bad.ini').write_text('[general]\nengine = qemu-system-arm\n[device:net]\n@ = virtio-net-pcii\n')
+    run_make_runner('-l', './bad.ini', '-o', tmp_path / 'bad.pyz', cwd=tmp_path)
+
+    socket_path = str(tmp_path / 'zygote.sock')
+    with ZygoteServer(socket_path, Runner(Layer(GeneralSettings(engine='qemu-system-arm')))) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            monkeypatch.setenv('QEMU_RUNNER_ZYGOTE', socket_path)
+            cp = execute_runner(tmp_path / 'bad.pyz', ['--qemu', qemu, '--check-capabilities', '--capability-cache',
+                                                       tmp_path / 'cache', 'kernel.elf'], cwd=tmp_path, check=False)
+        finally:
+            server.shutdown()
+            thread.join()
+
+    assert cp.returncode == 1
+    assert "Unknown device 'virtio-net-pcii'" in cp.stderr
+    # Check failed before QEMU was launched by zygote
+    assert not any('-kernel' in line for line in (tmp_path / 'probe.log').read_text().splitlines())
@@ -0,0 +1,106 @@
+import asyncio
+import io
+import re
+import sys
+
+import pytest
+from pathlib import Path
+
+from qemu_runner.console import ConsoleMultiplexer, run_multiplexed, MAX_LINE
+
+
+def feed(stream: asyncio.StreamReader, *chunks: bytes) -> None:
+    for chunk in chunks:
+        stream.feed_data(chunk)
+    stream.feed_eof()
+
+
+def test_aggregate_streams(tmp_path: Path):
+    output = io.BytesIO()
+
+    async def scenario():
+        async with ConsoleMultiplexer(output, tmp_path / 'instances', timestamps=False) as multiplexer:
+            first = asyncio.StreamReader()
+            second = asyncio.StreamReader()
+            errors = asyncio.StreamReader()
+            multiplexer.attach('first', first)
+            multiplexer.attach('second', second)
+            multiplexer.attach('second', errors, 'second:stderr')
+
+            feed(first, b'line 1\nline', b' 2\n', b'no newline')
+            feed(second, b'a\nb\n')
+            feed(errors, b'error\n')
+
+    asyncio.run(scenario())
+
+    lines = output.getvalue().decode('utf-8').splitlines()
+    assert [line for line in lines if line.startswith('[first]')] == [
+        '[first] line 1', '[first] line 2', '[first] no newline',
+    ]
+    assert sorted(line for line in lines if not line.startswith('[first]')) == [
+        '[second:stderr] error', '[second] a', '[second] b',
+    ]
+    assert (tmp_path / 'instances' / 'first.log').read_bytes() == b'line 1\nline 2\nno newline'
+    assert sorted((tmp_path / 'instances' / 'second.log').read_bytes().splitlines()) == [b'a', b'b', b'error']
+
+
+def test_long_lines_are_split():
+    output = io.BytesIO()
+
+    async def scenario():
+        async with ConsoleMultiplexer(output, timestamps=False, max_pending=1) as multiplexer:
+            stream = asyncio.StreamReader()
+            multiplexer.attach('x', stream)
+            feed(stream, *[b'a' * 1000] * (3 * MAX_LINE // 1000), b'\nend\n')
+
+    asyncio.run(scenario())
+
+    lines = output.getvalue().splitlines()
+    assert all(len(line) <= MAX_LINE + len(b'[x] ') for line in lines)
+    assert b''.join(line[len(b'[x] '):] for line in lines[:-1]) == b'a' * (3 * MAX_LINE // 1000 * 1000)
+    assert lines[-1] == b'[x] end'
+
+
+def test_run_multiplexed(tmp_path: Path):
+    script = 'import sys; print("\\n".join(f"{sys.argv[1]} {i}" for i in range(1000))); sys.exit(int(sys.argv[2]))'
+    commands = {f'vm{i}': [sys.executable, '-c', script, f'vm{i}', str(i)] for i in range(5)}
+
+    returncodes = asyncio.run(run_multiplexed(commands, tmp_path / 'all.log', tmp_path / 'vms'))
+
+    assert returncodes == {f'vm{i}': i for i in range(5)}
+    lines = (tmp_path / 'all.log').read_text().splitlines()
+    assert len(lines) == 5000
+    for line in lines:
+        match = re.fullmatch(r'\d\d:\d\d:\d\d\.\d\d\d \[(vm\d)] (vm\d) \d+', line)
+        assert match and match.group(1) == match.group(2)
+
+    for i in range(5):
+        assert (tmp_path / 'vms' / f'vm{i}.log').read_text().splitlines() == [f'vm{i} {j}' for j in range(1000)]
+
+
+class FailingSink(io.BytesIO):
+    def write(self, data: bytes) -> int:
+        raise OSError('No space left on device')
+
+
+def test_sink_failure_stops_readers():
+    async def scenario():
+        async with ConsoleMultiplexer(FailingSink(), timestamps=False, max_pending=1) as multiplexer:
+            streams = [asyncio.StreamReader() for _ in range(3)]
+            for i, stream in enumerate(streams):
+                multiplexer.attach(f'vm{i}', stream)
+                # More chunks than queue holds, readers would wait for space forever
+                for _ in range(10):
+                    stream.feed_data(b'line\n' * 1000)
+            await asyncio.sleep(0.1)
+
+    with pytest.raises(OSError, match='No space left'):
+        asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_run_multiplexed_sink_failure():
+    script = 'import sys\nfor i in range(10 ** 6): print(i)'
+    commands = {f'vm{i}': [sys.executable, '-c', script] for i in range(2)}
+
+    with pytest.raises(OSError, match='No space left'):
+        asyncio.run(asyncio.wait_for(run_multiplexed(commands, FailingSink(), max_pending=1), 30))
@@ -0,0 +1,108 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from qemu_runner.argument import Argument
+from qemu_runner.layer import Layer, GeneralSettings
+from qemu_runner.overlay import drive_overlays, _needs_overlay
+
+from .test_runner_flow import run_make_runner, capture_runner_cmdline
+from .test_utllities import place_python_script, place_echo_args, with_cwd
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='Stub executables are POSIX scripts')
+
+STUB_QEMU_IMG = '''
+import json, sys
+
+args = sys.argv[1:]
+if args[0] == 'info':
+    print(json.dumps({'format': 'raw'}))
+else:
+    with open(args[-1], 'w') as f:
+        f.write(' '.join(args))
+'''
+
+
+@pytest.fixture()
+def qemu_img(tmp_path: Path) -> str:
+    return place_python_script(tmp_path / 'qemu' / 'qemu-img', STUB_QEMU_IMG)
+
+
+@pytest.mark.parametrize(('attributes', 'expected'), [
+    ({'file': 'disk.img'}, True),
+    ({'file': 'disk.img', 'readonly': 'off'}, True),
+    ({'file': 'disk.img', 'readonly': 'on'}, False),
+    ({'file': 'disk.img', 'readonly': None}, False),
+    ({'file': 'disk.img', 'readonly': 'ON'}, False),
+    ({'file': 'disk.img', 'snapshot': None}, False),
+    ({'file': 'disk.img', 'snapshot': 'yes'}, False),
+    ({'if': 'none'}, False),
+])
+def test_needs_overlay(attributes, expected: bool):
+    assert _needs_overlay(attributes) == expected
+
+
+def test_overlay_created_for_each_drive(tmp_path: Path, qemu_img: str):
+    layer = Layer(
+        GeneralSettings(engine='my-engine', kernel=str(tmp_path / 'kernel.elf')),
+        [
+            Argument('machine', 'virt'),
+            Argument('drive', None, {'id': 'd1', 'file': '${KERNEL_DIR}/disk1.img', 'format': 'qcow2'}),
+            Argument('drive', None, {'id': 'd2', 'file': str(tmp_path / 'disk2.img')}),
+            Argument('drive', None, {'id': 'd3', 'file': str(tmp_path / 'disk3.img'), 'readonly': 'on'}),
+        ]
+    )
+
+    with drive_overlays(layer, qemu_img, directory=str(tmp_path)) as overlaid:
+        d1 = overlaid.arguments[1].attributes
+        d2 = overlaid.arguments[2].attributes
+
+        assert overlaid.arguments[0] == layer.arguments[0]
+        assert overlaid.arguments[3] == layer.arguments[3]
+
+        assert d1['id'] == 'd1'
+        assert d1['format'] == 'qcow2'
+        with open(d1['file'], 'r') as f:
+            assert f.read().split() == [
+                'create', '-q', '-f', 'qcow2', '-F', 'qcow2', '-b', str(tmp_path / 'disk1.img'), d1['file']
+            ]
+
+        with open(d2['file'], 'r') as f:
+            assert f.read().split()[4:8] == ['-F', 'raw', '-b', str(tmp_path / 'disk2.img')]
+
+        overlay_dir = os.path.dirname(d1['file'])
+        assert os.path.dirname(d2['file']) == overlay_dir
+
+    assert not os.path.exists(overlay_dir)
+
+
+def test_runner_uses_overlays(tmp_path: Path, qemu_img: str):
+    engine = place_echo_args(tmp_path / 'qemu' / 'qemu-system-arm')
+
+    with open(tmp_path / 'layer.ini', 'w') as f:
+        f.write("""
+        [general]
+        engine = qemu-system-arm
+
+        [drive:hd0]
+        file = ${KERNEL_DIR}/disk.img
+        format = raw
+        """)
+
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    with with_cwd(tmp_path):
+        plain = capture_runner_cmdline(tmp_path / 'runner.pyz', 'abc.elf')
+        overlaid = capture_runner_cmdline(tmp_path / 'runner.pyz', '--drive-overlays', 'abc.elf')
+
+    assert plain[1:3] == ['-drive', f'id=hd0,file={tmp_path}/disk.img,format=raw']
+
+    assert overlaid[0] == engine
+    assert overlaid[1] == '-drive'
+    attributes = dict(a.split('=', 1) for a in overlaid[2].split(','))
+    assert attributes['id'] == 'hd0'
+    assert attributes['format'] == 'qcow2'
+    assert attributes['file'].endswith('.qcow2')
+    assert not os.path.exists(attributes['file'])
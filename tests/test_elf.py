@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from qemu_runner.elf import read_elf_info, ElfInfo, ElfError, ELF_MACHINES
+
+from .test_utllities import place_elf
+
+
+@pytest.mark.parametrize('bits', [32, 64])
+@pytest.mark.parametrize('endian', ['little', 'big'])
+def test_read_header(tmp_path: Path, bits: int, endian: str):
+    place_elf(tmp_path / 'kernel.elf', ELF_MACHINES['arm'], bits, endian)
+
+    assert read_elf_info(tmp_path / 'kernel.elf') == ElfInfo(elf_class=bits, endian=endian, machine=40)
+
+
+@pytest.mark.parametrize('bits', [32, 64])
+@pytest.mark.parametrize('endian', ['little', 'big'])
+def test_read_marker_section(tmp_path: Path, bits: int, endian: str):
+    place_elf(tmp_path / 'kernel.elf', ELF_MACHINES['riscv'], bits, endian, sections={
+        '.text': b'\x00' * 64,
+        '.qemu_runner_profile': b'my-profile\0\0\0',
+    })
+
+    info = read_elf_info(tmp_path / 'kernel.elf', '.qemu_runner_profile')
+
+    assert info == ElfInfo(elf_class=bits, endian=endian, machine=243, marker='my-profile')
+
+
+def test_missing_marker_section(tmp_path: Path):
+    place_elf(tmp_path / 'kernel.elf', ELF_MACHINES['arm'], sections={'.qemu_runner_profile_other': b'x\0'})
+
+    assert read_elf_info(tmp_path / 'kernel.elf', '.qemu_runner_profile').marker is None
+
+
+def test_large_file(tmp_path: Path):
+    place_elf(tmp_path / 'kernel.elf', ELF_MACHINES['aarch64'], 64, padding=64 * 1024 * 1024,
+              sections={'.qemu_runner_profile': b'big\0'})
+
+    assert read_elf_info(tmp_path / 'kernel.elf', '.qemu_runner_profile').marker == 'big'
+
+
+@pytest.mark.parametrize('content', [b'', b'#!/bin/sh\necho not an elf\n' * 4, b'MZ' + b'\0' * 100])
+def test_not_elf(tmp_path: Path, content: bytes):
+    (tmp_path / 'kernel.bin').write_bytes(content)
+
+    assert read_elf_info(tmp_path / 'kernel.bin') is None
+
+
+def test_truncated_section_table(tmp_path: Path):
+    place_elf(tmp_path / 'kernel.elf', ELF_MACHINES['arm'], sections={'.qemu_runner_profile': b'x\0'})
+    content = (tmp_path / 'kernel.elf').read_bytes()
+    (tmp_path / 'kernel.elf').write_bytes(content[:-20])
+
+    with pytest.raises(ElfError):
+        read_elf_info(tmp_path / 'kernel.elf', '.qemu_runner_profile')
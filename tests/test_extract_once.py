@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from qemu_runner import Runner
+
+from .test_import_time import measure_imports
+from .test_runner_flow import run_make_runner, capture_runner_cmdline, execute_runner
+from .test_utllities import place_echo_args, with_env, with_cwd
+
+TEST_LAYER = """
+[general]
+engine = qemu-system-arm
+
+[machine]
+@ = virt
+"""
+
+
+@pytest.fixture()
+def extract_dir(tmp_path: Path) -> Path:
+    with with_env({'QEMU_RUNNER_EXTRACT_DIR': tmp_path / 'extracted'}):
+        yield tmp_path / 'extracted'
+
+
+@pytest.fixture()
+def runner(tmp_path: Path) -> Path:
+    (tmp_path / 'layer.ini').write_text(TEST_LAYER)
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', '--extract-once', cwd=tmp_path)
+    return tmp_path / 'runner.pyz'
+
+
+def test_extract_on_first_run(tmp_path: Path, runner: Path, extract_dir: Path):
+    engine = place_echo_args(tmp_path / 'qemu' / 'qemu-system-arm')
+
+    for _ in range(2):
+        with with_cwd(tmp_path):
+            cmdline = capture_runner_cmdline(runner, 'kernel.elf')
+
+        # QEMU is still found relative to runner archive, not extracted copy
+        assert cmdline == [engine, '-machine', 'virt', '-kernel', str(tmp_path / 'kernel.elf')]
+
+    [extracted] = os.listdir(extract_dir)
+    assert (extract_dir / extracted / 'qemu_runner' / 'make_runner' / 'runner.py').is_file()
+    assert (extract_dir / extracted / 'embedded_layers' / 'layers' / '0.ini').is_file()
+    assert not (extract_dir / extracted / '__main__.py').exists()
+
+
+def test_extracted_runner_does_not_use_zip(tmp_path: Path, runner: Path, extract_dir: Path):
+    measure_imports([str(runner), '--dry-run', 'kernel.elf'], tmp_path)
+    modules = measure_imports([str(runner), '--dry-run', 'kernel.elf'], tmp_path)
+
+    assert 'qemu_runner.make_runner.runner' in modules
+    assert 'zipfile' not in modules
+
+
+def test_concurrent_first_run(tmp_path: Path, runner: Path, extract_dir: Path):
+    processes = [
+        subprocess.Popen(
+            [sys.executable, str(runner), '--dry-run', 'kernel.elf'],
+            cwd=tmp_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env={**os.environ, 'QEMU_DEV': 'my-qemu'}
+        )
+        for _ in range(8)
+    ]
+
+    for p in processes:
+        stdout, stderr = p.communicate()
+        assert p.returncode == 0, stderr
+        assert stdout.split()[0] == b'my-qemu'
+
+    assert len(os.listdir(extract_dir)) == 1
+
+
+def test_unwritable_cache_falls_back_to_archive(tmp_path: Path, runner: Path):
+    (tmp_path / 'not-a-dir').write_text('')
+
+    with with_env({'QEMU_RUNNER_EXTRACT_DIR': tmp_path / 'not-a-dir' / 'extracted', 'QEMU_DEV': 'my-qemu'}):
+        cp = execute_runner(runner, ['--dry-run', 'kernel.elf'], cwd=tmp_path)
+
+    assert cp.stdout.split()[0] == 'my-qemu'
+
+
+def test_changed_runner_uses_new_directory(tmp_path: Path, runner: Path, extract_dir: Path):
+    (tmp_path / 'derived.ini').write_text('[general]\nmemory = 64M\n')
+
+    with with_env({'QEMU_DEV': 'my-qemu'}):
+        execute_runner(runner, ['--dry-run', 'kernel.elf'], cwd=tmp_path)
+        execute_runner(runner, ['--layers', './derived.ini', '--derive', './derived.pyz'], cwd=tmp_path)
+        cp = execute_runner(tmp_path / 'derived.pyz', ['--dry-run', 'kernel.elf'], cwd=tmp_path)
+
+    assert '-m 64M' in cp.stdout
+    assert len(os.listdir(extract_dir)) == 2
+
+
+def test_open_extract_once_runner(runner: Path):
+    assert Runner.open(runner).layer.general.engine == 'qemu-system-arm'
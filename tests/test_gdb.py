@@ -0,0 +1,181 @@
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from qemu_runner.gdb import GdbError, parse_gdb_endpoint, wait_for_gdbserver, run_with_gdbserver
+
+from .test_runner_flow import run_make_runner, execute_runner
+from .test_utllities import place_python_script
+
+# Stub QEMU starts listening on port given with -gdb after delay, accepts probe and then exits
+STUB_QEMU = '''
+import socket, sys, time
+port = int(sys.argv[sys.argv.index('-gdb') + 1].rsplit(':', 1)[1])
+time.sleep(0.3)
+with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(('127.0.0.1', port))
+    s.listen()
+    for _ in range(int(sys.argv[sys.argv.index('-m') + 1].rstrip('M'))):
+        s.accept()[0].close()
+print('qemu done')
+sys.exit(3)
+'''
+
+STUB_GDB = '''
+import sys
+with open(sys.argv[1], 'w') as f:
+    f.write(' '.join(sys.argv[2:]))
+sys.exit(7)
+'''
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.parametrize(('device', 'endpoint'), [
+    ('tcp::1234', ('localhost', 1234)),
+    ('tcp:127.0.0.1:5555', ('127.0.0.1', 5555)),
+    ('tcp:0.0.0.0:5555,ipv4', ('localhost', 5555)),
+    ('tcp:[::1]:5555', ('::1', 5555)),
+])
+def test_parse_gdb_endpoint(device: str, endpoint):
+    assert parse_gdb_endpoint(device) == endpoint
+
+
+@pytest.mark.parametrize('device', ['unix:/tmp/gdb.sock', 'tcp::port', 'stdio'])
+def test_parse_invalid_gdb_endpoint(device: str):
+    with pytest.raises(GdbError):
+        parse_gdb_endpoint(device)
+
+
+def test_wait_until_listening():
+    port = free_port()
+
+    async def scenario():
+        async def start_server():
+            await asyncio.sleep(0.2)
+            return await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', port)
+
+        server_task = asyncio.ensure_future(start_server())
+        start = time.monotonic()
+        await wait_for_gdbserver('127.0.0.1', port, timeout=5)
+        elapsed = time.monotonic() - start
+
+        server = await server_task
+        server.close()
+        await server.wait_closed()
+        return elapsed
+
+    assert 0.2 <= asyncio.run(scenario()) < 1
+
+
+def test_wait_timeout():
+    with pytest.raises(GdbError, match='not ready after'):
+        asyncio.run(wait_for_gdbserver('127.0.0.1', free_port(), timeout=0.2))
+
+
+def test_wait_stops_when_qemu_exits():
+    async def scenario():
+        process = await asyncio.create_subprocess_exec(sys.executable, '-c', 'import sys; sys.exit(4)')
+        await wait_for_gdbserver('127.0.0.1', free_port(), timeout=10, process=process)
+
+    with pytest.raises(GdbError, match='QEMU exited with code 4'):
+        asyncio.run(scenario())
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Stub QEMU is Python script with shebang')
+def test_run_with_gdb_command(tmp_path: Path):
+    port = free_port()
+    qemu = place_python_script(tmp_path / 'qemu', STUB_QEMU)
+    gdb = place_python_script(tmp_path / 'gdb', STUB_GDB)
+
+    returncode = run_with_gdbserver([qemu, '-gdb', f'tcp::{port}', '-m', '1M'], f'tcp::{port}', kernel='k.elf',
+                                    gdb_command=f'{gdb} {tmp_path / "gdb.txt"}', timeout=10)
+
+    assert returncode == 7
+    assert (tmp_path / 'gdb.txt').read_text() == f'k.elf -ex target remote localhost:{port}'
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Stub QEMU is Python script with shebang')
+def test_runner_debug_wait(tmp_path: Path):
+    port = free_port()
+    place_python_script(tmp_path / 'qemu' / 'qemu-system-arm', STUB_QEMU)
+    (tmp_path / 'base.ini').write_text('[general]\nengine = qemu-system-arm\nmemory = 1M\n')
+    run_make_runner('-l', 'base.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    cp = execute_runner(tmp_path / 'runner.pyz', ['--debug', '--debug-listen', f'tcp::{port}', '--debug-wait',
+                                                  'kernel.elf'], cwd=tmp_path, check=False)
+
+    assert cp.returncode == 3
+    assert cp.stderr == f'qemu-runner: gdbserver ready at localhost:{port}\n'
+    assert cp.stdout == 'qemu done\n'
+
+
+# Ctrl-C pressed in debugger reaches whole foreground process group
+STUB_GDB_INTERRUPTED = '''
+import os, signal, sys, time
+interrupted = []
+signal.signal(signal.SIGINT, lambda *_: interrupted.append(True))
+os.killpg(os.getpgrp(), signal.SIGINT)
+time.sleep(0.5)
+sys.exit(7 if interrupted else 1)
+'''
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Stub QEMU is Python script with shebang')
+def test_runner_debug_attach_interrupted(tmp_path: Path):
+    port = free_port()
+    place_python_script(tmp_path / 'qemu' / 'qemu-system-arm', STUB_QEMU)
+    gdb = place_python_script(tmp_path / 'gdb', STUB_GDB_INTERRUPTED)
+    (tmp_path / 'base.ini').write_text('[general]\nengine = qemu-system-arm\nmemory = 1M\n')
+    run_make_runner('-l', 'base.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    # Runner gets its own process group, interrupt sent by stub debugger does not reach pytest
+    cp = subprocess.run(
+        [sys.executable, str(tmp_path / 'runner.pyz'), '--debug', '--debug-listen', f'tcp::{port}',
+         '--debug-attach', gdb, 'kernel.elf'],
+        cwd=tmp_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding='utf-8',
+        start_new_session=True,
+        timeout=30
+    )
+
+    assert cp.returncode == 7
+    assert 'Traceback' not in cp.stderr
+    assert 'KeyboardInterrupt' not in cp.stderr
+
+
+@pytest.mark.parametrize('option', [['--debug-wait'], ['--debug-attach', 'gdb']])
+def test_runner_waiting_for_debugger_starts_halted(tmp_path: Path, option):
+    (tmp_path / 'base.ini').write_text('[general]\nengine = qemu-system-arm\n')
+    run_make_runner('-l', 'base.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    cp = execute_runner(tmp_path / 'runner.pyz', ['--qemu', 'my-qemu', '--debug', *option, '--dry-run', 'kernel.elf'],
+                        cwd=tmp_path)
+
+    assert '-S' in cp.stdout.split()
+
+
+@pytest.mark.parametrize('args', [
+    ['--debug-wait', 'kernel.elf'],
+    ['--debug', '--debug-wait', '--debug-attach', 'gdb', 'kernel.elf'],
+])
+def test_runner_invalid_debug_wait(tmp_path: Path, args):
+    (tmp_path / 'base.ini').write_text('[general]\nengine = qemu-system-arm\n')
+    run_make_runner('-l', 'base.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    cp = execute_runner(tmp_path / 'runner.pyz', ['--qemu', 'my-qemu', *args], cwd=tmp_path, check=False)
+
+    assert cp.returncode == 2
+    assert '--debug-wait' in cp.stderr
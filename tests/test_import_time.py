@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from .test_runner_flow import run_make_runner
+
+NOT_IMPORTED_ON_DRY_RUN = [
+    'argparse',
+    'subprocess',
+    'zipfile',
+    'hashlib',
+    'configparser',
+]
+
+
+def measure_imports(args: List[str], cwd: Path) -> Dict[str, int]:
+    cp = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding='utf-8',
+        env={**os.environ, 'QEMU_DEV': 'my-qemu'}
+    )
+    assert cp.returncode == 0, cp.stderr
+
+    modules = {}
+    for line in cp.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_us, _, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(self_us)
+
+    return modules
+
+
+@pytest.fixture()
+def runner(tmp_path: Path) -> Path:
+    with open(tmp_path / 'layer.ini', 'w') as f:
+        f.write("""
+        [general]
+        engine = qemu-system-arm
+
+        [machine]
+        @ = virt
+        """)
+
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+    return tmp_path / 'runner.pyz'
+
+
+@pytest.mark.parametrize('module', NOT_IMPORTED_ON_DRY_RUN)
+def test_dry_run_does_not_import(tmp_path: Path, runner: Path, module: str):
+    modules = measure_imports([str(runner), '--dry-run', 'kernel.elf'], tmp_path)
+
+    assert 'qemu_runner.make_runner.runner' in modules
+    assert module not in modules
@@ -102,6 +102,16 @@ LAYER_APPLY_CASES = [
             Argument('-gdb')
         ]),
     ),
+    (
+        Layer(MY_ENGINE, [Argument('machine', 'virt')]),
+        Layer(MY_ENGINE, [Argument('device', 'd1'), Argument('device', 'd2'), Argument('-gdb')]),
+        Layer(MY_ENGINE, [
+            Argument('machine', 'virt'),
+            Argument('device', 'd1'),
+            Argument('device', 'd2'),
+            Argument('-gdb')
+        ]),
+    ),
 ]
 
 
@@ -109,3 +119,48 @@ LAYER_APPLY_CASES = [
 def test_apply_layer(base_layer: Layer, addition: Layer, expected: Layer):
     actual = base_layer.apply(addition)
     assert actual == expected
+
+
+def test_fingerprint_equal_layers():
+    layer1 = Layer(MY_ENGINE, [Argument('device', 'd1', {'id': 'id1', 'p1': 'v1'})])
+    layer2 = Layer(GeneralSettings(engine='my-engine'), [Argument('device', 'd1', {'id': 'id1', 'p1': 'v1'})])
+
+    assert fingerprint_layer(layer1) == fingerprint_layer(layer2)
+
+
+@pytest.mark.parametrize('changed', [
+    Layer(MY_ENGINE2, [Argument('device', 'd1', {'id': 'id1', 'p1': 'v1'})]),
+    Layer(GeneralSettings(engine='my-engine', memory='1G'), [Argument('device', 'd1', {'id': 'id1', 'p1': 'v1'})]),
+    Layer(GeneralSettings(engine='my-engine', mode=Mode.User), [Argument('device', 'd1', {'id': 'id1', 'p1': 'v1'})]),
+    Layer(MY_ENGINE, [Argument('device', 'd2', {'id': 'id1', 'p1': 'v1'})]),
+    Layer(MY_ENGINE, [Argument('device', 'd1', {'id': 'id1', 'p1': 'v2'})]),
+    Layer(MY_ENGINE, [Argument('device', 'd1', {'id': 'id1', 'p1': 'v1'}), Argument('machine', 'virt')]),
+])
+def test_fingerprint_changes_with_layer(changed: Layer):
+    base = Layer(MY_ENGINE, [Argument('device', 'd1', {'id': 'id1', 'p1': 'v1'})])
+
+    assert fingerprint_layer(base) != fingerprint_layer(changed)
+
+
+def parse_layer_text(text: str) -> Layer:
+    from configparser import ConfigParser
+    parser = ConfigParser()
+    parser.read_string(text)
+    return parse_layer(parser)
+
+
+@pytest.mark.parametrize('layer', [
+    Layer(),
+    Layer(MY_ENGINE),
+    Layer(GeneralSettings(engine='my-engine', mode=Mode.User, kernel='/k.elf', kernel_cmdline='a "b c"',
+                          gdb=True, gdb_dev='tcp::1234', halted=False, memory='1G')),
+    Layer(MY_ENGINE, [
+        Argument('machine', 'virt'),
+        Argument('device', 'd1', {'id': 'id1', 'p1': 'v1', 'path': '${KERNEL_DIR}/disk.img'}),
+        Argument('semihosting-config', None, {'enable': 'on', 'arg': '50%'}),
+        Argument('append', 'line1\nline2'),
+        Argument('nographic'),
+    ]),
+])
+def test_format_layer_round_trip(layer: Layer):
+    assert parse_layer_text(format_layer(layer)) == layer
@@ -0,0 +1,120 @@
+import marshal
+import zipfile
+from configparser import ConfigParser
+from pathlib import Path
+
+import pytest
+
+from qemu_runner import Runner
+from qemu_runner.argument import Argument
+from qemu_runner.layer import Layer, GeneralSettings, Mode, parse_layer
+from qemu_runner.layer_binary import dump_layer_binary, load_layer_binary, LayerFormatError, BINARY_LAYER_VERSION
+from qemu_runner.layer_locator import COMBINED_LAYER_NAME, COMBINED_BINARY_LAYER_NAME
+
+from .test_runner_flow import run_make_runner, execute_runner
+
+BASE_LAYER = """
+[general]
+engine = qemu-system-arm
+memory = 128M
+
+[machine]
+@ = virt
+"""
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    BASE_LAYER,
+    '[general]\nengine = e\nmode = user\nkernel = k.elf\ncmdline = a\n  b\nhalted = yes\ngdb = off\ngdb_dev = tcp::1\n',
+    '[device:d1]\n@ = virtio\nbus = pci.0\n[device:d2]\n[drive]\nfile = a%%b\n',
+    '[DEFAULT]\nshared = 1\n[chardev:c]\n@ = socket\npath = %(shared)s/x\n',
+])
+def test_round_trip(text: str):
+    parser = ConfigParser()
+    parser.read_string(text)
+    layer = parse_layer(parser)
+
+    loaded = load_layer_binary(dump_layer_binary(layer))
+
+    assert loaded == layer
+    assert repr(loaded) == repr(layer)
+
+
+def test_round_trip_of_constructed_layer():
+    layer = Layer(GeneralSettings(engine='e', mode=Mode.System, cpu='cortex-a15'), [
+        Argument('device', 5, {'id': 'd1', 'flag': None, 'size': 10}),
+        Argument('nographic'),
+    ])
+
+    loaded = load_layer_binary(dump_layer_binary(layer))
+
+    assert repr(loaded) == repr(layer)
+    assert loaded.general.mode is Mode.System
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'[general]\nengine = e\n',
+    b'QRL' + bytes([BINARY_LAYER_VERSION + 1]) + b'\0',
+    b'QRL' + bytes([BINARY_LAYER_VERSION]) + b'\xff\xff',
+    b'QRL' + bytes([BINARY_LAYER_VERSION]) + marshal.dumps((('engine',), ('e',), ())),
+])
+def test_invalid_binary_layer(data: bytes):
+    with pytest.raises(LayerFormatError):
+        load_layer_binary(data)
+
+
+def replace_in_archive(path: Path, name: str, content: bytes) -> None:
+    with zipfile.ZipFile(path, 'r') as archive:
+        entries = [(info, archive.read(info)) for info in archive.infolist()]
+
+    with open(path, 'rb') as f:
+        # Preserve shebang or anything else preceding archive
+        prefix = f.read(entries[0][0].header_offset) if entries else b''
+
+    with open(path, 'wb') as f:
+        f.write(prefix)
+        with zipfile.ZipFile(f, 'w') as archive:
+            for info, data in entries:
+                archive.writestr(info, content if info.filename == name else data)
+
+
+@pytest.fixture()
+def runner(tmp_path: Path) -> Path:
+    (tmp_path / 'base.ini').write_text(BASE_LAYER)
+    (tmp_path / 'riscv.ini').write_text('[general]\nengine = qemu-system-riscv64\n')
+    run_make_runner('-l', 'base.ini', '-p', 'riscv', 'riscv.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+    return tmp_path / 'runner.pyz'
+
+
+def dry_run(runner: Path, *args: str):
+    return execute_runner(runner, ['--qemu', 'my-qemu', '--dry-run', *args, 'kernel.elf'],
+                          cwd=runner.parent).stdout.split()
+
+
+def test_runner_contains_binary_layers(runner: Path):
+    with zipfile.ZipFile(runner, 'r') as archive:
+        base = load_layer_binary(archive.read(f'embedded_layers/layers/{COMBINED_BINARY_LAYER_NAME}'))
+        profile = load_layer_binary(
+            archive.read(f'embedded_layers/layers/profiles/riscv/{COMBINED_BINARY_LAYER_NAME}')
+        )
+
+    assert base.general == GeneralSettings(engine='qemu-system-arm', memory='128M')
+    assert profile.general == GeneralSettings(engine='qemu-system-riscv64', memory='128M')
+
+
+def test_runner_loads_binary_layer(runner: Path):
+    expected = dry_run(runner, '--profile', 'riscv')
+    replace_in_archive(runner, f'embedded_layers/layers/profiles/riscv/{COMBINED_LAYER_NAME}', b'[broken')
+
+    assert dry_run(runner, '--profile', 'riscv') == expected
+    assert Runner.open(runner, profile='riscv').layer.general.engine == 'qemu-system-riscv64'
+
+
+def test_runner_falls_back_to_ini_layer(runner: Path):
+    expected = dry_run(runner, '--profile', 'riscv')
+    replace_in_archive(runner, f'embedded_layers/layers/profiles/riscv/{COMBINED_BINARY_LAYER_NAME}', b'QRL\0')
+
+    assert dry_run(runner, '--profile', 'riscv') == expected
+    assert Runner.open(runner, profile='riscv').layer.general.engine == 'qemu-system-riscv64'
@@ -142,3 +142,47 @@ def test_resolve_engine_path():
 
     assert cmdline == ['abc']
     find_qemu_func.assert_called_once_with('my-engine')
+
+
+def device_with_path(path: str) -> Argument:
+    return Argument('device', 'val1', attributes={'id': 'id1', 'path': path})
+
+
+def test_lazy_variables(tmp_path, monkeypatch):
+    kernel = tmp_path / 'kernel.elf'
+    kernel.write_bytes(b'kernel')
+    monkeypatch.setenv('MY_VARIABLE', 'from-env')
+    monkeypatch.delenv('MISSING_VARIABLE', raising=False)
+    layer = Layer(GeneralSettings(engine='my-engine', kernel=str(kernel)), arguments=[
+        device_with_path('${KERNEL_NAME}:${ENV:MY_VARIABLE}:${ENV:MISSING_VARIABLE}:${RUNNER_DIR}'),
+        Argument('device', attributes={'id': 'id2', 'hash': '${KERNEL_SHA256}', 'tmp': '${TMPDIR}'}),
+    ])
+
+    cmdline = build_command_line(layer, runner_dir='/runners')
+
+    import hashlib
+    import tempfile
+    assert cmdline[2] == 'val1,id=id1,path=kernel.elf:from-env:${ENV:MISSING_VARIABLE}:/runners'
+    assert cmdline[4] == f'id=id2,hash={hashlib.sha256(b"kernel").hexdigest()},tmp={tempfile.gettempdir()}'
+
+
+def test_variables_computed_only_when_referenced(monkeypatch):
+    hash_file = Mock(return_value='abcd')
+    monkeypatch.setattr('qemu_runner.hashing.hash_file', hash_file)
+    kernel_settings = GeneralSettings(engine='my-engine', kernel='kernel.elf')
+
+    build_command_line(Layer(kernel_settings, arguments=[device_with_path('${KERNEL_NAME}')]))
+    hash_file.assert_not_called()
+
+    cmdline = build_command_line(Layer(kernel_settings, arguments=[
+        device_with_path('${KERNEL_SHA256}'),
+        Argument('device', attributes={'id': 'id2', 'hash': '${KERNEL_SHA256}.bin'}),
+    ]))
+    assert cmdline[1:5] == ['-device', 'val1,id=id1,path=abcd', '-device', 'id=id2,hash=abcd.bin']
+    hash_file.assert_called_once_with('kernel.elf')
+
+
+def test_runner_dir_is_unresolved_without_runner():
+    cmdline = build_command_line(Layer(MY_ENGINE, arguments=[device_with_path('${RUNNER_DIR}/a')]))
+
+    assert cmdline == ['my-engine', '-device', 'val1,id=id1,path=${RUNNER_DIR}/a']
@@ -0,0 +1,115 @@
+import random
+from configparser import ConfigParser
+from typing import Optional
+
+import pytest
+
+from qemu_runner.layer import Layer, parse_layer
+from qemu_runner.layer_parser import parse_layer_text, LayerSyntaxError
+
+HEADERS = [
+    '[general]', '[device]', '[device:d1]', '[device:d2]', '[machine]', '[DEFAULT]', '[ general ]', '[a]b]', '[]',
+    '[drive:x:y]',
+]
+
+OPTIONS = [
+    'engine = qemu-system-arm', 'Memory: 128M', '@ = virt', '@=', 'attr = %(other)s', 'other = value', 'gdb = yes',
+    'gdb = maybe', 'halted=on', 'mode = user', 'mode = kernel', 'id = x', 'p = 100%%', 'q = 5%', 'key', '= v',
+    'a = b = c', 'cmdline = a b c', 'kernel:k.elf', 'loop = %(loop)s', 'r = %(missing)s', 'ATTR = upper',
+    'x = %(other', 'gdb_dev = tcp::1234',
+]
+
+OTHER_LINES = ['', '   ', '# comment', '; comment', '  # indented comment', 'continued line', '[not a header']
+
+INDENTS = ['', '', '', '  ', '\t']
+
+
+def parse_with_config_parser(text: str) -> Optional[Layer]:
+    parser = ConfigParser()
+    parser.read_string(text)
+    return parse_layer(parser)
+
+
+def outcome(parse, text: str) -> str:
+    try:
+        return repr(parse(text))
+    except Exception:
+        return 'error'
+
+
+def random_layer_text(rng: random.Random) -> str:
+    lines = [rng.choice(HEADERS)] if rng.random() < 0.8 else []
+    for _ in range(rng.randint(1, 12)):
+        kind = rng.random()
+        if kind < 0.25:
+            line = rng.choice(HEADERS)
+        elif kind < 0.8:
+            line = rng.choice(OPTIONS)
+        else:
+            line = rng.choice(OTHER_LINES)
+        lines.append(rng.choice(INDENTS) + line)
+
+    return '\n'.join(lines)
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    '[general]\nengine = qemu-system-arm\nmemory = 128M\n',
+    '[device:d1]\n@ = virtio\nBus = pci.0\n',
+    '[general]\ncmdline = a\n  b\n\n  c\n\n',
+    '[general]\ncmdline = a\n\n# comment\n  b\n',
+    '    [general]\n    engine = e\n      continued\n    [machine]\n    @ = virt\n',
+    '[DEFAULT]\nbus = pci.0\n[device:d1]\n@ = virtio\n[device:d2]\nbus = usb\n',
+    '[device]\nbase = /dir\npath = %(base)s/file\npercent = 50%%\n',
+    '[general]\nengine: e\nkernel : k.elf\n',
+    '[general]\nhalted = On\ngdb = 0\nmode = system\n',
+    '[a]b]\nx = 1\n',
+    '[drive:x:y]\nfile = a\n',
+    '[device]\nid = explicit\n',
+    # Errors
+    '[general]\nmode = kernel\n',
+    '[general]\nhalted = maybe\n',
+    '[device]\n[device]\n',
+    '[device]\na = 1\nA = 2\n',
+    'a = 1\n[device]\n',
+    '[device]\nno value\n',
+    '[device]\n= value\n',
+    '[device]\np = 5%\n',
+    '[device]\np = %(missing)s\n',
+    '[device]\np = %(p)s\n',
+    '[general]\nunknown = 5%\n',
+])
+def test_same_result_as_config_parser(text: str):
+    assert outcome(parse_layer_text, text) == outcome(parse_with_config_parser, text)
+
+
+def test_same_result_as_config_parser_random():
+    rng = random.Random(1234)
+    parsed = 0
+
+    for _ in range(3000):
+        text = random_layer_text(rng)
+        expected = outcome(parse_with_config_parser, text)
+        assert outcome(parse_layer_text, text) == expected, text
+        parsed += expected != 'error'
+
+    # Make sure both valid and invalid layers were compared
+    assert 300 < parsed < 2700
+
+
+@pytest.mark.parametrize(('text', 'line', 'message'), [
+    ('[general]\nengine = e\n\nmode = kernel\n', 4, 'Possible mode values: system, user'),
+    ('[general]\nhalted = maybe\n', 2, 'Not a boolean: maybe'),
+    ('[device:d1]\n@ = a\n\n[device:d1]\n', 4, 'Duplicate section [device:d1]'),
+    ('[device]\na = 1\na = 2\n', 3, "Duplicate key 'a' in section [device]"),
+    ('# comment\na = 1\n', 2, 'Expected section header before first option'),
+    ('[device]\n\nno value\n', 3, "Expected key = value, got 'no value'"),
+    ('[device]\na = 1\np = 5%\n', 3, "'%' must be followed by '%' or '(', found: '%'"),
+])
+def test_error_line_numbers(text: str, line: int, message: str):
+    with pytest.raises(LayerSyntaxError) as e:
+        parse_layer_text(text, source='test.ini')
+
+    assert e.value.line == line
+    assert e.value.message == message
+    assert str(e.value) == f'test.ini, line {line}: {message}'
@@ -0,0 +1,88 @@
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from qemu_runner.layer import Layer, GeneralSettings, Argument, format_layer
+from qemu_runner.layer_locator import COMBINED_LAYER_NAME
+from qemu_runner.make_runner.make import combine_layers, LayerValidationError
+
+from .test_runner_flow import run_make_runner, execute_runner
+
+BASE_LAYER = """
+[general]
+engine = qemu-system-arm
+memory = 128M
+
+[machine]
+@ = virt
+"""
+
+
+def test_combine_layers():
+    combined = combine_layers([BASE_LAYER, '[device:d1]\n@ = test\n[general]\nmemory = 256M\n'])
+
+    assert combined == Layer(GeneralSettings(engine='qemu-system-arm', memory='256M'), [
+        Argument('machine', 'virt'),
+        Argument('device', 'test', {'id': 'd1'}),
+    ])
+
+
+@pytest.mark.parametrize(('content', 'message'), [
+    ('[general]\nmode = kernel\n', 'bad.ini, line 2: Possible mode values: system, user'),
+    ('[general]\nhalted = maybe\n', 'bad.ini, line 2: Not a boolean: maybe'),
+    ('[device:d1]\n@ = a\n[device:d1]\n@ = b\n', 'bad.ini, line 3: Duplicate section [device:d1]'),
+    ('@ = a\n', 'bad.ini, line 1: Expected section header before first option'),
+])
+def test_invalid_layer_rejected(content: str, message: str):
+    with pytest.raises(LayerValidationError) as e:
+        combine_layers([BASE_LAYER, content], ['base.ini', 'bad.ini'])
+
+    assert str(e.value).startswith(message)
+
+
+def test_make_fails_on_invalid_layer(tmp_path: Path):
+    (tmp_path / 'base.ini').write_text(BASE_LAYER)
+    (tmp_path / 'bad.ini').write_text('[general]\nhalted = maybe\n')
+
+    cp = subprocess.run(
+        [sys.executable, '-m', 'qemu_runner.make_runner', '-l', 'base.ini', 'bad.ini', '-o', 'runner.pyz'],
+        cwd=tmp_path,
+        stderr=subprocess.PIPE,
+        encoding='utf-8'
+    )
+
+    assert cp.returncode == 1
+    assert 'bad.ini, line 2: Not a boolean: maybe' in cp.stderr
+    assert not (tmp_path / 'runner.pyz').exists()
+
+
+def test_derive_fails_on_invalid_layer(tmp_path: Path):
+    (tmp_path / 'base.ini').write_text(BASE_LAYER)
+    (tmp_path / 'bad.ini').write_text('[general]\nmode = kernel\n')
+    run_make_runner('-l', 'base.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    cp = execute_runner(tmp_path / 'runner.pyz', ['--layers', 'bad.ini', '--derive', 'derived.pyz'], cwd=tmp_path,
+                        check=False)
+
+    assert cp.returncode == 1
+    assert 'bad.ini, line 2: Possible mode values: system, user' in cp.stderr
+    assert not (tmp_path / 'derived.pyz').exists()
+
+
+def test_runner_uses_combined_layer(tmp_path: Path):
+    (tmp_path / 'base.ini').write_text(BASE_LAYER)
+    (tmp_path / 'extra.ini').write_text('[general]\nmemory = 256M\n[device:d1]\n@ = test\n')
+    run_make_runner('-l', 'base.ini', 'extra.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    with zipfile.ZipFile(tmp_path / 'runner.pyz', 'r') as archive:
+        stored = archive.read(f'embedded_layers/layers/{COMBINED_LAYER_NAME}').decode('utf-8')
+
+    assert stored == format_layer(combine_layers([BASE_LAYER, (tmp_path / 'extra.ini').read_text()]))
+
+    cp = execute_runner(tmp_path / 'runner.pyz', ['--qemu', 'my-qemu', '--dry-run', 'kernel.elf'], cwd=tmp_path)
+
+    assert cp.stdout.split() == ['my-qemu', '-machine', 'virt', '-device', 'test,id=d1', '-m', '256M',
+                                 '-kernel', str(tmp_path / 'kernel.elf')]
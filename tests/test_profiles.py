@@ -0,0 +1,184 @@
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from qemu_runner.elf import ELF_MACHINES
+from qemu_runner.profile import parse_profile_match, ProfileError
+
+from .test_runner_flow import run_make_runner, execute_runner
+from .test_utllities import place_elf
+
+COMMON_LAYER = """
+[general]
+memory = 128M
+"""
+
+ARM_LAYER = """
+[general]
+engine = qemu-system-arm
+
+[machine]
+@ = virt
+"""
+
+RISCV_LAYER = """
+[general]
+engine = qemu-system-riscv64
+
+[machine]
+@ = sifive_u
+"""
+
+
+@pytest.fixture()
+def runner(tmp_path: Path) -> Path:
+    (tmp_path / 'common.ini').write_text(COMMON_LAYER)
+    (tmp_path / 'arm.ini').write_text(ARM_LAYER)
+    (tmp_path / 'riscv.ini').write_text(RISCV_LAYER)
+
+    run_make_runner(
+        '-l', 'common.ini',
+        '-p', 'arm', 'arm.ini',
+        '-p', 'riscv', 'riscv.ini',
+        '--profile-match', 'arm', 'machine=arm,class=32',
+        '--profile-match', 'riscv', 'machine=riscv',
+        '-o', tmp_path / 'runner.pyz',
+        cwd=tmp_path
+    )
+    return tmp_path / 'runner.pyz'
+
+
+def dry_run(runner: Path, *args: str) -> List[str]:
+    cp = execute_runner(runner, ['--qemu-dir', 'no-such-dir', '--dry-run', *args], cwd=runner.parent)
+    return [Path(cp.stdout.split()[0]).name, *cp.stdout.split()[1:]]
+
+
+@pytest.mark.parametrize(('text', 'expected'), [
+    ('machine=arm', {'machine': 40}),
+    ('machine=243, class=64', {'machine': 243, 'class': 64}),
+    ('machine=AArch64,endian=little', {'machine': 183, 'endian': 'little'}),
+])
+def test_parse_profile_match(text: str, expected: dict):
+    assert parse_profile_match(text) == expected
+
+
+@pytest.mark.parametrize('text', ['machine=vax', 'class=16', 'endian=middle', 'cpu=cortex-m3', 'machine'])
+def test_parse_invalid_profile_match(text: str):
+    with pytest.raises(ProfileError):
+        parse_profile_match(text)
+
+
+def test_select_profile_by_elf_header(tmp_path: Path, runner: Path):
+    place_elf(tmp_path / 'arm.elf', ELF_MACHINES['arm'], 32)
+    place_elf(tmp_path / 'riscv.elf', ELF_MACHINES['riscv'], 64)
+
+    assert dry_run(runner, 'arm.elf') == [
+        'qemu-system-arm', '-machine', 'virt', '-m', '128M', '-kernel', str(tmp_path / 'arm.elf')
+    ]
+    assert dry_run(runner, 'riscv.elf') == [
+        'qemu-system-riscv64', '-machine', 'sifive_u', '-m', '128M', '-kernel', str(tmp_path / 'riscv.elf')
+    ]
+
+
+def test_marker_section_overrides_header(tmp_path: Path, runner: Path):
+    place_elf(tmp_path / 'kernel.elf', ELF_MACHINES['arm'], 32, sections={'.qemu_runner_profile': b'riscv\0'})
+
+    assert dry_run(runner, 'kernel.elf')[0] == 'qemu-system-riscv64'
+
+
+@pytest.mark.parametrize(('kernel', 'message'), [
+    ('aarch64.elf', 'No profile matches kernel'),
+    ('missing.elf', 'No profile matches kernel'),
+    ('marker.elf', "requests unknown profile 'x86'"),
+])
+def test_profile_not_selected(tmp_path: Path, runner: Path, kernel: str, message: str):
+    place_elf(tmp_path / 'aarch64.elf', ELF_MACHINES['aarch64'], 64)
+    place_elf(tmp_path / 'marker.elf', ELF_MACHINES['arm'], 32, sections={'.qemu_runner_profile': b'x86\0'})
+
+    cp = execute_runner(runner, ['--dry-run', kernel], cwd=tmp_path, check=False)
+
+    assert cp.returncode == 1
+    assert message in cp.stderr
+
+
+def test_explicit_profile_overrides_elf_header(tmp_path: Path, runner: Path):
+    place_elf(tmp_path / 'arm.elf', ELF_MACHINES['arm'], 32)
+
+    assert dry_run(runner, '--profile', 'riscv', 'arm.elf')[:3] == ['qemu-system-riscv64', '-machine', 'sifive_u']
+    assert dry_run(runner, '--profile', 'arm', 'not-elf.bin')[:3] == ['qemu-system-arm', '-machine', 'virt']
+
+
+def test_unknown_explicit_profile(tmp_path: Path, runner: Path):
+    cp = execute_runner(runner, ['--profile', 'x86', '--dry-run', 'kernel.elf'], cwd=tmp_path, check=False)
+
+    assert cp.returncode == 1
+    assert 'Unknown profile x86, available profiles: arm, riscv' in cp.stderr
+
+
+def test_explicit_profile_requires_profiles(tmp_path: Path):
+    (tmp_path / 'arm.ini').write_text(ARM_LAYER)
+    run_make_runner('-l', 'arm.ini', '-o', tmp_path / 'plain.pyz', cwd=tmp_path)
+
+    cp = execute_runner(tmp_path / 'plain.pyz', ['--profile', 'arm', '--dry-run', 'kernel.elf'], cwd=tmp_path,
+                        check=False)
+
+    assert cp.returncode != 0
+    assert 'runner has no profiles' in cp.stderr
+
+
+def test_open_runner_profile(runner: Path):
+    from qemu_runner import Runner
+
+    assert Runner.list_profiles(runner) == ['arm', 'riscv']
+    assert not Runner.open(runner).layer.general.engine
+
+    layer = Runner.open(runner, profile='riscv').layer
+    assert layer.general.engine == 'qemu-system-riscv64'
+    assert layer.general.memory == '128M'
+
+    with pytest.raises(ProfileError):
+        Runner.open(runner, profile='x86')
+
+
+def test_derived_layers_applied_on_top_of_profiles(tmp_path: Path, runner: Path):
+    (tmp_path / 'derived.ini').write_text('[general]\nmemory = 1G\n')
+    execute_runner(runner, ['--layers', 'derived.ini', '--derive', 'derived.pyz'], cwd=tmp_path)
+
+    place_elf(tmp_path / 'arm.elf', ELF_MACHINES['arm'], 32)
+    place_elf(tmp_path / 'riscv.elf', ELF_MACHINES['riscv'], 64)
+
+    assert dry_run(tmp_path / 'derived.pyz', 'arm.elf') == [
+        'qemu-system-arm', '-machine', 'virt', '-m', '1G', '-kernel', str(tmp_path / 'arm.elf')
+    ]
+    assert dry_run(tmp_path / 'derived.pyz', 'riscv.elf')[:5] == [
+        'qemu-system-riscv64', '-machine', 'sifive_u', '-m', '1G'
+    ]
+
+
+def test_inspect_lists_profiles(tmp_path: Path, runner: Path):
+    cp = execute_runner(runner, ['--inspect'], cwd=tmp_path)
+
+    assert '# Profile arm, layer embedded_layers/profiles/arm/0.ini:' in cp.stdout
+    assert '# Profile riscv, combined layer:' in cp.stdout
+
+
+@pytest.mark.parametrize('args', [
+    ['-p', 'arm'],
+    ['-p', 'a/b', 'arm.ini'],
+    ['-p', 'arm', 'arm.ini', '-p', 'arm', 'arm.ini'],
+    ['-p', 'arm', 'arm.ini', '--profile-match', 'riscv', 'machine=riscv'],
+    ['-p', 'arm', 'arm.ini', '--profile-match', 'arm', 'machine=vax'],
+])
+def test_invalid_profiles_rejected(tmp_path: Path, args: List[str]):
+    (tmp_path / 'arm.ini').write_text(ARM_LAYER)
+
+    cp = subprocess.run(
+        [sys.executable, '-m', 'qemu_runner.make_runner', *args, '-o', 'runner.pyz'],
+        cwd=tmp_path,
+        stderr=subprocess.PIPE
+    )
+
+    assert cp.returncode != 0
@@ -0,0 +1,91 @@
+import io
+import pstats
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from qemu_runner.make_runner.profiling import SamplingProfiler
+
+from .test_runner_flow import run_make_runner, execute_runner
+from .test_utllities import place_echo_args, with_env
+
+
+def function_names(path: Path):
+    return {name for _, _, name in pstats.Stats(str(path)).stats}
+
+
+@pytest.fixture()
+def runner(tmp_path: Path) -> Path:
+    (tmp_path / 'base.ini').write_text('[general]\nengine = qemu-system-arm\n\n[machine]\n@ = virt\n')
+    run_make_runner('-l', 'base.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+    return tmp_path / 'runner.pyz'
+
+
+def run_profiled(runner: Path, *args: str):
+    with with_env({'QEMU_RUNNER_PROFILE': runner.parent / 'runner.prof'}):
+        return execute_runner(runner, list(args), cwd=runner.parent)
+
+
+def test_profile_dry_run(runner: Path):
+    cp = run_profiled(runner, '--qemu', 'my-qemu', '--dry-run', 'kernel.elf')
+
+    assert cp.stdout.split()[:3] == ['my-qemu', '-machine', 'virt']
+    names = function_names(runner.parent / 'runner.prof')
+    assert {'execute_runner', 'build_command_line', 'parse_runner_args'} <= names
+
+
+def test_profile_stops_before_qemu(runner: Path):
+    qemu = place_echo_args(runner.parent / 'qemu' / 'qemu-system-arm')
+
+    cp = run_profiled(runner, '--qemu', qemu, 'kernel.elf')
+
+    assert cp.stdout.splitlines()[0].lower() == qemu
+    names = function_names(runner.parent / 'runner.prof')
+    assert 'execute_runner' in names
+    assert 'execute_process' not in names
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Zygote requires Unix sockets')
+def test_profile_covers_direct_launch_without_zygote(runner: Path):
+    qemu = place_echo_args(runner.parent / 'qemu' / 'qemu-system-arm')
+
+    with with_env({'QEMU_RUNNER_ZYGOTE': runner.parent / 'not-running.sock'}):
+        run_profiled(runner, '--qemu', qemu, 'kernel.elf')
+
+    names = function_names(runner.parent / 'runner.prof')
+    assert {'execute_via_zygote', 'build_command_line'} <= names
+    assert 'execute_process' not in names
+
+
+def test_profile_not_written_by_default(runner: Path):
+    execute_runner(runner, ['--qemu', 'my-qemu', '--dry-run', 'kernel.elf'], cwd=runner.parent)
+
+    assert not (runner.parent / 'runner.prof').exists()
+
+
+def busy_loop(duration: float) -> None:
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_sampling_profiler(tmp_path: Path):
+    profiler = SamplingProfiler()
+    profiler.enable()
+    busy_loop(0.2)
+    profiler.disable()
+    profiler.dump_stats(str(tmp_path / 'sampled.prof'))
+
+    stats = pstats.Stats(str(tmp_path / 'sampled.prof'))
+    busy = [value for key, value in stats.stats.items() if key[2] == 'busy_loop']
+    assert len(busy) == 1
+    calls, _, _, cumulative, callers = busy[0]
+    assert calls > 10
+    assert 0.01 < cumulative <= 0.3
+    assert any(caller[2] == 'test_sampling_profiler' for caller in callers)
+
+    stats.stream = io.StringIO()
+    stats.sort_stats('cumulative').print_stats(5).print_callers('busy_loop')
+    assert 'busy_loop' in stats.stream.getvalue()
@@ -1,6 +1,12 @@
+import copy
+import dataclasses
+import pickle
+
 import pytest
 
+from qemu_runner import argument
 from qemu_runner.argument import *
+from qemu_runner.argument import AttributeMap
 
 
 @pytest.mark.parametrize(('arg', 'cmdline'), [
@@ -170,3 +176,123 @@ def test_argument_id_matches(a: Argument, b: Argument):
 ])
 def test_argument_id_not_matches(a: Argument, b: Argument):
     assert not a.id_matches(b)
+
+
+def test_argument_is_slotted_and_frozen():
+    arg = Argument('device', 'virtio', {'id': 'a', 'bus': 'pci.0'})
+
+    assert not hasattr(arg, '__dict__')
+    with pytest.raises(AttributeError):
+        arg.value = 'other'
+    # Frozen dataclass with slots reports unknown attribute as TypeError on some Python versions
+    with pytest.raises((AttributeError, TypeError)):
+        arg.extra = 1
+
+
+def test_argument_is_dataclass():
+    arg = Argument('device', 'virtio', {'id': 'a', 'bus': 'pci.0'})
+
+    assert [f.name for f in dataclasses.fields(arg)] == ['name', 'value', 'attributes']
+    assert dataclasses.replace(arg, value='other') == Argument('device', 'other', {'id': 'a', 'bus': 'pci.0'})
+    assert dataclasses.asdict(arg) == {'name': 'device', 'value': 'virtio', 'attributes': {'id': 'a', 'bus': 'pci.0'}}
+
+
+def test_shared_attribute_keys_are_capped(monkeypatch):
+    monkeypatch.setattr(argument, '_ATTRIBUTE_KEYS', {})
+    monkeypatch.setattr(argument, 'MAX_SHARED_ATTRIBUTE_KEYS', 2)
+
+    maps = [AttributeMap({f'key{i}': i}) for i in range(5)]
+
+    assert len(argument._ATTRIBUTE_KEYS) == 2
+    assert [dict(m) for m in maps] == [{f'key{i}': i} for i in range(5)]
+
+
+def test_argument_names_and_keys_are_shared():
+    a = Argument(''.join(['dev', 'ice']), attributes={''.join(['b', 'us']): 'pci.0', 'id': 'a'})
+    b = Argument('device', attributes={'bus': 'usb', 'id': 'b'})
+
+    assert a.name is b.name
+    assert a.attributes._keys is b.attributes._keys
+
+
+@pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+def test_argument_pickle(protocol: int):
+    arg = Argument('device', 'virtio', {'id': 'a', 'flag': None, 'size': 10})
+    arg.template  # cached template is not part of pickled state
+
+    loaded = pickle.loads(pickle.dumps(arg, protocol))
+
+    assert loaded == arg
+    assert repr(loaded) == repr(arg)
+    assert build_command_line_for_argument(loaded) == build_command_line_for_argument(arg)
+
+
+@pytest.mark.parametrize('make_copy', [copy.copy, copy.deepcopy])
+def test_argument_copy(make_copy):
+    arg = Argument('device', 'virtio', {'id': 'a', 'size': 10})
+
+    copied = make_copy(arg)
+
+    assert copied == arg
+    assert hash(copied) == hash(arg)
+    with pytest.raises(AttributeError):
+        copied.value = 'other'
+
+
+def test_attributes_compare_regardless_of_order():
+    a = Argument('device', attributes={'id': 'a', 'bus': 'pci.0'})
+    b = Argument('device', attributes={'bus': 'pci.0', 'id': 'a'})
+
+    assert a == b
+    assert hash(a) == hash(b)
+    assert a.attributes.get('missing') is None
+    with pytest.raises(KeyError):
+        a.attributes['missing']
+
+
+def test_argument_template_resolves_only_variables():
+    arg = Argument('device', 'virtio', {'id': 'a', 'path': '${DIR}/disk.img', 'size': 10, 'ro': None,
+                                        'backup': 'x${DIR}'})
+    resolved = []
+
+    def resolver(value: str) -> str:
+        resolved.append(value)
+        return value.replace('${DIR}', '/tmp')
+
+    assert arg.template.has_variables
+    assert build_command_line_for_argument(arg, resolver) == [
+        '-device', 'virtio,id=a,path=/tmp/disk.img,size=10,ro,backup=x/tmp'
+    ]
+    assert resolved == ['${DIR}/disk.img', 'x${DIR}']
+    assert arg.template is arg.template
+
+
+def test_argument_template_without_variables():
+    arg = Argument('device', 'virtio', {'id': 'a', 'bus': 'pci.0'})
+
+    def resolver(value: str) -> str:
+        raise AssertionError(f'Resolver called for {value}')
+
+    assert not arg.template.has_variables
+    first = build_command_line_for_argument(arg, resolver)
+    first.append('modified')
+    assert build_command_line_for_argument(arg, resolver) == ['-device', 'virtio,id=a,bus=pci.0']
+
+
+def test_slotted_dataclass_fallback(monkeypatch):
+    # Path taken on Python 3.8 and 3.9, exercised on any version
+    monkeypatch.setattr(argument.sys, 'version_info', (3, 9))
+
+    @argument._frozen_slotted_dataclass
+    class Point(argument._TemplateSlot):
+        x: int
+        y: int = 0
+
+    point = Point(1)
+
+    assert Point.__slots__ == ('x', 'y')
+    assert not hasattr(point, '__dict__')
+    assert dataclasses.replace(point, y=2) == Point(1, 2)
+    assert copy.deepcopy(point) == point
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        point.x = 3
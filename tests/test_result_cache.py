@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from qemu_runner.hashing import hash_file, HASH_CHUNK_SIZE
+from qemu_runner.result_cache import ResultCache, CachedResult, parse_size
+
+from .test_runner_flow import run_make_runner, execute_runner
+from .test_utllities import place_python_script, with_env
+
+STUB_QEMU = '''
+import os, sys
+
+with open(os.environ['STUB_LOG'], 'a') as f:
+    f.write('run\\n')
+
+print('out', *sys.argv[1:])
+print('err', file=sys.stderr)
+sys.exit(int(os.environ.get('STUB_EXIT_CODE', '0')))
+'''
+
+
+@pytest.mark.parametrize('size', [0, 1, 1000, HASH_CHUNK_SIZE, HASH_CHUNK_SIZE * 2 + 17])
+def test_hash_file(tmp_path: Path, size: int):
+    content = os.urandom(size)
+    (tmp_path / 'file.bin').write_bytes(content)
+
+    assert hash_file(tmp_path / 'file.bin') == hashlib.sha256(content).hexdigest()
+
+
+@pytest.mark.parametrize(('text', 'expected'), [
+    ('100', 100),
+    ('2K', 2048),
+    ('3m', 3 * 1024 * 1024),
+    ('1G', 1024 * 1024 * 1024),
+])
+def test_parse_size(text: str, expected: int):
+    assert parse_size(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', 'foo', '10Q', 'K', '-5M'])
+def test_parse_invalid_size(text: str):
+    with pytest.raises(ValueError):
+        parse_size(text)
+
+
+def test_runner_rejects_drive_overlays(tmp_path: Path):
+    (tmp_path / 'layer.ini').write_text('[general]\nengine = qemu-system-arm\n')
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    cp = execute_runner(tmp_path / 'runner.pyz', ['--qemu', 'my-qemu', '--result-cache', tmp_path / 'cache',
+                                                  '--drive-overlays', 'kernel.elf'], cwd=tmp_path, check=False)
+
+    assert cp.returncode == 2
+    assert '--result-cache and --drive-overlays' in cp.stderr
+
+
+@pytest.mark.parametrize('size', ['foo', '10Q'])
+def test_runner_rejects_invalid_max_size(tmp_path: Path, size: str):
+    (tmp_path / 'layer.ini').write_text('[general]\nengine = qemu-system-arm\n')
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    cp = execute_runner(tmp_path / 'runner.pyz', ['--qemu', 'my-qemu', '--result-cache', tmp_path / 'cache',
+                                                  '--result-cache-max-size', size, 'kernel.elf'],
+                        cwd=tmp_path, check=False)
+
+    assert cp.returncode == 2
+    assert f"invalid size '{size}'" in cp.stderr
+    assert 'Traceback' not in cp.stderr
+
+
+def test_cache_round_trip(tmp_path: Path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    result = CachedResult(returncode=3, stdout=b'out\nline2\n', stderr=b'\x00err')
+
+    assert cache.get('abc') is None
+
+    cache.put('abc', result)
+
+    assert cache.get('abc') == result
+    assert cache.get('def') is None
+
+
+def test_cache_evicts_by_age(tmp_path: Path):
+    cache = ResultCache(str(tmp_path), max_age=60)
+    cache.put('old', CachedResult(0, b'', b''))
+    cache.put('new', CachedResult(0, b'', b''))
+
+    old_time = time.time() - 120
+    os.utime(tmp_path / 'old.result', (old_time, old_time))
+
+    assert cache.get('old') is None
+    assert cache.get('new') is not None
+
+    cache.evict()
+    assert not (tmp_path / 'old.result').exists()
+
+
+def test_cache_evicts_by_size(tmp_path: Path):
+    cache = ResultCache(str(tmp_path), max_size=2500)
+
+    for i in range(5):
+        cache.put(f'entry{i}', CachedResult(0, b'x' * 1000, b''))
+        entry_time = time.time() - 100 + i
+        os.utime(tmp_path / f'entry{i}.result', (entry_time, entry_time))
+
+    cache.evict()
+
+    assert sorted(os.listdir(tmp_path)) == ['entry3.result', 'entry4.result']
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = ResultCache(str(tmp_path))
+
+    for i in range(3):
+        cache.put(f'entry{i}', CachedResult(0, b'x' * 1000, b''))
+        entry_time = time.time() - 100 + i
+        os.utime(tmp_path / f'entry{i}.result', (entry_time, entry_time))
+
+    assert cache.get('entry0') is not None
+    ResultCache(str(tmp_path), max_size=2500).evict()
+
+    assert sorted(os.listdir(tmp_path)) == ['entry0.result', 'entry2.result']
+
+
+def test_cache_hit_does_not_extend_age(tmp_path: Path):
+    cache = ResultCache(str(tmp_path), max_age=60)
+    cache.put('entry', CachedResult(0, b'', b''))
+    stored_time = time.time() - 50
+    os.utime(tmp_path / 'entry.result', (stored_time, stored_time))
+
+    assert cache.get('entry') is not None
+    assert os.stat(tmp_path / 'entry.result').st_mtime == pytest.approx(stored_time)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Stub executables are POSIX scripts')
+def test_runner_replays_cached_result(tmp_path: Path):
+    place_python_script(tmp_path / 'qemu' / 'qemu-system-arm', STUB_QEMU)
+
+    with open(tmp_path / 'layer.ini', 'w') as f:
+        f.write("""
+        [general]
+        engine = qemu-system-arm
+        """)
+
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+    (tmp_path / 'kernel.elf').write_bytes(b'kernel1')
+
+    def run(*args: str):
+        cp = execute_runner(tmp_path / 'runner.pyz', ['--result-cache', tmp_path / 'cache', *args], cwd=tmp_path,
+                            check=False)
+        with open(tmp_path / 'qemu.log', 'r') as f:
+            return cp.returncode, cp.stdout, cp.stderr, len(f.readlines())
+
+    kernel_path = tmp_path / 'kernel.elf'
+
+    with with_env({'STUB_LOG': tmp_path / 'qemu.log'}):
+        assert run('kernel.elf', 'a') == (0, f'out -kernel {kernel_path} -append a\n', 'err\n', 1)
+        assert run('kernel.elf', 'a') == (0, f'out -kernel {kernel_path} -append a\n', 'err\n', 1)
+        assert run('kernel.elf', 'b') == (0, f'out -kernel {kernel_path} -append b\n', 'err\n', 2)
+
+        (tmp_path / 'kernel.elf').write_bytes(b'kernel2')
+        assert run('kernel.elf', 'a') == (0, f'out -kernel {kernel_path} -append a\n', 'err\n', 3)
+
+        # Failures are not cached, each run starts QEMU again
+        with with_env({'STUB_EXIT_CODE': '3'}):
+            assert run('kernel.elf', 'c') == (3, f'out -kernel {kernel_path} -append c\n', 'err\n', 4)
+            assert run('kernel.elf', 'c') == (3, f'out -kernel {kernel_path} -append c\n', 'err\n', 5)
@@ -0,0 +1,68 @@
+from typing import List
+
+import pytest
+
+from qemu_runner.make_runner.runner import make_arg_parser, parse_args_fast
+
+FAST_PATH_ARGS = [
+    [],
+    ['abc.elf'],
+    ['abc.elf', 'a', 'b'],
+    ['--dry-run'],
+    ['--dry-run', 'abc.elf'],
+    ['--halted'],
+    ['--halted', 'abc.elf', 'a'],
+    ['--debug', 'abc.elf'],
+    ['--halted', '--debug', '--dry-run', 'dir/abc.elf', 'a', 'b c'],
+    ['--qemu', '/path/to/qemu', 'abc.elf'],
+    ['--qemu=/path/to/qemu', 'abc.elf'],
+    ['--qemu=', 'abc.elf'],
+    ['--qemu-dir', '/path/to/dir', 'abc.elf'],
+    ['--qemu-dir=/path/to/dir', '--qemu', 'q', 'abc.elf'],
+    ['--qemu', 'q1', '--qemu', 'q2', 'abc.elf'],
+    ['--debug', '--debug', 'abc.elf'],
+    ['abc.elf', '--halted', '--debug'],
+    ['abc.elf', '-x', '--help', '--inspect'],
+    ['abc.elf', '--qemu', 'q'],
+    ['--dry-run', 'abc.elf', '--dry-run'],
+]
+
+FALLBACK_ARGS = [
+    ['--help'],
+    ['--inspect'],
+    ['--derive', 'out.pyz', '--layers', 'a.ini'],
+    ['--debug-listen', 'tcp::1234', 'abc.elf'],
+    ['--dry', 'abc.elf'],
+    ['--', 'abc.elf'],
+    ['abc.elf', '--', 'a'],
+    ['--qemu'],
+    ['--qemu', '--halted', 'abc.elf'],
+    ['-x', 'abc.elf'],
+    ['', 'abc.elf'],
+    ['--snapshot-dir', 'dir', 'abc.elf'],
+]
+
+
+@pytest.mark.parametrize('args', FAST_PATH_ARGS)
+def test_fast_path_matches_argparse(args: List[str]):
+    expected = make_arg_parser().parse_args(args)
+    actual = parse_args_fast(args)
+
+    assert actual is not None
+    assert vars(actual) == vars(expected)
+
+
+@pytest.mark.parametrize('args', FALLBACK_ARGS)
+def test_fast_path_falls_back(args: List[str]):
+    assert parse_args_fast(args) is None
+
+
+def test_fast_path_does_not_share_defaults():
+    first = parse_args_fast(['--dry-run'])
+    first.layers.append('a.ini')
+    first.arguments.append('a')
+
+    second = parse_args_fast(['--dry-run'])
+
+    assert second.layers == []
+    assert second.arguments == []
@@ -500,3 +500,22 @@ def test_resolve_kernel_dir_to_absolute_path(tmp_path: Path) -> None:
     file_bin = tmp_path / 'kernel' / 'dir' / 'file.bin'
 
     assert resolved_arg.replace('\\', '/') == f'path,value={file_bin}'.replace('\\', '/')
+
+
+def test_resolve_runner_dir(tmp_path: Path) -> None:
+    with open(tmp_path / 'layer1.ini', 'w') as f:
+        f.write("""
+            [general]
+            engine = my-qemu
+
+            [device]
+            @=path
+            value=${RUNNER_DIR}/disk.img
+            """)
+
+    (tmp_path / 'out').mkdir()
+    run_make_runner('-l', './layer1.ini', '-o', tmp_path / 'out' / 'runner.pyz', cwd=tmp_path)
+
+    cp = execute_runner(tmp_path / 'out' / 'runner.pyz', ['--qemu', 'my-qemu', '--dry-run', 'abc.elf'], cwd=tmp_path)
+
+    assert f'path,value={tmp_path / "out"}/disk.img' in cp.stdout
@@ -0,0 +1,119 @@
+import io
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from qemu_runner.make_runner.make import make_shebang, read_shebang, make_runner, ShebangError
+
+from .test_runner_flow import run_make_runner, execute_runner
+
+TEST_LAYER = """
+[general]
+engine = qemu-system-arm
+
+[machine]
+@ = virt
+"""
+
+
+@pytest.mark.parametrize(('flags', 'expected'), [
+    ([], '/usr/bin/python3'),
+    (['-S'], '/usr/bin/python3 -S'),
+    (['-S', '-E', '-I'], '/usr/bin/python3 -SEI'),
+    (['-SE', '-I'], '/usr/bin/python3 -SEI'),
+])
+def test_make_shebang(flags: List[str], expected: str):
+    assert make_shebang('/usr/bin/python3', flags) == expected
+
+
+@pytest.mark.parametrize('flags', [
+    ['-X', 'importtime'],
+    ['-Ximporttime'],
+    ['-S', '-W', 'error'],
+    ['-SX'],
+    ['--isolated'],
+    ['-'],
+])
+def test_make_shebang_rejects_flags_with_values(flags: List[str]):
+    with pytest.raises(ShebangError):
+        make_shebang('/usr/bin/python3', flags)
+
+
+def test_no_shebang_by_default():
+    output = io.BytesIO()
+    make_runner(output, layer_contents=[TEST_LAYER], additional_script_bases=[], additional_search_paths=[])
+
+    assert output.getvalue().startswith(b'PK')
+
+
+def test_shebang_written_before_archive(tmp_path: Path):
+    with open(tmp_path / 'runner.pyz', 'wb') as f:
+        make_runner(f, layer_contents=[TEST_LAYER], additional_script_bases=[], additional_search_paths=[],
+                    shebang='/usr/bin/python3 -SI')
+
+    assert read_shebang(str(tmp_path / 'runner.pyz')) == '/usr/bin/python3 -SI'
+    if sys.platform != 'win32':
+        assert os.access(tmp_path / 'runner.pyz', os.X_OK)
+
+    cp = execute_runner(tmp_path / 'runner.pyz', ['--dry-run', 'kernel.elf'], cwd=tmp_path)
+    assert cp.stdout.split()[1:] == ['-machine', 'virt', '-kernel', str(tmp_path / 'kernel.elf')]
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Shebang is not used on Windows')
+def test_execute_runner_directly(tmp_path: Path):
+    (tmp_path / 'layer.ini').write_text(TEST_LAYER)
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz',
+                    '--interpreter', sys.executable, '--interpreter-flags=-S -E -I', cwd=tmp_path)
+
+    assert read_shebang(str(tmp_path / 'runner.pyz')) == f'{sys.executable} -SEI'
+
+    cp = subprocess.run(
+        [str(tmp_path / 'runner.pyz'), '--dry-run', 'kernel.elf'],
+        cwd=tmp_path,
+        stdout=subprocess.PIPE,
+        encoding='utf-8',
+        env={**os.environ, 'QEMU_DEV': 'my-qemu'},
+        check=True
+    )
+    assert cp.stdout.split() == ['my-qemu', '-machine', 'virt', '-kernel', str(tmp_path / 'kernel.elf')]
+
+
+def test_derived_runner_keeps_shebang(tmp_path: Path):
+    (tmp_path / 'layer.ini').write_text(TEST_LAYER)
+    (tmp_path / 'derived.ini').write_text('[general]\nmemory = 64M\n')
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'base.pyz',
+                    '--interpreter', '/usr/bin/python3', '--interpreter-flags=-I', cwd=tmp_path)
+
+    execute_runner(tmp_path / 'base.pyz', ['--layers', './derived.ini', '--derive', './derived.pyz'], cwd=tmp_path)
+
+    assert read_shebang(str(tmp_path / 'derived.pyz')) == '/usr/bin/python3 -I'
+
+
+def test_interpreter_flags_require_interpreter(tmp_path: Path):
+    (tmp_path / 'layer.ini').write_text(TEST_LAYER)
+    cp = subprocess.run(
+        [sys.executable, '-m', 'qemu_runner.make_runner', '-l', './layer.ini', '-o', 'runner.pyz',
+         '--interpreter-flags=-I'],
+        cwd=tmp_path,
+        stderr=subprocess.PIPE
+    )
+    assert cp.returncode != 0
+
+
+def test_make_runner_rejects_flags_with_values(tmp_path: Path):
+    (tmp_path / 'layer.ini').write_text(TEST_LAYER)
+
+    cp = subprocess.run(
+        [sys.executable, '-m', 'qemu_runner.make_runner', '-l', './layer.ini', '-o', str(tmp_path / 'runner.pyz'),
+         '--interpreter', '/usr/bin/python3', '--interpreter-flags=-X importtime'],
+        cwd=tmp_path,
+        stderr=subprocess.PIPE,
+        encoding='utf-8'
+    )
+
+    assert cp.returncode == 2
+    assert '-X takes value' in cp.stderr
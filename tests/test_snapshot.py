@@ -0,0 +1,197 @@
+import json
+import os
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from qemu_runner.argument import Argument
+from qemu_runner.layer import Layer, GeneralSettings
+from qemu_runner import snapshot
+from qemu_runner.snapshot import snapshot_key, SNAPSHOT_TAG, _monitor_address
+
+from .test_runner_flow import run_make_runner, execute_runner
+from .test_utllities import place_python_script, with_env
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='Stub executables are POSIX scripts')
+
+STUB_QEMU = '''
+import json, os, socket, sys
+
+args = sys.argv[1:]
+with open(os.environ['STUB_LOG'], 'a') as f:
+    f.write(json.dumps(args) + '\\n')
+
+print('booting', flush=True)
+
+if '-monitor' in args:
+    monitor = args[args.index('-monitor') + 1]
+    kind, address = monitor.split(',')[0].split(':', 1)
+    if kind == 'unix':
+        server = socket.socket(socket.AF_UNIX)
+        server.bind(address)
+    else:
+        server = socket.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('127.0.0.1', int(address.split(':')[1])))
+    server.listen(1)
+    sys.stdout.write(os.environ.get('STUB_MARKER', 'CHECKPOINT\\n'))
+    sys.stdout.flush()
+    conn, _ = server.accept()
+    conn.sendall(b'QEMU monitor\\n(qemu) ')
+    command = conn.recv(1024).decode()
+    with open(os.environ['STUB_LOG'], 'a') as f:
+        f.write(json.dumps(['monitor', command.strip()]) + '\\n')
+    conn.sendall(command.encode() + b'(qemu) ')
+    conn.close()
+
+print('finished', flush=True)
+'''
+
+STUB_QEMU_IMG = '''
+import sys
+
+args = sys.argv[1:]
+image = args[-1] if '-b' in args else args[-2]
+with open(image, 'w') as f:
+    f.write(' '.join(args))
+'''
+
+
+@pytest.fixture()
+def snapshot_runner(tmp_path: Path) -> Path:
+    place_python_script(tmp_path / 'qemu' / 'qemu-system-arm', STUB_QEMU)
+    place_python_script(tmp_path / 'qemu' / 'qemu-img', STUB_QEMU_IMG)
+
+    with open(tmp_path / 'layer.ini', 'w') as f:
+        f.write("""
+        [general]
+        engine = qemu-system-arm
+
+        [machine]
+        @ = virt
+        """)
+
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+    return tmp_path / 'runner.pyz'
+
+
+def read_log(path: Path) -> List[List[str]]:
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_snapshot_key_follows_layer():
+    base = Layer(GeneralSettings(engine='my-engine'), [Argument('machine', 'virt')])
+    changed = Layer(GeneralSettings(engine='my-engine'), [Argument('machine', 'virt2')])
+
+    assert snapshot_key(base) == snapshot_key(Layer(GeneralSettings(engine='my-engine'), [Argument('machine', 'virt')]))
+    assert snapshot_key(base) != snapshot_key(changed)
+
+
+def test_snapshot_key_follows_kernel(tmp_path: Path):
+    kernel = tmp_path / 'kernel.elf'
+    kernel.write_bytes(b'abc')
+    layer = Layer(GeneralSettings(engine='my-engine', kernel=str(kernel)))
+
+    key1 = snapshot_key(layer)
+    kernel.write_bytes(b'abcdef')
+    key2 = snapshot_key(layer)
+
+    assert key1 != key2
+
+
+def test_snapshot_created_then_loaded(tmp_path: Path, snapshot_runner: Path):
+    store = tmp_path / 'snapshots'
+    log = tmp_path / 'qemu.log'
+    (tmp_path / 'kernel.elf').write_bytes(b'kernel')
+
+    with with_env({'STUB_LOG': log}):
+        cp = execute_runner(
+            snapshot_runner,
+            ['--snapshot-dir', store, '--snapshot-marker', 'CHECKPOINT', 'kernel.elf'],
+            cwd=tmp_path
+        )
+        assert cp.stdout.splitlines() == ['booting', 'CHECKPOINT', 'finished']
+
+        images = [p for p in os.listdir(store) if not p.startswith('.')]
+        assert len(images) == 1
+        assert images[0].endswith('.qcow2')
+
+        execute_runner(snapshot_runner, ['--snapshot-dir', store, 'kernel.elf'], cwd=tmp_path)
+
+    create_run, monitor, load_run = read_log(log)
+
+    monitor_option = create_run[create_run.index('-monitor') + 1]
+    assert monitor_option.startswith('unix:')
+    assert monitor_option.endswith(',server=on,wait=off')
+    assert not os.path.exists(monitor_option[len('unix:'):].split(',')[0])
+    assert monitor == ['monitor', f'savevm {SNAPSHOT_TAG}']
+
+    assert '-monitor' not in load_run
+    assert load_run[-2:] == ['-loadvm', SNAPSHOT_TAG]
+    drive = load_run[load_run.index('-drive') + 1]
+    assert drive.startswith('if=none,')
+    assert 'format=qcow2' in drive
+
+    assert os.listdir(store) == images
+
+
+def test_snapshot_missing_without_marker(tmp_path: Path, snapshot_runner: Path):
+    with with_env({'STUB_LOG': tmp_path / 'qemu.log'}):
+        cp = execute_runner(
+            snapshot_runner,
+            ['--snapshot-dir', tmp_path / 'snapshots', 'kernel.elf'],
+            cwd=tmp_path,
+            check=False
+        )
+
+    assert cp.returncode != 0
+    assert 'No snapshot' in cp.stderr
+    assert not (tmp_path / 'qemu.log').exists()
+
+
+def test_snapshot_invalidated_by_layer_change(tmp_path: Path, snapshot_runner: Path):
+    store = tmp_path / 'snapshots'
+
+    with with_env({'STUB_LOG': tmp_path / 'qemu.log'}):
+        execute_runner(
+            snapshot_runner,
+            ['--snapshot-dir', store, '--snapshot-marker', 'CHECKPOINT', 'kernel.elf'],
+            cwd=tmp_path
+        )
+        execute_runner(
+            snapshot_runner,
+            ['--snapshot-dir', store, '--snapshot-marker', 'CHECKPOINT', '--halted', 'kernel.elf'],
+            cwd=tmp_path
+        )
+
+    assert len([p for p in os.listdir(store) if not p.startswith('.')]) == 2
+
+
+def test_snapshot_marker_without_newline(tmp_path: Path, snapshot_runner: Path):
+    store = tmp_path / 'snapshots'
+    log = tmp_path / 'qemu.log'
+
+    with with_env({'STUB_LOG': log, 'STUB_MARKER': 'buildroot login: '}):
+        cp = execute_runner(
+            snapshot_runner,
+            ['--snapshot-dir', store, '--snapshot-marker', 'login: ', 'kernel.elf'],
+            cwd=tmp_path
+        )
+
+    assert cp.stdout == 'booting\nbuildroot login: finished\n'
+    assert read_log(log)[1] == ['monitor', f'savevm {SNAPSHOT_TAG}']
+    assert len([p for p in os.listdir(store) if not p.startswith('.')]) == 1
+
+
+
+def test_monitor_address(tmp_path: Path, monkeypatch):
+    option, address = _monitor_address(str(tmp_path))
+    assert option == f'unix:{tmp_path / "monitor"},server=on,wait=off'
+    assert address == str(tmp_path / 'monitor')
+
+    monkeypatch.setattr(snapshot.sys, 'platform', 'win32')
+    option, address = _monitor_address(str(tmp_path))
+    assert option == f'tcp:127.0.0.1:{address[1]},server=on,wait=off'
@@ -90,3 +90,53 @@ def place_file(path: Path, content: str) -> Path:
         f.write(content)
 
     return path
+
+
+def place_python_script(file_path: Path, source: str) -> str:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    with open(file_path, 'w') as f:
+        f.write(f'#!{sys.executable}\n')
+        f.write(source)
+        os.fchmod(f.fileno(), 0o755)
+
+    return str(file_path)
+
+
+def place_elf(path: Path, machine: int, bits: int = 32, endian: str = 'little',
+              sections: Optional[Dict[str, bytes]] = None, padding: int = 0) -> Path:
+    import struct
+
+    prefix = '<' if endian == 'little' else '>'
+    header_fmt = prefix + ('16sHHIIIIIHHHHHH' if bits == 32 else '16sHHIQQQIHHHHHH')
+    section_fmt = prefix + ('IIIIIIIIII' if bits == 32 else 'IIQQQQIIQQ')
+
+    sections = dict(sections or {})
+    names = b'\0'
+    name_offsets = {}
+    for name in [*sections, '.shstrtab']:
+        name_offsets[name] = len(names)
+        names += name.encode('ascii') + b'\0'
+    sections['.shstrtab'] = names
+
+    body = b'\0' * padding
+    data_offsets = {}
+    offset = struct.calcsize(header_fmt)
+    for name, data in sections.items():
+        data_offsets[name] = offset + len(body)
+        body += data
+
+    section_headers = struct.pack(section_fmt, *([0] * 10))
+    for name, data in sections.items():
+        section_headers += struct.pack(section_fmt, name_offsets[name], 1, 0, 0, data_offsets[name], len(data),
+                                       0, 0, 1, 0)
+
+    ident = b'\x7fELF' + bytes([1 if bits == 32 else 2, 1 if endian == 'little' else 2, 1]) + b'\0' * 9
+    header = struct.pack(header_fmt, ident, 2, machine, 1, 0, 0, offset + len(body), 0, struct.calcsize(header_fmt),
+                         0, 0, struct.calcsize(section_fmt), len(sections) + 1, len(sections))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(header + body + section_headers)
+
+    return path
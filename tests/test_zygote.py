@@ -0,0 +1,229 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from qemu_runner import Runner, RunFlags
+from qemu_runner.layer import Layer, GeneralSettings
+
+from .test_runner_flow import run_make_runner
+from .test_utllities import place_python_script
+
+if sys.platform != 'win32':
+    from qemu_runner.zygote import ZygoteServer, ZygoteError, launch_via_zygote
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='Zygote requires Unix sockets')
+
+PRINT_ARGS = 'import os, sys; print(os.getcwd(), os.environ.get("ZYGOTE_TEST"), *sys.argv[1:]); sys.exit(5)'
+
+STUB_QEMU = '''
+import os, sys
+print(os.getppid(), *sys.argv[1:])
+sys.exit(int(os.environ.get('STUB_EXIT_CODE', '0')))
+'''
+
+
+def python_flags(script: str) -> RunFlags:
+    return RunFlags(qemu=sys.executable, qemu_args=['-c', script])
+
+
+@pytest.fixture()
+def zygote(tmp_path: Path) -> Iterator[str]:
+    socket_path = str(tmp_path / 'zygote.sock')
+    runner = Runner(Layer(GeneralSettings(engine='my-engine', memory='128M')))
+
+    with ZygoteServer(socket_path, runner) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            yield socket_path
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+def test_launch(tmp_path: Path, zygote: str):
+    with open(tmp_path / 'out.txt', 'w') as out:
+        returncode = launch_via_zygote(zygote, None, (), python_flags(PRINT_ARGS), cwd=str(tmp_path),
+                                       env={**os.environ, 'ZYGOTE_TEST': 'env-value'}, stdout=out)
+
+    assert returncode == 5
+    assert (tmp_path / 'out.txt').read_text().split() == [str(tmp_path), 'env-value', '-m', '128M']
+
+
+def test_launch_with_kernel_and_arguments(tmp_path: Path, zygote: str):
+    read_fd, write_fd = os.pipe()
+    with open(read_fd, 'r') as reader, open(write_fd, 'w') as writer:
+        launch_via_zygote(zygote, 'kernel.elf', ['a', 'b'], python_flags(PRINT_ARGS), stdout=writer)
+        writer.close()
+        output = reader.read().split()
+
+    assert output[2:] == ['-m', '128M', '-kernel', os.path.abspath('kernel.elf'), '-append', 'a', 'b']
+
+
+def test_concurrent_launches(tmp_path: Path, zygote: str):
+    results = []
+    script = 'import time, sys; time.sleep(0.2); sys.exit(3)'
+
+    def launch():
+        results.append(launch_via_zygote(zygote, None, (), python_flags(script)))
+
+    threads = [threading.Thread(target=launch) for _ in range(4)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [3] * 4
+    assert time.monotonic() - start < 0.2 * 4
+
+
+def test_missing_qemu_reported(tmp_path: Path, zygote: str):
+    with pytest.raises(ZygoteError):
+        launch_via_zygote(zygote, None, (), RunFlags(qemu=str(tmp_path / 'no-such-qemu')))
+
+
+def test_runner_launches_through_zygote(tmp_path: Path):
+    place_python_script(tmp_path / 'qemu' / 'qemu-system-arm', STUB_QEMU)
+    (tmp_path / 'layer.ini').write_text('[general]\nengine = qemu-system-arm\n')
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    socket_path = tmp_path / 'zygote.sock'
+    zygote_process = subprocess.Popen([sys.executable, str(tmp_path / 'runner.pyz'), '--zygote', str(socket_path)],
+                                      cwd=tmp_path)
+    try:
+        deadline = time.monotonic() + 10
+        while not socket_path.exists():
+            assert time.monotonic() < deadline
+            assert zygote_process.poll() is None
+            time.sleep(0.05)
+
+        cp = subprocess.run(
+            [sys.executable, str(tmp_path / 'runner.pyz'), 'kernel.elf', 'a'],
+            cwd=tmp_path,
+            stdout=subprocess.PIPE,
+            encoding='utf-8',
+            env={**os.environ, 'QEMU_RUNNER_ZYGOTE': str(socket_path), 'STUB_EXIT_CODE': '7'}
+        )
+    finally:
+        zygote_process.terminate()
+        zygote_process.wait(10)
+
+    assert cp.returncode == 7
+    assert cp.stdout.split() == [str(zygote_process.pid), '-kernel', str(tmp_path / 'kernel.elf'), '-append', 'a']
+    assert not socket_path.exists()
+
+
+def test_launch_profile(tmp_path: Path):
+    socket_path = str(tmp_path / 'zygote.sock')
+    runner = Runner(Layer(GeneralSettings(engine='my-engine', memory='128M')))
+    profiles = {'big': Runner(Layer(GeneralSettings(engine='my-engine', memory='1G')))}
+
+    with ZygoteServer(socket_path, runner, profiles=profiles) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with open(tmp_path / 'out.txt', 'w') as out:
+                launch_via_zygote(socket_path, None, (), python_flags(PRINT_ARGS), stdout=out, profile='big')
+
+            with pytest.raises(ZygoteError, match='Unknown profile small'):
+                launch_via_zygote(socket_path, None, (), python_flags(PRINT_ARGS), profile='small')
+        finally:
+            server.shutdown()
+            thread.join()
+
+    assert (tmp_path / 'out.txt').read_text().split()[-2:] == ['-m', '1G']
+
+
+def test_runner_without_zygote_runs_directly(tmp_path: Path):
+    place_python_script(tmp_path / 'qemu' / 'qemu-system-arm', STUB_QEMU)
+    (tmp_path / 'layer.ini').write_text('[general]\nengine = qemu-system-arm\n')
+    run_make_runner('-l', './layer.ini', '-o', tmp_path / 'runner.pyz', cwd=tmp_path)
+
+    cp = subprocess.run(
+        [sys.executable, str(tmp_path / 'runner.pyz'), 'kernel.elf'],
+        cwd=tmp_path,
+        stdout=subprocess.PIPE,
+        encoding='utf-8',
+        env={**os.environ, 'QEMU_RUNNER_ZYGOTE': str(tmp_path / 'not-running.sock')}
+    )
+
+    assert cp.returncode == 0
+    assert cp.stdout.split()[1:] == ['-kernel', str(tmp_path / 'kernel.elf')]
+
+
+SIGNAL_TO_EXIT_CODE = '''
+import os, signal, sys, time
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(42))
+with open(sys.argv[1], 'w') as f:
+    f.write(str(os.getpid()))
+time.sleep(60)
+'''
+
+CLIENT = '''
+import sys
+from qemu_runner import RunFlags
+from qemu_runner.zygote import launch_via_zygote
+flags = RunFlags(qemu=sys.executable, qemu_args=['-c', sys.argv[2], sys.argv[3]])
+print(launch_via_zygote(sys.argv[1], None, (), flags), flush=True)
+'''
+
+
+def start_client(zygote: str, ready_file: Path) -> subprocess.Popen:
+    client = subprocess.Popen([sys.executable, '-c', CLIENT, zygote, SIGNAL_TO_EXIT_CODE, str(ready_file)],
+                              stdout=subprocess.PIPE, encoding='utf-8')
+
+    deadline = time.monotonic() + 10
+    while not ready_file.exists() or not ready_file.read_text():
+        assert time.monotonic() < deadline
+        assert client.poll() is None
+        time.sleep(0.05)
+
+    return client
+
+
+def test_socket_accessible_by_owner_only(zygote: str):
+    assert os.stat(zygote).st_mode & 0o777 == 0o600
+
+
+@pytest.mark.skipif(not hasattr(socket, 'SO_PEERCRED'), reason='Peer credentials are not available')
+def test_other_user_rejected(tmp_path: Path, zygote: str, monkeypatch):
+    uid = os.getuid()
+    monkeypatch.setattr(os, 'getuid', lambda: uid + 1)
+
+    with pytest.raises(ZygoteError):
+        launch_via_zygote(zygote, None, (), python_flags(PRINT_ARGS))
+
+
+def test_signal_forwarded(tmp_path: Path, zygote: str):
+    client = start_client(zygote, tmp_path / 'ready')
+
+    client.send_signal(signal.SIGTERM)
+    stdout, _ = client.communicate(timeout=10)
+
+    assert stdout.strip() == '42'
+
+
+def test_qemu_stopped_when_client_dies(tmp_path: Path, zygote: str):
+    client = start_client(zygote, tmp_path / 'ready')
+    qemu_pid = int((tmp_path / 'ready').read_text())
+
+    client.kill()
+    client.wait(10)
+
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            os.kill(qemu_pid, 0)
+        except ProcessLookupError:
+            break
+        assert time.monotonic() < deadline
+        time.sleep(0.05)